@@ -0,0 +1,230 @@
+"""
+Comandos de mantenimiento de la aplicación.
+
+Uso (desde Backend_Vialy):
+    python -m app.cli <comando> [opciones]
+"""
+
+import logging
+import os
+import click
+from sqlalchemy import case, func, select
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.config.database import SessionLocal, init_db  # noqa: E402
+from app.config.settings import Config  # noqa: E402
+from app.core.fine_store import replace_fines  # noqa: E402
+from app.core.message_archive import archive_messages, restore_messages  # noqa: E402
+from app.core.message_search import message_search  # noqa: E402
+from app.core.page_store import page_store  # noqa: E402
+from app.models.models import Conversation, Message, MessageArchive  # noqa: E402
+from app.rag.fine_extractor import extract_fines, read_pdf_pages  # noqa: E402
+from app.services.password_service import measure_cost, suggest_rounds  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+
+def backfill_conversation_summaries(db, batch_size: int = 500) -> int:
+    """
+    Recalcula message_count, last_message_at y last_message_preview de todas
+    las conversaciones a partir de la tabla de mensajes y de los bloques
+    archivados, por lotes de IDs.
+
+    Los bloques guardan conteo y fecha del último mensaje, pero no su texto:
+    si una conversación solo tiene mensajes archivados se conserva la vista
+    previa actual.
+
+    Returns:
+        int: Número de conversaciones actualizadas
+    """
+    hot_count = (
+        select(func.count(Message.id))
+        .where(Message.conversacion_id == Conversation.id)
+        .scalar_subquery()
+    )
+    archived_count = (
+        select(func.coalesce(func.sum(MessageArchive.message_count), 0))
+        .where(MessageArchive.conversacion_id == Conversation.id)
+        .scalar_subquery()
+    )
+    hot_last_at = (
+        select(func.max(Message.created_at))
+        .where(Message.conversacion_id == Conversation.id)
+        .scalar_subquery()
+    )
+    archived_last_at = (
+        select(func.max(MessageArchive.last_created_at))
+        .where(MessageArchive.conversacion_id == Conversation.id)
+        .scalar_subquery()
+    )
+    preview_q = (
+        select(func.substr(Message.message, 1, 100))
+        .where(Message.conversacion_id == Conversation.id)
+        .order_by(Message.created_at.desc(), Message.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    # GREATEST no existe en SQLite y devuelve NULL con un argumento NULL en MySQL
+    last_at_q = case(
+        (hot_last_at.is_(None), archived_last_at),
+        (archived_last_at.is_(None), hot_last_at),
+        (hot_last_at >= archived_last_at, hot_last_at),
+        else_=archived_last_at
+    )
+    preview_or_current = case(
+        (hot_last_at.is_not(None), preview_q),
+        (archived_last_at.is_not(None), Conversation.last_message_preview),
+        else_=None
+    )
+
+    updated = 0
+    last_id = 0
+    while True:
+        ids = [row[0] for row in db.query(Conversation.id)
+               .filter(Conversation.id > last_id)
+               .order_by(Conversation.id)
+               .limit(batch_size)]
+        if not ids:
+            break
+        db.query(Conversation).filter(Conversation.id.in_(ids)).update(
+            {
+                Conversation.message_count: hot_count + archived_count,
+                Conversation.last_message_at: last_at_q,
+                Conversation.last_message_preview: preview_or_current
+            },
+            synchronize_session=False
+        )
+        db.commit()
+        updated += len(ids)
+        last_id = ids[-1]
+    return updated
+
+
+@click.group()
+def cli():
+    """Comandos de mantenimiento de Vialy."""
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s in %(module)s: %(message)s')
+    # Aplica migraciones pendientes antes de cualquier comando
+    init_db()
+
+
+@cli.command('backfill-conversation-summaries')
+@click.option('--batch-size', default=500, show_default=True, help='Conversaciones por transacción')
+def backfill_conversation_summaries_command(batch_size):
+    """Recalcula el resumen desnormalizado de todas las conversaciones."""
+    db = SessionLocal()
+    try:
+        updated = backfill_conversation_summaries(db, batch_size=batch_size)
+        click.echo(f"✅ {updated} conversaciones actualizadas")
+    finally:
+        SessionLocal.remove()
+
+
+@cli.command('archive-messages')
+@click.option('--older-than-days', default=Config.ARCHIVE_AFTER_DAYS, show_default=True,
+              help='Días desde el fin de la conversación')
+@click.option('--batch-size', default=100, show_default=True, help='Conversaciones por transacción')
+def archive_messages_command(older_than_days, batch_size):
+    """Mueve al archivo comprimido los mensajes de conversaciones finalizadas antiguas."""
+    db = SessionLocal()
+    try:
+        stats = archive_messages(db, older_than_days=older_than_days, batch_size=batch_size)
+        ratio = stats['raw_bytes'] / stats['compressed_bytes'] if stats['compressed_bytes'] else 0
+        click.echo(f"✅ {stats['messages']} mensajes de {stats['conversations']} conversaciones archivados "
+                   f"en {stats['blocks']} bloques ({stats['raw_bytes']} → {stats['compressed_bytes']} bytes, "
+                   f"{ratio:.1f}x)")
+    finally:
+        SessionLocal.remove()
+
+
+@cli.command('restore-messages')
+@click.option('--conversation-id', 'conversation_ids', type=int, multiple=True, help='Conversación a restaurar')
+@click.option('--periodo', help="Mes a restaurar ('YYYY-MM')")
+@click.option('--all', 'restore_all', is_flag=True, help='Restaurar todo el archivo')
+@click.option('--batch-size', default=100, show_default=True, help='Bloques por transacción')
+def restore_messages_command(conversation_ids, periodo, restore_all, batch_size):
+    """Devuelve mensajes archivados a la tabla de mensajes."""
+    if not (conversation_ids or periodo or restore_all):
+        raise click.UsageError("Indica --conversation-id, --periodo o --all")
+    db = SessionLocal()
+    try:
+        stats = restore_messages(db, conversation_ids=list(conversation_ids), periodo=periodo,
+                                 batch_size=batch_size)
+        click.echo(f"✅ {stats['messages']} mensajes restaurados de {stats['blocks']} bloques")
+    finally:
+        SessionLocal.remove()
+
+
+@cli.command('reindex-messages')
+@click.option('--batch-size', default=500, show_default=True, help='Mensajes por transacción')
+def reindex_messages_command(batch_size):
+    """Reconstruye el índice de búsqueda de mensajes."""
+    if not message_search.enabled:
+        raise click.ClickException("La búsqueda de mensajes no está disponible con esta base de datos")
+    db = SessionLocal()
+    try:
+        indexed = message_search.rebuild(db, batch_size=batch_size)
+        click.echo(f"✅ {indexed} mensajes indexados")
+    finally:
+        SessionLocal.remove()
+
+
+@cli.command('ingest-fines')
+@click.option('--pdf', 'pdf_path', default=os.path.join('app', 'rag', 'data', 'codigo_transito.pdf'),
+              show_default=True, type=click.Path(exists=True, dir_okay=False), help='PDF del Código de Tránsito')
+@click.option('--dry-run', is_flag=True, help='Muestra lo extraído sin escribir en la BD')
+def ingest_fines_command(pdf_path, dry_run):
+    """Extrae del PDF las multas de los artículos 131 y 152 a la tabla de infracciones."""
+    fines = extract_fines(read_pdf_pages(pdf_path))
+    if not fines:
+        raise click.ClickException("No se encontraron las tablas de multas en el PDF")
+    if dry_run:
+        for fine in fines:
+            smldv = fine['smldv'] if fine['smldv'] is not None else '-'
+            click.echo(f"  {fine['codigo']:<9} {smldv:>5} SMLDV  p.{fine['pagina']}  {fine['descripcion'][:80]}")
+        click.echo(f"✅ {len(fines)} infracciones extraídas (sin guardar)")
+        return
+    db = SessionLocal()
+    try:
+        saved = replace_fines(db, fines, fuente=os.path.basename(pdf_path))
+        click.echo(f"✅ {saved} infracciones guardadas")
+        # Cada proceso guarda la tabla en memoria: solo la relee sola si la encontró vacía
+        click.echo("⚠️ Reinicia los servidores en ejecución para que usen la tabla nueva "
+                   f"(si estaba vacía, la cargan solos en menos de {Config.FINE_TABLE_EMPTY_RETRY_SECONDS:.0f} s)")
+    finally:
+        SessionLocal.remove()
+
+
+@cli.command('index-pages')
+@click.option('--pdf', 'pdf_path', default=os.path.join('app', 'rag', 'data', 'codigo_transito.pdf'),
+              show_default=True, type=click.Path(exists=True, dir_okay=False), help='PDF a extraer')
+@click.option('--images', is_flag=True, help='Renderiza también la imagen de cada página (requiere PyMuPDF)')
+def index_pages_command(pdf_path, images):
+    """Extrae el texto por página de un PDF al almacén de páginas (/pdf/<archivo>/page/<n>)."""
+    if images and not page_store.images_available():
+        raise click.ClickException("PyMuPDF no está instalado (pip install pymupdf)")
+    pages = read_pdf_pages(pdf_path)
+    page_store.save(pdf_path, pages)
+    click.echo(f"✅ {len(pages)} páginas guardadas en {page_store.path}")
+    if images:
+        with click.progressbar(range(1, len(pages) + 1), label='Renderizando páginas') as numbers:
+            for number in numbers:
+                page_store.image(pdf_path, number)
+        click.echo(f"✅ {len(pages)} imágenes de página")
+
+
+@cli.command('bcrypt-cost')
+@click.option('--target-ms', default=250, show_default=True, help='Tiempo máximo por hash')
+def bcrypt_cost_command(target_ms):
+    """Mide bcrypt en esta máquina y sugiere BCRYPT_ROUNDS."""
+    for rounds in range(10, 15):
+        click.echo(f"  costo {rounds}: {measure_cost(rounds):.0f} ms")
+    click.echo(f"✅ BCRYPT_ROUNDS sugerido para {target_ms} ms: {suggest_rounds(target_ms)} "
+               f"(actual: {Config.BCRYPT_ROUNDS})")
+
+
+if __name__ == '__main__':
+    cli()
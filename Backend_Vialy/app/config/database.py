@@ -4,8 +4,16 @@ Maneja las conexiones, inicialización de tablas y transacciones.
 """
 
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, scoped_session
+import threading
+import time
+import traceback
+from collections import OrderedDict, defaultdict
+from functools import wraps
+from typing import Optional
+from flask import g, has_app_context, request
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session, sessionmaker, scoped_session
 from sqlalchemy.pool import QueuePool, StaticPool
 import logging
 
@@ -15,26 +23,335 @@ logger = logging.getLogger(__name__)
 DATABASE_URL = os.getenv(
     'DATABASE_URL'
 )
+# Réplica de lectura opcional para los endpoints de solo lectura
+DATABASE_READ_URL = os.getenv('DATABASE_READ_URL')
+# Segundos tras una escritura en que las lecturas del mismo usuario van a la primaria
+READ_STICKINESS_SECONDS = float(os.getenv('READ_STICKINESS_SECONDS', '5'))
+# Segundos sin usar la réplica después de un fallo
+READ_REPLICA_COOLDOWN_SECONDS = float(os.getenv('READ_REPLICA_COOLDOWN_SECONDS', '30'))
+# Segundos que una conexión puede estar tomada antes de registrar su stack (0 = desactivado)
+DB_LEAK_DETECTION_SECONDS = float(os.getenv('DB_LEAK_DETECTION_SECONDS', '0'))
 
+# Estadísticas de BD por hilo (consultas, commits, tiempo y endpoint del request)
+_db_stats = threading.local()
 
-engine = create_engine(
-    DATABASE_URL,
-    poolclass=QueuePool,
-    pool_size=10,
-    max_overflow=20,
-    pool_pre_ping=True,  # Verificar conexiones antes de usar (útil para conexiones largas)
-    pool_recycle=3600,   # Reciclar conexiones cada hora para evitar timeouts
-    echo=False
-)
+
+def _current_endpoint() -> str:
+    return getattr(_db_stats, 'endpoint', None) or 'background'
+
+
+class PoolMonitor:
+    """
+    Métricas del pool de conexiones: espera en cada checkout, conexiones por
+    endpoint y, opcionalmente, detección de conexiones retenidas demasiado tiempo.
+    """
+
+    def __init__(self, leak_threshold_seconds: float = 0):
+        self.leak_threshold = leak_threshold_seconds
+        self._lock = threading.Lock()
+        self._waits = 0
+        self._wait_seconds = 0.0
+        self._max_wait = 0.0
+        self._timeouts = 0
+        self._endpoints = defaultdict(lambda: {"checkouts": 0, "checked_out": 0, "wait_seconds": 0.0})
+        # id del registro de conexión -> [endpoint, inicio, stack, ya reportada]
+        self._held = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        """Registra el tiempo que un hilo esperó por una conexión del pool"""
+        endpoint = _current_endpoint()
+        with self._lock:
+            self._waits += 1
+            self._wait_seconds += seconds
+            self._max_wait = max(self._max_wait, seconds)
+            self._endpoints[endpoint]["wait_seconds"] += seconds
+            if timed_out:
+                self._timeouts += 1
+
+    def on_checkout(self, connection_record):
+        endpoint = _current_endpoint()
+        # El stack solo se captura con el detector activo (tiene costo)
+        stack = "".join(traceback.format_stack(limit=30)) if self.leak_threshold > 0 else None
+        with self._lock:
+            stats = self._endpoints[endpoint]
+            stats["checkouts"] += 1
+            stats["checked_out"] += 1
+            self._held[id(connection_record)] = [endpoint, time.monotonic(), stack, False]
+
+    def on_checkin(self, connection_record):
+        with self._lock:
+            held = self._held.pop(id(connection_record), None)
+            if held is not None:
+                self._endpoints[held[0]]["checked_out"] -= 1
+
+    def stats(self, pool) -> dict:
+        """Estado del pool y métricas acumuladas"""
+        with self._lock:
+            endpoints = {
+                name: {
+                    "checkouts": data["checkouts"],
+                    "checked_out": data["checked_out"],
+                    "wait_ms": round(data["wait_seconds"] * 1000, 2)
+                }
+                for name, data in self._endpoints.items()
+            }
+            waits, wait_seconds, max_wait, timeouts = self._waits, self._wait_seconds, self._max_wait, self._timeouts
+        return {
+            "pool_size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "checkout_wait": {
+                "count": waits,
+                "avg_ms": round(wait_seconds / waits * 1000, 3) if waits else 0.0,
+                "max_ms": round(max_wait * 1000, 3),
+                "timeouts": timeouts
+            },
+            "endpoints": endpoints
+        }
+
+    def start(self):
+        """Inicia el detector de fugas (solo si DB_LEAK_DETECTION_SECONDS > 0)"""
+        if self.leak_threshold <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="db-leak-detector", daemon=True)
+        self._thread.start()
+        logger.info(f"✅ Detector de conexiones retenidas activo (umbral={self.leak_threshold} s)")
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def check_leaks(self):
+        """Registra una sola vez el stack de cada conexión retenida más del umbral"""
+        now = time.monotonic()
+        leaked = []
+        with self._lock:
+            for held in self._held.values():
+                if not held[3] and now - held[1] > self.leak_threshold:
+                    held[3] = True
+                    leaked.append((held[0], now - held[1], held[2]))
+        for endpoint, seconds, stack in leaked:
+            logger.warning(f"⚠️ Conexión de BD retenida {seconds:.1f} s (endpoint={endpoint}), "
+                           f"obtenida en:\n{stack}")
+
+    def _run(self):
+        while not self._stop.wait(max(self.leak_threshold / 2, 0.5)):
+            self.check_leaks()
+
+
+pool_monitor = PoolMonitor(leak_threshold_seconds=DB_LEAK_DETECTION_SECONDS)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool que mide cuánto espera cada checkout por una conexión libre"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_monitor.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        pool_monitor.record_wait(time.perf_counter() - start)
+        return connection
+
+
+def _create_engine(url: str):
+    return create_engine(
+        url,
+        poolclass=InstrumentedQueuePool,
+        pool_size=10,
+        max_overflow=20,
+        pool_pre_ping=True,  # Verificar conexiones antes de usar (útil para conexiones largas)
+        pool_recycle=3600,   # Reciclar conexiones cada hora para evitar timeouts
+        echo=False
+    )
+
+
+engine = _create_engine(DATABASE_URL)
+read_engine = _create_engine(DATABASE_READ_URL) if DATABASE_READ_URL else None
 
 # Crear sesión factory
 SessionLocal = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
+# Sesiones de la réplica: una por request, guardada en g (no por hilo)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine) if read_engine else None
+
+
+class ReadRouter:
+    """
+    Decide si un request de solo lectura usa la réplica.
+
+    Tras una escritura de un usuario, sus lecturas van a la primaria durante
+    `stickiness_seconds` (read-your-writes mientras la réplica se pone al día).
+    Si la réplica falla, se deja de usar durante `cooldown_seconds`.
+    """
+
+    def __init__(self, stickiness_seconds: float = 5, cooldown_seconds: float = 30, max_users: int = 10000):
+        self.stickiness = stickiness_seconds
+        self.cooldown = cooldown_seconds
+        self.max_users = max_users
+        self._recent_writes: "OrderedDict[int, float]" = OrderedDict()
+        self._down_until = 0.0
+        self._lock = threading.Lock()
+
+    def mark_write(self, user_id: int):
+        """Registra que el usuario acaba de escribir en la primaria"""
+        with self._lock:
+            self._recent_writes[user_id] = time.monotonic()
+            self._recent_writes.move_to_end(user_id)
+            while len(self._recent_writes) > self.max_users:
+                self._recent_writes.popitem(last=False)
+
+    def is_sticky(self, user_id: Optional[int]) -> bool:
+        if user_id is None:
+            return False
+        with self._lock:
+            written_at = self._recent_writes.get(user_id)
+        return written_at is not None and time.monotonic() - written_at < self.stickiness
+
+    def mark_replica_down(self):
+        with self._lock:
+            already_down = time.monotonic() < self._down_until
+            self._down_until = time.monotonic() + self.cooldown
+        if not already_down:
+            logger.warning(f"⚠️ Réplica de lectura no disponible, usando la primaria por {self.cooldown:.0f} s")
+
+    def replica_available(self) -> bool:
+        return read_engine is not None and time.monotonic() >= self._down_until
+
+    def use_replica(self, user_id: Optional[int]) -> bool:
+        return self.replica_available() and not self.is_sticky(user_id)
+
+
+read_router = ReadRouter(
+    stickiness_seconds=READ_STICKINESS_SECONDS,
+    cooldown_seconds=READ_REPLICA_COOLDOWN_SECONDS
+)
+
+
+def reset_db_stats(endpoint: Optional[str] = None):
+    """
+    Reinicia los contadores de BD del hilo actual (llamar al inicio del request)
+
+    Args:
+        endpoint: Endpoint al que se atribuyen las conexiones del pool
+    """
+    _db_stats.queries = 0
+    _db_stats.commits = 0
+    _db_stats.seconds = 0.0
+    _db_stats.endpoint = endpoint
+
+
+def get_db_stats() -> dict:
+    """Obtiene los contadores de BD acumulados en el hilo actual"""
+    return {
+        "queries": getattr(_db_stats, 'queries', 0),
+        "commits": getattr(_db_stats, 'commits', 0),
+        "time_ms": round(getattr(_db_stats, 'seconds', 0.0) * 1000, 2)
+    }
+
+
+def get_pool_stats() -> dict:
+    """Métricas del pool de conexiones del engine (y de la réplica si existe)"""
+    stats = pool_monitor.stats(engine.pool)
+    if read_engine is not None:
+        pool = read_engine.pool
+        stats["replica"] = {
+            "pool_size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "available": read_router.replica_available()
+        }
+    return stats
+
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    pool_monitor.on_checkout(connection_record)
+
+
+def _on_checkin(dbapi_connection, connection_record):
+    pool_monitor.on_checkin(connection_record)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    _db_stats.queries = getattr(_db_stats, 'queries', 0) + 1
+    _db_stats.seconds = getattr(_db_stats, 'seconds', 0.0) + elapsed
+
+
+for _engine in (engine, read_engine):
+    if _engine is None:
+        continue
+    event.listen(_engine, 'checkout', _on_checkout)
+    event.listen(_engine, 'checkin', _on_checkin)
+    event.listen(_engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(_engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+if read_engine is not None:
+    @event.listens_for(read_engine, 'handle_error')
+    def _on_replica_error(context):
+        # Errores de conexión u operativos de la réplica (no de la consulta en sí)
+        if context.is_disconnect or isinstance(context.sqlalchemy_exception, OperationalError):
+            read_router.mark_replica_down()
+            _db_stats.replica_failed = True
+
+
+@event.listens_for(Session, 'after_flush')
+def _after_flush(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _on_orm_execute(orm_execute_state):
+    # INSERT/UPDATE/DELETE en bloque no pasan por flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['wrote'] = True
+
+
+@event.listens_for(Session, 'before_commit')
+def _before_commit(session):
+    session.info['commit_start'] = (time.perf_counter(), getattr(_db_stats, 'seconds', 0.0))
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    started = session.info.pop('commit_start', None)
+    if started is None:
+        return
+    start, seconds_before = started
+    # El tiempo de pared del commit ya incluye las sentencias del flush
+    _db_stats.commits = getattr(_db_stats, 'commits', 0) + 1
+    _db_stats.seconds = seconds_before + (time.perf_counter() - start)
+
+
+@event.listens_for(Session, 'after_commit')
+def _mark_user_write(session):
+    # Read-your-writes: las lecturas siguientes de este usuario van a la primaria
+    if session.info.pop('wrote', False) and has_app_context():
+        user_id = g.get('db_user_id')
+        if user_id is not None:
+            read_router.mark_write(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop('wrote', None)
 
 
 def get_db():
     """
     Generador de dependencia para obtener sesión de base de datos.
-    Uso en Flask: inyectar en rutas que lo necesiten.
+    Fuera de un request (scripts, hilos); en las rutas usar get_request_db.
     """
     db = SessionLocal()
     try:
@@ -43,6 +360,106 @@ def get_db():
         db.close()
 
 
+def bind_request_user(user_id: Optional[int]):
+    """
+    Asocia el usuario autenticado al request: sus commits activan la
+    lectura desde la primaria (read-your-writes) y sus lecturas la respetan.
+    Llamar antes de get_request_db.
+    """
+    g.db_user_id = user_id
+
+
+def get_request_db() -> Session:
+    """
+    Sesión de BD del request actual. Se crea en el primer uso y se cierra en
+    el teardown (close_request_db); la conexión solo se toma del pool cuando
+    la sesión ejecuta su primera consulta.
+
+    En los endpoints marcados con @read_only devuelve una sesión de la réplica
+    si está configurada, disponible y el usuario no escribió recientemente.
+    """
+    if g.get('db_read_only') and read_router.use_replica(g.get('db_user_id')):
+        if 'db_read_session' not in g:
+            g.db_read_session = ReadSessionLocal()
+        return g.db_read_session
+    if 'db_session' not in g:
+        g.db_session = SessionLocal()
+    return g.db_session
+
+
+def read_only(view):
+    """
+    Marca un endpoint como de solo lectura para enrutarlo a la réplica.
+    Si la réplica falla durante el request, el endpoint se repite una vez
+    contra la primaria.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = True
+        _db_stats.replica_failed = False
+        try:
+            response = view(*args, **kwargs)
+        except Exception:
+            if not _fallback_to_primary():
+                raise
+            return view(*args, **kwargs)
+        if _fallback_to_primary():
+            return view(*args, **kwargs)
+        return response
+    return wrapper
+
+
+def _fallback_to_primary() -> bool:
+    """Descarta la sesión de la réplica si falló en este request"""
+    if not getattr(_db_stats, 'replica_failed', False):
+        return False
+    _db_stats.replica_failed = False
+    g.db_read_only = False
+    db = g.pop('db_read_session', None)
+    if db is not None:
+        db.close()
+    logger.info("Reintentando lectura en la primaria")
+    return True
+
+
+def detach_request_db() -> Optional[Session]:
+    """
+    Transfiere la sesión del request al llamador, que pasa a ser responsable
+    de cerrarla. Necesario en respuestas en streaming: el generador consulta la
+    BD después del teardown del request.
+    """
+    db = g.pop('db_read_session', None)
+    if db is not None:
+        return db
+    db = g.pop('db_session', None)
+    if db is not None and SessionLocal.registry.has() and SessionLocal.registry() is db:
+        # Evita que SessionLocal.remove() del teardown cierre la sesión transferida
+        SessionLocal.registry.clear()
+    return db
+
+
+def close_request_db(error=None):
+    """Cierra la sesión del request y devuelve su conexión al pool"""
+    for key in ('db_read_session', 'db_session'):
+        db = g.pop(key, None)
+        if db is not None:
+            if error is not None:
+                db.rollback()
+            db.close()
+    SessionLocal.remove()
+    _db_stats.endpoint = None
+
+
+def init_request_db(app):
+    """Registra el ciclo de vida de la sesión por request para todos los blueprints"""
+
+    @app.before_request
+    def _start_request_db():
+        reset_db_stats(request.endpoint)
+
+    app.teardown_appcontext(close_request_db)
+
+
 def init_db():
     """
     Inicializa la base de datos creando todas las tablas.
@@ -51,7 +468,11 @@ def init_db():
     from app.models.models import Base  # Ajusta la importación según tu estructura
     
     try:
+        from app.config.migrations import run_migrations
+        from app.core.message_search import message_search
         Base.metadata.create_all(bind=engine)
+        run_migrations(engine, Base.metadata)
+        message_search.ensure_index(engine)
         logger.info("✅ Base de datos inicializada correctamente")
     except Exception as e:
         logger.error(f"❌ Error al inicializar base de datos: {str(e)}")
@@ -0,0 +1,54 @@
+"""
+Migraciones ligeras del esquema.
+`create_all` solo crea tablas nuevas; aquí se agregan columnas e índices
+a tablas que ya existen en bases de datos creadas con versiones anteriores.
+"""
+
+import logging
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+
+def _add_missing_columns(conn, table, existing_columns):
+    """Agrega con ALTER TABLE las columnas del modelo que faltan en la tabla"""
+    dialect = conn.dialect
+    for column in table.columns:
+        if column.name in existing_columns:
+            continue
+        ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=dialect)}"
+        if column.server_default is not None:
+            default = column.server_default.arg
+            if isinstance(default, str) and not default.lstrip('-').isdigit():
+                default = f"'{default}'"
+            ddl += f" DEFAULT {default}"
+        if not column.nullable and column.server_default is not None:
+            ddl += " NOT NULL"
+        conn.execute(text(ddl))
+        logger.info(f"[MIGRACIÓN] Columna agregada: {table.name}.{column.name}")
+
+
+def _add_missing_indexes(conn, table, existing_indexes):
+    """Crea los índices declarados en el modelo que no existen en la BD"""
+    for index in table.indexes:
+        if index.name in existing_indexes:
+            continue
+        index.create(bind=conn)
+        logger.info(f"[MIGRACIÓN] Índice creado: {index.name}")
+
+
+def run_migrations(engine: Engine, metadata):
+    """
+    Sincroniza columnas e índices de las tablas existentes con los modelos.
+    Es idempotente: se ejecuta en cada arranque después de `create_all`.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing_columns = {c['name'] for c in inspector.get_columns(table.name)}
+            existing_indexes = {i['name'] for i in inspector.get_indexes(table.name)}
+            _add_missing_columns(conn, table, existing_columns)
+            _add_missing_indexes(conn, table, existing_indexes)
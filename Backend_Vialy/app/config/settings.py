@@ -31,16 +31,95 @@ class Config:
     TOP_K_DOCUMENTS = int(os.getenv('TOP_K_DOCUMENTS', '3'))
     CHUNK_SIZE = int(os.getenv('CHUNK_SIZE', '1000'))
     CHUNK_OVERLAP = int(os.getenv('CHUNK_OVERLAP', '200'))
-    
+
+    # Catálogo de PDFs de DOCUMENTS_PATH: segundos entre barridos del directorio (0 = solo al arrancar)
+    DOCUMENT_CATALOG_INTERVAL_SECONDS = int(os.getenv('DOCUMENT_CATALOG_INTERVAL_SECONDS', '60'))
+    # PDFs: max-age de Cache-Control en segundos (0 = el cliente revalida siempre con el ETag)
+    PDF_CACHE_MAX_AGE = int(os.getenv('PDF_CACHE_MAX_AGE', '0'))
+    # Entrega por el proxy: '' (la sirve Flask), 'x-accel' (nginx) o 'x-sendfile' (Apache/lighttpd),
+    # solo para archivos desde PDF_SENDFILE_MIN_BYTES; PDF_ACCEL_PREFIX es la location `internal`
+    # de nginx que apunta a DOCUMENTS_PATH
+    PDF_SENDFILE_MODE = os.getenv('PDF_SENDFILE_MODE', '').lower()
+    PDF_SENDFILE_MIN_BYTES = int(os.getenv('PDF_SENDFILE_MIN_BYTES', '0'))
+    PDF_ACCEL_PREFIX = os.getenv('PDF_ACCEL_PREFIX', '/_documentos/')
+    # Texto por página extraído al indexar e imágenes de página (lado mayor en píxeles)
+    PAGE_STORE_PATH = os.getenv('PAGE_STORE_PATH', './vectorstore/pages')
+    PDF_PAGE_IMAGE_MAX_PX = int(os.getenv('PDF_PAGE_IMAGE_MAX_PX', '1200'))
+
     # Embeddings
     EMBEDDING_MODEL = os.getenv(
         'EMBEDDING_MODEL',
         'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'
     )
+    # Clasificación: 'keywords' o 'centroid' (centroide más cercano de ejemplos por
+    # categoría, con el mismo embedding de la consulta que usa la búsqueda RAG)
+    CLASSIFIER_MODE = os.getenv('CLASSIFIER_MODE', 'keywords').lower()
+    # Similitud mínima al centroide; por debajo se usa la categoría por keywords
+    CLASSIFIER_MIN_SIMILARITY = float(os.getenv('CLASSIFIER_MIN_SIMILARITY', '0.35'))
+    # Cache semántica de respuestas: similitud coseno mínima con una pregunta ya
+    # respondida (0 = solo coincidencia exacta del texto normalizado)
+    SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0'))
+    
+    # Multas: SMMLV por año ('año:valor,...') y año con el que se liquidan (0 = el más reciente)
+    SMMLV_BY_YEAR = {
+        int(year): int(value)
+        for year, value in (
+            item.split(':') for item in os.getenv('SMMLV_BY_YEAR', '2023:1160000,2024:1300000,2025:1423500').split(',')
+            if item.strip()
+        )
+    }
+    SMMLV_YEAR = int(os.getenv('SMMLV_YEAR', '0'))
+    # Respuesta exacta desde la tabla de infracciones (sin RAG ni LLM) si la consulta cita un código (C.29)
+    EXACT_FINE_ANSWERS = os.getenv('EXACT_FINE_ANSWERS', 'True').lower() == 'true'
+    # Segundos entre lecturas de la tabla de infracciones mientras esté vacía
+    FINE_TABLE_EMPTY_RETRY_SECONDS = float(os.getenv('FINE_TABLE_EMPTY_RETRY_SECONDS', '60'))
     
     # Conversación
     MAX_CONVERSATION_HISTORY = int(os.getenv('MAX_CONVERSATION_HISTORY', '5'))
-    
+    # Cache de estado de sesión (ID de conversación + últimos mensajes)
+    SESSION_CACHE_IDLE_SECONDS = int(os.getenv('SESSION_CACHE_IDLE_SECONDS', '1800'))
+    SESSION_CACHE_MAX_SESSIONS = int(os.getenv('SESSION_CACHE_MAX_SESSIONS', '5000'))
+    # Expiración de conversaciones inactivas (tarea en segundo plano)
+    SESSION_TIMEOUT_HOURS = int(os.getenv('SESSION_TIMEOUT_HOURS', '24'))
+    SESSION_EXPIRY_INTERVAL_SECONDS = int(os.getenv('SESSION_EXPIRY_INTERVAL_SECONDS', '300'))
+    # Escritura diferida de mensajes (write-behind)
+    MESSAGE_WRITE_BEHIND = os.getenv('MESSAGE_WRITE_BEHIND', 'False').lower() == 'true'
+    MESSAGE_WRITE_BEHIND_QUEUE_SIZE = int(os.getenv('MESSAGE_WRITE_BEHIND_QUEUE_SIZE', '10000'))
+    MESSAGE_WRITE_BEHIND_BATCH_SIZE = int(os.getenv('MESSAGE_WRITE_BEHIND_BATCH_SIZE', '200'))
+    MESSAGE_WRITE_BEHIND_INTERVAL_MS = int(os.getenv('MESSAGE_WRITE_BEHIND_INTERVAL_MS', '200'))
+    # Ruta base: cada proceso escribe <ruta>.<pid>.jsonl
+    MESSAGE_SPILL_PATH = os.getenv('MESSAGE_SPILL_PATH', './data/message_spill.jsonl')
+    MESSAGE_SPILL_RETRY_SECONDS = float(os.getenv('MESSAGE_SPILL_RETRY_SECONDS', '30'))
+    # Filas rechazadas por la BD (p. ej. FK): no se reintentan
+    MESSAGE_DEAD_LETTER_PATH = os.getenv('MESSAGE_DEAD_LETTER_PATH', './data/message_dead_letter.jsonl')
+    # Archivo de mensajes: días desde el fin de una conversación finalizada para archivarla
+    ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '90'))
+
+    # Búsqueda de texto completo en mensajes (FTS5 / tsvector / FULLTEXT según el motor)
+    MESSAGE_SEARCH_ENABLED = os.getenv('MESSAGE_SEARCH_ENABLED', 'True').lower() == 'true'
+
+    # Contraseñas: costo de bcrypt y pool de procesos dedicado (0 procesos = en el hilo del request)
+    BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', str(max(1, (os.cpu_count() or 2) // 2))))
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', '32'))
+    PASSWORD_HASH_ACQUIRE_TIMEOUT = float(os.getenv('PASSWORD_HASH_ACQUIRE_TIMEOUT', '5'))
+
+    # Identidad: cache de usuarios y de sus conversaciones para autorizar sin consultar la BD
+    IDENTITY_CACHE_TTL_SECONDS = float(os.getenv('IDENTITY_CACHE_TTL_SECONDS', '300'))
+    IDENTITY_CACHE_MAX_USERS = int(os.getenv('IDENTITY_CACHE_MAX_USERS', '10000'))
+    # Segundos que se recuerda que una conversación no es del usuario
+    IDENTITY_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv('IDENTITY_CACHE_NEGATIVE_TTL_SECONDS', '10'))
+    # /ask acepta X-User-ID sin token (compatibilidad con clientes anteriores)
+    ALLOW_USER_ID_HEADER = os.getenv('ALLOW_USER_ID_HEADER', 'True').lower() == 'true'
+
+    # Ollama: continuación de conversación con el `context` devuelto por /api/generate
+    OLLAMA_CONTEXT_MAX_SESSIONS = int(os.getenv('OLLAMA_CONTEXT_MAX_SESSIONS', '500'))
+    OLLAMA_CONTEXT_MAX_TOKENS = int(os.getenv('OLLAMA_CONTEXT_MAX_TOKENS', os.getenv('OLLAMA_NUM_CTX', '8192')))
+    OLLAMA_TIMEOUT = float(os.getenv('OLLAMA_TIMEOUT', '120'))
+
+    # Métricas de latencia por etapa y tokens del LLM en /metrics (formato Prometheus)
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'False').lower() == 'true'
+
     # Logging
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
     
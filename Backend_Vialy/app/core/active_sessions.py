@@ -0,0 +1,55 @@
+"""
+Conteo en memoria de conversaciones activas (/health, /active-sessions).
+
+La tarea de expiración lo reconcilia con la BD en cada pasada; entre
+pasadas lo ajustan quienes cambian el estado de una conversación después de
+su commit: creación, reactivación al recibir mensajes y borrado.
+"""
+
+import threading
+import time
+from typing import Optional
+
+from app.config.settings import Config
+
+
+class ActiveSessionCounter:
+    """
+    Conteo de conversaciones activas guardado en memoria.
+    Las lecturas no consultan la BD mientras la última reconciliación tenga
+    menos de `max_age_seconds`.
+    """
+
+    def __init__(self, max_age_seconds: int = 300):
+        self.max_age = max_age_seconds
+        self._value: Optional[int] = None
+        self._updated_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> Optional[int]:
+        """Devuelve el conteo o None si no existe o está vencido"""
+        with self._lock:
+            if self._value is None or time.monotonic() - self._updated_at > self.max_age:
+                return None
+            return self._value
+
+    def set(self, value: int):
+        """Reconcilia con el conteo leído de la BD"""
+        with self._lock:
+            self._value = value
+            self._updated_at = time.monotonic()
+
+    def adjust(self, delta: int):
+        """Suma `delta` al conteo; sin conteo previo no hace nada (se contará en la BD)"""
+        if not delta:
+            return
+        with self._lock:
+            if self._value is not None:
+                self._value = max(0, self._value + delta)
+
+
+# Instancia global, compartida entre SessionManager, la escritura diferida y la tarea de expiración
+active_sessions_counter = ActiveSessionCounter(
+    # Margen para que una ejecución lenta de la tarea no obligue a contar en un request
+    max_age_seconds=Config.SESSION_EXPIRY_INTERVAL_SECONDS * 2
+)
@@ -1,239 +1,341 @@
 """
 Gestor de contexto de conversación para mantener coherencia.
 Rastrea temas, infracciones, artículos citados y preguntas principales.
+
+El contexto de cada conversación vive en memoria (`ConversationContextState`,
+guardado junto al estado de la sesión) y se actualiza de forma incremental en
+cada turno; solo las columnas que cambiaron se escriben, dentro de la misma
+transacción que los mensajes del turno (en un SAVEPOINT: si el contexto falla,
+los mensajes se guardan igual).
+
+Con varios procesos cada uno tiene su copia en memoria: la fila se crea con
+INSERT y, si otro proceso la creó primero, se combina con la guardada; las
+actualizaciones posteriores escriben las columnas completas (gana la última
+escritura de cada columna).
 """
 
 import logging
-from typing import Dict, List, Optional, Set
+import re
+import threading
+from collections import OrderedDict, deque
 from datetime import datetime
+from typing import Dict, List, Optional, Set
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from app.models.models import Conversation, ConversationContext, Message
+from app.core.keyword_matcher import COMMON_INFRACTIONS, match_keywords
+from app.models.models import Conversation, ConversationContext
 
 logger = logging.getLogger(__name__)
 
-# Diccionario de palabras clave por categoría
-CATEGORY_KEYWORDS = {
-    'MULTA': ['multa', 'sanción', 'infracción', 'penalización', 'castigo', 'pena', 'valor', 'pagar', 'costo'],
-    'REQUISITO': ['requisito', 'documento', 'documentación', 'licencia', 'soat', 'cedula', 'identidad', 'trámite'],
-    'NORMATIVA': ['artículo', 'ley', 'código', 'norma', 'decreto', 'resolución', 'reglamento'],
-    'PROCEDIMIENTO': ['cómo', 'pasos', 'proceso', 'tramite', 'obtener', 'renovar', 'solicitar', 'hacer'],
-    'CONDUCCION': ['conducir', 'manejar', 'velocidad', 'seguridad', 'precaución', 'luz', 'freno', 'señal']
-}
-
-# Infracciones comunes y sus códigos de artículo
-COMMON_INFRACTIONS = {
-    'exceso_velocidad': {'article': '29', 'category': 'MULTA', 'keywords': ['exceso', 'velocidad', 'rápido', 'límite']},
-    'sin_licencia': {'article': 'D.1', 'category': 'MULTA', 'keywords': ['licencia', 'sin', 'no tiene']},
-    'no_usar_cinturon': {'article': '6', 'category': 'MULTA', 'keywords': ['cinturón', 'cinturon', 'seguridad']},
-    'semaforo_rojo': {'article': 'D.4', 'category': 'MULTA', 'keywords': ['semáforo', 'rojo', 'roja', 'luz roja']},
-    'sin_soat': {'article': 'D.2', 'category': 'MULTA', 'keywords': ['soat', 'seguro']},
-    'celular': {'article': '38', 'category': 'MULTA', 'keywords': ['celular', 'telefono', 'teléfono', 'mano']},
-    'estacionamiento': {'article': '2', 'category': 'MULTA', 'keywords': ['estacionar', 'estacionamiento', 'parqueo', 'aparcar']},
-}
+# "Artículo 29", "Art. 131", "artículo D.1" (un solo patrón compilado, sin distinguir mayúsculas)
+ARTICLE_PATTERN = re.compile(r'\b(?:artículo|art\.)\s+([A-D]\.\d+|[A-D]?\d+(?:\.\d+)?)', re.IGNORECASE)
+
+# Límites de lo que se conserva por conversación
+MAX_MAIN_QUESTIONS = 5
+MAX_KEY_ANSWERS = 10
+
+# Columnas JSON de ConversationContext
+CONTEXT_FIELDS = ('topics', 'infractions_mentioned', 'articles_cited', 'main_questions', 'key_answers')
+
+
+def _article_sort_key(article: str):
+    # "D.1" después de los numéricos; "29" antes que "131"
+    prefix = article[0] if article[0].isalpha() else ''
+    numbers = tuple(int(n) for n in re.findall(r'\d+', article))
+    return prefix, numbers
+
+
+class ConversationContextState:
+    """
+    Contexto de una conversación en memoria. Temas, infracciones y artículos
+    son conjuntos (agregar es O(1) y no se recorren listas para evitar
+    duplicados); las preguntas se deduplican por su forma normalizada.
+
+    `dirty` guarda las columnas modificadas desde la última escritura y el
+    texto para el prompt se genera una vez por cambio.
+    """
+
+    def __init__(self, conversation_id: int, primary_topic: Optional[str] = None,
+                 context: Optional[ConversationContext] = None):
+        self.conversation_id = conversation_id
+        self.primary_topic = primary_topic
+        # Existe la fila en contexto_conversaciones (UPDATE en lugar de INSERT)
+        self.persisted = context is not None
+        self.topics: Set[str] = set(context.topics or ()) if context else set()
+        self.infractions: Set[str] = set(context.infractions_mentioned or ()) if context else set()
+        self.articles: Set[str] = set(context.articles_cited or ()) if context else set()
+        # Pregunta normalizada -> pregunta original, en orden de llegada
+        self.questions: "OrderedDict[str, str]" = OrderedDict(
+            (q.lower().strip(), q) for q in (context.main_questions or ())[-MAX_MAIN_QUESTIONS:]
+        ) if context else OrderedDict()
+        self.key_answers = deque((context.key_answers or ()) if context else (), maxlen=MAX_KEY_ANSWERS)
+        self.dirty: Set[str] = set()
+        self.primary_topic_dirty = False
+        self._rendered: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def apply_turn(self, user_message: str, assistant_message: str, category: str):
+        """Aplica un turno al contexto; solo marca las columnas que cambiaron"""
+        with self._lock:
+            changed = set()
+
+            # Agregar categoría a topics
+            category_lower = (category or 'general').lower()
+            if category_lower not in self.topics:
+                self.topics.add(category_lower)
+                changed.add('topics')
+
+            # Tema principal de la conversación: la primera categoría
+            if not self.primary_topic and category:
+                self.primary_topic = category
+                self.primary_topic_dirty = True
+                changed.add('primary_topic')
+
+            if self._detect_infractions(user_message):
+                changed.add('infractions_mentioned')
+            if self._detect_articles(assistant_message):
+                changed.add('articles_cited')
+
+            # Agregar a preguntas principales solo si es pregunta substancial y no está repetida
+            if len(user_message.split()) > 3:
+                normalized = user_message.lower().strip()
+                if normalized not in self.questions:
+                    self.questions[normalized] = user_message
+                    # Mantener solo las últimas 5 preguntas principales
+                    while len(self.questions) > MAX_MAIN_QUESTIONS:
+                        self.questions.popitem(last=False)
+                    changed.add('main_questions')
+
+            # Almacenar respuesta clave (el deque conserva las últimas 10)
+            if assistant_message and len(assistant_message) > 20:
+                self.key_answers.append({
+                    'question': user_message,
+                    'answer': assistant_message[:500],  # Primeros 500 caracteres
+                    'category': category,
+                    'timestamp': datetime.utcnow().isoformat()
+                })
+                changed.add('key_answers')
+
+            self.dirty |= changed - {'primary_topic'}
+            # key_answers no aparece en el texto del prompt
+            if changed - {'key_answers'}:
+                self._rendered.clear()
+
+    def _detect_infractions(self, message: str) -> bool:
+        """Agrega las infracciones mencionadas que aún no estaban; True si hubo alguna"""
+        new = match_keywords(message).infractions - self.infractions
+        self.infractions |= new
+        return bool(new)
+
+    def _detect_articles(self, message: str) -> bool:
+        """Agrega los artículos citados que aún no estaban; True si hubo alguno"""
+        found = {match.upper() for match in ARTICLE_PATTERN.findall(message or '')}
+        new = found - self.articles
+        self.articles |= new
+        return bool(new)
+
+    def merge_stored(self, context: ConversationContext):
+        """
+        Combina con la fila guardada por otra petición (llamar con `_lock`
+        tomado): unión de conjuntos, y preguntas y respuestas guardadas antes
+        que las de esta copia
+        """
+        self.topics |= set(context.topics or ())
+        self.infractions |= set(context.infractions_mentioned or ())
+        self.articles |= set(context.articles_cited or ())
+        questions = OrderedDict((q.lower().strip(), q) for q in (context.main_questions or ()))
+        for normalized, question in self.questions.items():
+            questions.setdefault(normalized, question)
+        while len(questions) > MAX_MAIN_QUESTIONS:
+            questions.popitem(last=False)
+        self.questions = questions
+        stored_answers = list(context.key_answers or ())
+        self.key_answers = deque(stored_answers + [a for a in self.key_answers if a not in stored_answers],
+                                 maxlen=MAX_KEY_ANSWERS)
+        self._rendered.clear()
+
+    def columns(self, fields) -> Dict:
+        """Valores JSON de las columnas indicadas (listas ordenadas para que sean estables)"""
+        values = {
+            'topics': lambda: sorted(self.topics),
+            'infractions_mentioned': lambda: [key for key in COMMON_INFRACTIONS if key in self.infractions],
+            'articles_cited': lambda: sorted(self.articles, key=_article_sort_key),
+            'main_questions': lambda: list(self.questions.values()),
+            'key_answers': lambda: list(self.key_answers),
+        }
+        return {field: values[field]() for field in fields}
+
+    @property
+    def has_context(self) -> bool:
+        return bool(self.topics or self.infractions)
+
+    def render(self, max_items: int = 5) -> str:
+        """Texto del contexto para el prompt, generado una sola vez por cambio"""
+        with self._lock:
+            rendered = self._rendered.get(max_items)
+            if rendered is None:
+                rendered = self._render(max_items)
+                self._rendered[max_items] = rendered
+            return rendered
+
+    def _render(self, max_items: int) -> str:
+        parts = []
+
+        # Tema principal
+        if self.primary_topic:
+            parts.append(f"📌 Tema Principal: {self.primary_topic}")
+
+        # Temas tratados
+        if self.topics:
+            parts.append(f"🏷️ Temas: {', '.join(sorted(self.topics))}")
+
+        # Infracciones mencionadas
+        infraction_names = [
+            key.replace('_', ' ').title() for key in COMMON_INFRACTIONS if key in self.infractions
+        ][:max_items]
+        if infraction_names:
+            parts.append(f"⚠️ Infracciones Mencionadas: {', '.join(infraction_names)}")
+
+        # Artículos citados
+        if self.articles:
+            articles = ', '.join(sorted(self.articles, key=_article_sort_key)[:max_items])
+            parts.append(f"📜 Artículos: {articles}")
+
+        # Preguntas principales
+        if self.questions:
+            parts.append("❓ Preguntas Principales:")
+            for q in list(self.questions.values())[-3:]:
+                parts.append(f"  • {q}")
+
+        return "\n".join(parts) if parts else "Sin contexto previo."
 
 
 class ConversationContextManager:
     """Gestor de contexto de conversación"""
-    
+
     def __init__(self, db: Session):
         """
         Inicializa el gestor de contexto
-        
+
         Args:
             db: Sesión de base de datos SQLAlchemy
         """
         self.db = db
-    
-    def get_or_create_context(self, conversation_id: str) -> ConversationContext:
+
+    def load_state(self, conversation_id: int) -> ConversationContextState:
         """
-        Obtiene o crea contexto para una conversación
-        
+        Carga el contexto de una conversación en una sola consulta
+
         Args:
             conversation_id: ID de la conversación
-            
+
         Returns:
-            ConversationContext: Contexto de la conversación
+            ConversationContextState: Contexto (vacío si aún no existe la fila)
         """
-        context = self.db.query(ConversationContext).filter_by(
-            conversation_id=conversation_id
-        ).first()
-        
-        if not context:
-            context = ConversationContext(conversation_id=conversation_id)
-            self.db.add(context)
-            self.db.commit()
-        
-        return context
-    
-    def update_context(self, conversation_id: str, user_message: str, assistant_message: str,
-                      category: str, sources: List[Dict] = None):
+        row = (
+            self.db.query(Conversation.primary_topic, ConversationContext)
+            .outerjoin(ConversationContext, ConversationContext.conversation_id == Conversation.id)
+            .filter(Conversation.id == conversation_id)
+            .first()
+        )
+        if row is None:
+            return ConversationContextState(conversation_id)
+        primary_topic, context = row
+        if context is not None:
+            # Solo se leen sus valores: no queda asociado a la sesión
+            self.db.expunge(context)
+        return ConversationContextState(conversation_id, primary_topic, context)
+
+    def update_context(self, state: ConversationContextState, user_message: str, assistant_message: str,
+                       category: str, sources: List[Dict] = None):
         """
-        Actualiza el contexto basado en un nuevo par de mensajes
-        
+        Actualiza el contexto basado en un nuevo par de mensajes y escribe los
+        cambios en la transacción actual (sin commit: lo hace el llamador)
+
         Args:
-            conversation_id: ID de la conversación
+            state: Contexto en memoria de la conversación
             user_message: Mensaje del usuario
             assistant_message: Respuesta del asistente
             category: Categoría detectada
             sources: Fuentes RAG utilizadas
         """
-        context = self.get_or_create_context(conversation_id)
-        conversation = self.db.query(Conversation).get(conversation_id)
-        
-        # Actualizar tema principal
-        if not context.topics:
-            context.topics = []
-        
-        # Agregar categoría a topics
-        category_lower = category.lower()
-        if category_lower not in context.topics:
-            context.topics.append(category_lower)
-        
-        # Detectar infracciones mencionadas
-        self._detect_infractions(context, user_message)
-        
-        # Detectar artículos citados
-        self._detect_articles(context, assistant_message)
-        
-        # Actualizar tema principal de conversación
-        if not conversation.primary_topic:
-            conversation.primary_topic = category
-        
-        # Agregar a preguntas principales
-        if len(user_message.split()) > 3:  # Solo si es pregunta substancial
-            if not context.main_questions:
-                context.main_questions = []
-            
-            # Agregar si no existe una pregunta similar
-            user_query_normalized = user_message.lower().strip()
-            if not any(q.lower() == user_query_normalized for q in context.main_questions):
-                context.main_questions.append(user_message)
-                # Mantener solo las últimas 5 preguntas principales
-                context.main_questions = context.main_questions[-5:]
-        
-        # Almacenar respuesta clave
-        if assistant_message and len(assistant_message) > 20:
-            if not context.key_answers:
-                context.key_answers = []
-            
-            context.key_answers.append({
-                'question': user_message,
-                'answer': assistant_message[:500],  # Primeros 500 caracteres
-                'category': category,
-                'timestamp': datetime.utcnow().isoformat()
-            })
-            # Mantener solo las últimas 10 respuestas clave
-            context.key_answers = context.key_answers[-10:]
-        
-        context.updated_at = datetime.utcnow()
-        self.db.commit()
-        
-        logger.info(f"Contexto actualizado para conversación {conversation_id}")
-    
-    def _detect_infractions(self, context: ConversationContext, message: str):
-        """
-        Detecta infracciones mencionadas en un mensaje
-        
-        Args:
-            context: Contexto de conversación
-            message: Mensaje a analizar
-        """
-        message_lower = message.lower()
-        
-        for infraction_key, infraction_data in COMMON_INFRACTIONS.items():
-            for keyword in infraction_data['keywords']:
-                if keyword in message_lower:
-                    if infraction_key not in context.infractions_mentioned:
-                        context.infractions_mentioned.append(infraction_key)
-    
-    def _detect_articles(self, context: ConversationContext, message: str):
+        state.apply_turn(user_message, assistant_message, category)
+        self.flush(state)
+
+    def flush(self, state: ConversationContextState):
         """
-        Detecta artículos citados en un mensaje
-        
+        Escribe las columnas modificadas: INSERT la primera vez y luego UPDATE
+        solo de lo que cambió. No hace commit.
+
+        Si otra petición creó la fila entre la carga y este INSERT (la columna
+        conversation_id es única), el INSERT se deshace en su SAVEPOINT y el
+        contexto se combina con la fila guardada antes de actualizarla.
+
         Args:
-            context: Contexto de conversación
-            message: Mensaje a analizar
+            state: Contexto en memoria de la conversación
         """
-        # Patrón simple para detectar "Artículo XXX"
-        import re
-        
-        # Buscar patrones como "Artículo 29", "Art. 131", "artículo D.1"
-        patterns = [
-            r'Artículo\s+([A-D]?\d+(?:\.\d+)?)',
-            r'Art\.\s+([A-D]?\d+(?:\.\d+)?)',
-            r'artículo\s+([A-D]?\d+(?:\.\d+)?)',
-            r'art\.\s+([A-D]?\d+(?:\.\d+)?)',
-        ]
-        
-        for pattern in patterns:
-            matches = re.findall(pattern, message, re.IGNORECASE)
-            for match in matches:
-                if match not in context.articles_cited:
-                    context.articles_cited.append(match)
-    
-    def get_formatted_context(self, conversation_id: str, max_items: int = 5) -> str:
+        with state._lock:
+            now = datetime.utcnow()
+            if not state.persisted:
+                try:
+                    with self.db.begin_nested():
+                        self.db.execute(insert(ConversationContext).values(
+                            conversation_id=state.conversation_id, updated_at=now, **state.columns(CONTEXT_FIELDS)
+                        ))
+                except IntegrityError:
+                    stored = self.db.query(ConversationContext) \
+                        .filter(ConversationContext.conversation_id == state.conversation_id).first()
+                    if stored is None:
+                        raise
+                    self.db.expunge(stored)
+                    state.merge_stored(stored)
+                    self.db.execute(
+                        update(ConversationContext)
+                        .where(ConversationContext.conversation_id == state.conversation_id)
+                        .values(updated_at=now, **state.columns(CONTEXT_FIELDS))
+                    )
+            elif state.dirty:
+                self.db.execute(
+                    update(ConversationContext)
+                    .where(ConversationContext.conversation_id == state.conversation_id)
+                    .values(updated_at=now, **state.columns(sorted(state.dirty)))
+                )
+            if state.primary_topic_dirty:
+                self.db.execute(
+                    update(Conversation)
+                    .where(Conversation.id == state.conversation_id, Conversation.primary_topic.is_(None))
+                    .values(primary_topic=state.primary_topic)
+                )
+            # Si la transacción falla el contexto en memoria queda adelantado: el
+            # llamador lo descarta para recargarlo (ver SessionManager.record_turn)
+            state.persisted = True
+            state.dirty.clear()
+            state.primary_topic_dirty = False
+        logger.debug(f"Contexto actualizado para conversación {state.conversation_id}")
+
+    def get_formatted_context(self, state: ConversationContextState, max_items: int = 5) -> str:
         """
         Obtiene el contexto formateado para incluir en prompts
-        
+
         Args:
-            conversation_id: ID de la conversación
+            state: Contexto en memoria de la conversación
             max_items: Número máximo de items a incluir
-            
+
         Returns:
             str: Contexto formateado
         """
-        context = self.get_or_create_context(conversation_id)
-        conversation = self.db.query(Conversation).get(conversation_id)
-        
-        parts = []
-        
-        # Tema principal
-        if conversation and conversation.primary_topic:
-            parts.append(f"📌 Tema Principal: {conversation.primary_topic}")
-        
-        # Temas tratados
-        if context.topics:
-            parts.append(f"🏷️ Temas: {', '.join(context.topics)}")
-        
-        # Infracciones mencionadas
-        if context.infractions_mentioned:
-            infraction_names = []
-            for inf_key in context.infractions_mentioned[:max_items]:
-                if inf_key in COMMON_INFRACTIONS:
-                    name = inf_key.replace('_', ' ').title()
-                    infraction_names.append(name)
-            if infraction_names:
-                parts.append(f"⚠️ Infracciones Mencionadas: {', '.join(infraction_names)}")
-        
-        # Artículos citados
-        if context.articles_cited:
-            articles = ', '.join(context.articles_cited[:max_items])
-            parts.append(f"📜 Artículos: {articles}")
-        
-        # Preguntas principales
-        if context.main_questions:
-            parts.append("❓ Preguntas Principales:")
-            for q in context.main_questions[-3:]:
-                parts.append(f"  • {q}")
-        
-        return "\n".join(parts) if parts else "Sin contexto previo."
-    
-    def should_provide_context(self, conversation_id: str) -> bool:
+        return state.render(max_items)
+
+    def should_provide_context(self, state: Optional[ConversationContextState]) -> bool:
         """
         Determina si el contexto debe incluirse en el prompt
-        
+
         Args:
-            conversation_id: ID de la conversación
-            
+            state: Contexto en memoria de la conversación
+
         Returns:
             bool: True si hay contexto relevante
         """
-        context = self.db.query(ConversationContext).filter_by(
-            conversation_id=conversation_id
-        ).first()
-        
-        if not context:
-            return False
-        
-        # Incluir contexto si hay más de 2 mensajes o hay infracciones/artículos detectados
-        return len(context.topics) > 0 or len(context.infractions_mentioned) > 0
+        # Incluir contexto si hay temas o infracciones detectados
+        return state is not None and state.has_context
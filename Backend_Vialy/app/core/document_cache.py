@@ -0,0 +1,118 @@
+"""
+Metadatos de los PDFs servidos por app/routes/pdf_routes.py.
+
+Cada documento se describe una sola vez por versión del archivo: la clave de
+la cache es (ruta, mtime_ns, tamaño), así que basta un `os.stat` por request
+para saber si lo guardado sigue valiendo. Por versión se calcula:
+
+- ETag fuerte a partir del contenido (SHA-256), igual en todas las réplicas
+  y tras un redeploy que cambie el mtime sin cambiar el archivo; el ETag por
+  defecto de send_file depende del mtime y de la ruta.
+- Número de páginas con PyMuPDF si está instalado, si no con pypdf; antes
+  /pdf/info abría el PDF con PyMuPDF en cada llamada.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Documentos distintos recordados (los más antiguos se descartan)
+MAX_DOCUMENTS = 256
+# Bloque de lectura para el hash del contenido
+HASH_CHUNK_SIZE = 1024 * 1024
+
+DocumentMeta = namedtuple('DocumentMeta', 'path filename size mtime_ns last_modified etag num_pages')
+
+
+def _content_etag(path: str) -> str:
+    """SHA-256 del archivo (los primeros 32 caracteres bastan para un ETag)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:32]
+
+
+def count_pages(path: str) -> Optional[int]:
+    """Número de páginas del PDF, o None si no se puede leer"""
+    try:
+        import fitz  # PyMuPDF
+        with fitz.open(path) as doc:
+            return len(doc)
+    except ImportError:
+        pass
+    except Exception as e:
+        logger.warning(f"⚠️ PyMuPDF no pudo abrir {path}: {str(e)}")
+        return None
+    try:
+        from pypdf import PdfReader
+        return len(PdfReader(path).pages)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo contar las páginas de {path}: {str(e)}")
+        return None
+
+
+class DocumentMetadataCache:
+    """Metadatos por documento, recalculados solo si cambian mtime o tamaño"""
+
+    def __init__(self, max_documents: int = MAX_DOCUMENTS):
+        self._entries: 'OrderedDict[str, DocumentMeta]' = OrderedDict()
+        self._max_documents = max_documents
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> DocumentMeta:
+        """
+        Metadatos de un documento
+
+        Args:
+            path: Ruta del archivo
+
+        Returns:
+            DocumentMeta: Tamaño, fecha de modificación, ETag y páginas
+
+        Raises:
+            FileNotFoundError: Si el archivo no existe
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            meta = self._entries.get(path)
+            if meta is not None and meta.mtime_ns == stat.st_mtime_ns and meta.size == stat.st_size:
+                self._entries.move_to_end(path)
+                return meta
+
+        # El hash y el conteo de páginas se hacen fuera del lock
+        meta = DocumentMeta(
+            path=path,
+            filename=os.path.basename(path),
+            size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns,
+            last_modified=datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc),
+            etag=_content_etag(path),
+            num_pages=count_pages(path),
+        )
+        with self._lock:
+            self._entries[path] = meta
+            self._entries.move_to_end(path)
+            while len(self._entries) > self._max_documents:
+                self._entries.popitem(last=False)
+        logger.info(f"📄 Metadatos de {meta.filename}: {meta.size} bytes, {meta.num_pages} páginas")
+        return meta
+
+    def invalidate(self, path: Optional[str] = None):
+        """Descarta un documento (o todos)"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(os.path.abspath(path), None)
+
+
+# Instancia global
+document_cache = DocumentMetadataCache()
@@ -0,0 +1,169 @@
+"""
+Catálogo en memoria de los PDFs de DOCUMENTS_PATH.
+
+DOCUMENTS_PATH puede estar en almacenamiento de red lento, así que las rutas
+de app/routes/pdf_routes.py no lo consultan: el catálogo se arma al arrancar
+y un hilo lo actualiza cada DOCUMENT_CATALOG_INTERVAL_SECONDS con un barrido
+de `os.scandir` (un stat por archivo). Solo los archivos con mtime o tamaño
+distintos se vuelven a describir (hash y páginas, app/core/document_cache.py).
+
+Cada cambio se publica como un DocumentEvent ('added', 'modified' o
+'removed') a los suscriptores (`subscribe`); el almacén de páginas se suscribe
+para extraer el texto de los documentos nuevos fuera de los requests.
+"""
+
+import atexit
+import logging
+import os
+import threading
+from collections import namedtuple
+from typing import Callable, Dict, List, Optional
+
+from app.config.settings import Config
+from app.core.document_cache import DocumentMeta, document_cache
+
+logger = logging.getLogger(__name__)
+
+DocumentEvent = namedtuple('DocumentEvent', 'kind meta')
+
+
+def display_name(filename: str) -> str:
+    """'codigo_transito.pdf' -> 'Codigo Transito'"""
+    return filename.replace('.pdf', '').replace('_', ' ').title()
+
+
+def describe(meta: DocumentMeta) -> Dict:
+    """Entrada del catálogo como JSON"""
+    return {
+        "filename": meta.filename,
+        "display_name": display_name(meta.filename),
+        "size": meta.size,
+        "size_mb": round(meta.size / (1024 * 1024), 2),
+        "num_pages": meta.num_pages,
+        "hash": meta.etag,
+        "last_modified": meta.last_modified.isoformat(),
+        "url": f"/pdf/view/{meta.filename}"
+    }
+
+
+class DocumentCatalog:
+    """PDFs disponibles, actualizados por barridos periódicos del directorio"""
+
+    def __init__(self, path: str, interval_seconds: int = 60):
+        self.path = path
+        self.interval = interval_seconds
+        self._documents: Dict[str, DocumentMeta] = {}
+        self._available = False
+        self._loaded = False
+        self._subscribers: List[Callable[[DocumentEvent], None]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, callback: Callable[[DocumentEvent], None]):
+        """Registra una función que recibe cada DocumentEvent (idempotente)"""
+        if callback not in self._subscribers:
+            self._subscribers.append(callback)
+
+    def refresh(self) -> List[DocumentEvent]:
+        """
+        Barre el directorio y actualiza el catálogo
+
+        Returns:
+            list: Eventos de los documentos agregados, modificados o eliminados
+        """
+        with self._lock:
+            events = self._sweep()
+            self._loaded = True
+        # Los suscriptores pueden tardar (extracción de páginas): fuera del lock
+        for event in events:
+            self._publish(event)
+        return events
+
+    def _sweep(self) -> List[DocumentEvent]:
+        try:
+            with os.scandir(self.path) as entries:
+                stats = {entry.name: entry.stat() for entry in entries
+                         if entry.is_file() and entry.name.lower().endswith('.pdf')}
+            self._available = True
+        except OSError as e:
+            if self._available or not self._loaded:
+                logger.warning(f"⚠️ Carpeta de documentos no disponible ({self.path}): {str(e)}")
+            self._available = False
+            stats = {}
+
+        events = []
+        for filename, stat in stats.items():
+            current = self._documents.get(filename)
+            if current is not None and current.mtime_ns == stat.st_mtime_ns and current.size == stat.st_size:
+                continue
+            try:
+                meta = document_cache.get(os.path.join(self.path, filename))
+            except OSError as e:
+                logger.warning(f"⚠️ No se pudo leer {filename}: {str(e)}")
+                continue
+            self._documents[filename] = meta
+            events.append(DocumentEvent('added' if current is None else 'modified', meta))
+        for filename in set(self._documents) - set(stats):
+            meta = self._documents.pop(filename)
+            document_cache.invalidate(meta.path)
+            events.append(DocumentEvent('removed', meta))
+
+        for event in events:
+            logger.info(f"📚 Documento {event.meta.filename}: {event.kind}")
+        return events
+
+    def _publish(self, event: DocumentEvent):
+        for callback in self._subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error(f"Error procesando evento de {event.meta.filename}: {str(e)}", exc_info=True)
+
+    def ensure_loaded(self) -> 'DocumentCatalog':
+        """Primer barrido si el catálogo aún no se armó (p. ej. sin `start`)"""
+        if not self._loaded:
+            self.refresh()
+        return self
+
+    @property
+    def available(self) -> bool:
+        """Si la carpeta de documentos existía en el último barrido"""
+        return self.ensure_loaded()._available
+
+    def get(self, filename: str) -> Optional[DocumentMeta]:
+        """Documento por nombre de archivo, o None si no está en el catálogo"""
+        return self.ensure_loaded()._documents.get(filename)
+
+    def list(self) -> List[DocumentMeta]:
+        """Documentos ordenados por nombre"""
+        documents = self.ensure_loaded()._documents
+        return [documents[filename] for filename in sorted(documents)]
+
+    def start(self):
+        """Arma el catálogo y lanza el barrido periódico (idempotente)"""
+        if self._thread and self._thread.is_alive():
+            return
+        events = self.refresh()
+        logger.info(f"✅ Catálogo de documentos: {len(self._documents)} PDFs ({len(events)} eventos)")
+        if self.interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="document-catalog", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout: float = 5.0):
+        if not self._thread:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.refresh()
+
+
+# Instancia global
+document_catalog = DocumentCatalog(Config.DOCUMENTS_PATH, interval_seconds=Config.DOCUMENT_CATALOG_INTERVAL_SECONDS)
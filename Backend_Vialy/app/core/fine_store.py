@@ -0,0 +1,188 @@
+"""
+Tabla de infracciones extraída del Código (ver app/rag/fine_extractor.py).
+
+Se carga una vez por proceso en memoria (son ~100 filas) y permite responder
+consultas sobre multas sin RAG ni LLM: un código explícito en la consulta
+("¿cuánto es la multa C.29?") se responde directamente con la descripción,
+los SMLDV, su valor en pesos según el SMMLV configurado y las otras
+sanciones. `search` busca por texto libre con el mismo índice que los datos
+de referencia.
+
+Una tabla vacía (aún sin `flask ingest-fines`) no se da por cargada: se
+vuelve a consultar cada `empty_retry_seconds`. Una tabla ya cargada no se
+relee; tras reemplazarla hay que reiniciar los servidores.
+"""
+
+import logging
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, insert
+from sqlalchemy.orm import Session
+
+from app.config.settings import Config
+from app.core.reference_data import format_pesos, get_anio_multas, get_smmlv, valor_multa
+from app.core.reference_search import ReferenceIndex
+from app.models.models import Infraccion
+
+logger = logging.getLogger(__name__)
+
+# "C.29", "c. 29", "D.1" en el texto de una consulta
+CODE_PATTERN = re.compile(r"(?<![\w.])([A-Ea-e])\s?\.\s?(\d{1,2})(?![\d])")
+# Máximo de códigos respondidos en una sola consulta
+MAX_CODES_PER_ANSWER = 3
+
+FIELDS = ('codigo', 'articulo', 'literal', 'descripcion', 'texto', 'smldv', 'otras_sanciones', 'vigente',
+          'pagina', 'fuente')
+
+
+def normalize_code(code: str) -> str:
+    """'c. 29' -> 'C.29'"""
+    match = CODE_PATTERN.fullmatch(code.strip())
+    return f"{match.group(1).upper()}.{int(match.group(2))}" if match else code.strip().upper()
+
+
+class FineStore:
+    """Infracciones en memoria, por código y con índice de texto"""
+
+    def __init__(self, empty_retry_seconds: float = 60):
+        self._entries: Dict[str, Dict] = {}
+        self._index: Optional[ReferenceIndex] = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.empty_retry = empty_retry_seconds
+        # Próximo intento de carga mientras la tabla está vacía
+        self._retry_at = 0.0
+
+    def ensure_loaded(self, db: Session) -> 'FineStore':
+        """Carga la tabla la primera vez que se usa (una consulta por proceso si no está vacía)"""
+        if not self._loaded and time.monotonic() >= self._retry_at:
+            with self._lock:
+                if not self._loaded and time.monotonic() >= self._retry_at:
+                    self._load(db)
+        return self
+
+    def _load(self, db: Session):
+        rows = db.query(Infraccion).order_by(Infraccion.id).all()
+        self._entries = {row.codigo: {field: getattr(row, field) for field in FIELDS} for row in rows}
+        for row in rows:
+            db.expunge(row)
+        self._index = ReferenceIndex(
+            ('infraccion', code, entry, [
+                (code, 3.0),
+                (entry['descripcion'], 2.0),
+                (entry['texto'], 1.0),
+            ])
+            for code, entry in self._entries.items()
+        ) if self._entries else None
+        if self._entries:
+            self._loaded = True
+            logger.info(f"🚦 {len(self._entries)} infracciones cargadas")
+        else:
+            self._retry_at = time.monotonic() + self.empty_retry
+            logger.warning(f"⚠️ Tabla de infracciones vacía, se reintenta en {self.empty_retry:.0f} s")
+
+    def invalidate(self):
+        """Descarta lo cargado (se recarga en el siguiente uso)"""
+        with self._lock:
+            self._loaded = False
+            self._retry_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, code: str) -> Optional[Dict]:
+        """Infracción por código ('C.29', 'F', '152-2.1')"""
+        return self._entries.get(normalize_code(code))
+
+    def find_codes(self, text: str) -> List[str]:
+        """Códigos de infracción citados en un texto que existen en la tabla, sin repetir"""
+        codes = (normalize_code(match.group(0)) for match in CODE_PATTERN.finditer(text or ''))
+        return [code for code in dict.fromkeys(codes) if code in self._entries]
+
+    def search(self, query: str, limit: int = 5) -> List[Dict]:
+        """Infracciones que coinciden con un texto libre, de la más a la menos relevante"""
+        if self._index is None:
+            return []
+        return [hit.data for hit in self._index.search(query, limit=limit)]
+
+    def alcohol_table(self) -> List[Dict]:
+        """Multas por grado de alcoholemia y reincidencia (Art. 152)"""
+        return [entry for entry in self._entries.values() if entry['articulo'] == '152']
+
+    def format_entry(self, entry: Dict, anio: Optional[int] = None) -> str:
+        """Texto de la respuesta para una infracción, con la multa en pesos del año"""
+        anio = get_anio_multas(anio)
+        title = f"📋 **{entry['codigo']}** (Artículo {entry['articulo']}, literal {entry['literal']})"
+        parts = [title, entry['descripcion']]
+        if not entry['vigente']:
+            parts.append("⚠️ Este literal fue eliminado; hoy aplica el literal F y las multas del Artículo 152.")
+        elif entry['smldv'] is not None:
+            parts.append(f"💰 **Multa:** {entry['smldv']} SMLDV = {format_pesos(valor_multa(entry['smldv'], anio))} "
+                         f"(SMMLV {anio}: {format_pesos(get_smmlv(anio))})")
+        else:
+            parts.append("💰 **Multa:** según el grado de alcoholemia y la reincidencia (Artículo 152):")
+            for row in self.alcohol_table():
+                parts.append(f"  • {row['descripcion'].rstrip('.')}: {row['smldv']} SMLDV = "
+                             f"{format_pesos(valor_multa(row['smldv'], anio))}")
+        if entry['otras_sanciones'] and entry['vigente']:
+            parts.append(f"⚠️ **Otras sanciones:** {'; '.join(entry['otras_sanciones'])}")
+        return "\n".join(parts)
+
+    def exact_answer(self, query: str, db: Session) -> Optional[Dict]:
+        """
+        Respuesta sin generación para consultas que citan códigos de infracción
+
+        Args:
+            query: Pregunta del usuario
+            db: Sesión de BD (solo para la primera carga)
+
+        Returns:
+            Dict: {'response', 'sources', 'context_used'} como process_query, o
+                None si la consulta no cita ningún código conocido
+        """
+        if not CODE_PATTERN.search(query or ''):
+            return None
+        codes = self.ensure_loaded(db).find_codes(query)[:MAX_CODES_PER_ANSWER]
+        if not codes:
+            return None
+        entries = [self._entries[code] for code in codes]
+        return {
+            "response": "\n\n".join(self.format_entry(entry) for entry in entries),
+            "sources": [
+                {"extracto": entry['texto'][:300] + "...", "pagina": entry['pagina'],
+                 "archivo": entry['fuente'] or "documento"}
+                for entry in entries
+            ],
+            "context_used": True
+        }
+
+
+def replace_fines(db: Session, fines: List[Dict], fuente: str) -> int:
+    """
+    Reemplaza el contenido de la tabla de infracciones en una transacción
+
+    Args:
+        db: Sesión de base de datos
+        fines: Filas de extract_fines
+        fuente: Nombre del PDF de origen
+
+    Returns:
+        int: Número de infracciones guardadas
+    """
+    try:
+        db.execute(delete(Infraccion))
+        if fines:
+            db.execute(insert(Infraccion), [{**fine, 'fuente': fuente} for fine in fines])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    fine_store.invalidate()
+    return len(fines)
+
+
+# Instancia global
+fine_store = FineStore(empty_retry_seconds=Config.FINE_TABLE_EMPTY_RETRY_SECONDS)
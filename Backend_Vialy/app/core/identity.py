@@ -0,0 +1,248 @@
+"""
+Identidad del usuario en los requests autenticados.
+
+El JWT se valida una sola vez por request (decorador `authenticated`) y el
+resultado queda en `g.user_id`. Los registros de usuario y el acceso a sus
+conversaciones se guardan en caches con TTL para que autorizar un request no
+consulte la BD en el caso común; las escrituras de este proceso invalidan o
+actualizan las entradas y el TTL acota lo que cambie en otros procesos.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import wraps
+from typing import Dict, Optional
+
+from flask import g, jsonify, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from sqlalchemy.orm import Session
+
+from app.config.database import bind_request_user, get_request_db
+from app.config.settings import Config
+from app.models.models import Conversation, Usuario
+
+logger = logging.getLogger(__name__)
+
+UserRecord = namedtuple('UserRecord', 'id email first_name last_name')
+# Lo necesario para autorizar y leer una conversación sin cargarla
+ConversationAccess = namedtuple('ConversationAccess', 'status archived')
+
+_MISSING = object()
+
+
+class IdentityError(Exception):
+    """Request sin identidad válida; `status` es el código HTTP a devolver"""
+
+    def __init__(self, message: str, status: int = 401):
+        super().__init__(message)
+        self.status = status
+
+
+class TTLCache:
+    """Cache LRU acotada cuyas entradas vencen `ttl_seconds` después de guardarse"""
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 300):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self._items: "OrderedDict[object, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=_MISSING):
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or now - item[1] > self.ttl:
+                if item is not None:
+                    del self._items[key]
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = (value, time.monotonic())
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def update(self, key, fn):
+        """Reemplaza el valor guardado por fn(valor) si la entrada existe (sin renovar el TTL)"""
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items[key] = (fn(item[0]), item[1])
+
+    def discard(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class IdentityCache:
+    """
+    Usuarios (incluidos los inexistentes, para no consultar la BD con ids
+    inválidos) y, por usuario, sus conversaciones con estado y si tienen
+    mensajes archivados. Los valores guardados no se modifican: se reemplazan.
+    """
+
+    def __init__(self, ttl_seconds: float = 300, max_users: int = 10000, negative_ttl_seconds: float = 10):
+        self.users = TTLCache(max_users, ttl_seconds)
+        self.conversations = TTLCache(max_users, ttl_seconds)
+        # (usuario, conversación) ajena o inexistente ya verificada en la BD
+        self.denied = TTLCache(max_users, negative_ttl_seconds)
+
+    def get_user(self, db: Session, user_id: int) -> Optional[UserRecord]:
+        """Registro del usuario o None si no existe"""
+        record = self.users.get(user_id)
+        if record is _MISSING:
+            row = db.query(Usuario.id, Usuario.email, Usuario.first_name, Usuario.last_name) \
+                .filter(Usuario.id == user_id).first()
+            record = UserRecord(*row) if row else None
+            self.users.put(user_id, record)
+        return record
+
+    def remember_user(self, usuario: Usuario):
+        """Guarda un usuario ya cargado (p. ej. la fila leída en el login)"""
+        self.users.put(usuario.id, UserRecord(usuario.id, usuario.email, usuario.first_name, usuario.last_name))
+
+    def user_conversations(self, db: Session, user_id: int) -> Dict[int, ConversationAccess]:
+        """Conversaciones del usuario, en una sola consulta por usuario y TTL"""
+        owned = self.conversations.get(user_id)
+        if owned is _MISSING:
+            rows = db.query(Conversation.id, Conversation.status, Conversation.archived_at) \
+                .filter(Conversation.usuario_id == user_id).all()
+            owned = {cid: ConversationAccess(status, archived_at is not None) for cid, status, archived_at in rows}
+            self.conversations.put(user_id, owned)
+        return owned
+
+    def conversation_access(self, db: Session, user_id: int, conversation_id: int) -> Optional[ConversationAccess]:
+        """
+        Acceso del usuario a la conversación, o None si no es suya (o no existe)
+
+        Los IDs son crecientes: una conversación creada en otro proceso después
+        de llenar la cache tiene un ID mayor que todas las guardadas, así que
+        solo esos IDs se buscan en la BD (y solo las conversaciones nuevas). El
+        rechazo se recuerda unos segundos para que repetir un ID ajeno no
+        consulte la BD cada vez.
+        """
+        owned = self.user_conversations(db, user_id)
+        access = owned.get(conversation_id)
+        if access is not None or conversation_id <= max(owned, default=0):
+            return access
+        if self.denied.get((user_id, conversation_id), None) is not None:
+            return None
+
+        newest = max(owned, default=0)
+        rows = db.query(Conversation.id, Conversation.status, Conversation.archived_at) \
+            .filter(Conversation.usuario_id == user_id, Conversation.id > newest).all()
+        created = {cid: ConversationAccess(status, archived_at is not None) for cid, status, archived_at in rows}
+        if created:
+            self.conversations.update(user_id, lambda current: {**current, **created})
+        access = created.get(conversation_id)
+        if access is None:
+            self.denied.put((user_id, conversation_id), True)
+        return access
+
+    def add_conversation(self, user_id: int, conversation_id: int, status: str = 'activa'):
+        """Registra una conversación recién creada sin descartar la entrada del usuario"""
+        self.denied.discard((user_id, conversation_id))
+        self.conversations.update(
+            user_id, lambda owned: {**owned, conversation_id: ConversationAccess(status, False)}
+        )
+
+    def invalidate_user(self, user_id: int):
+        self.users.discard(user_id)
+        self.conversations.discard(user_id)
+
+    def invalidate_conversations(self, user_id: Optional[int] = None):
+        """Descarta las conversaciones de un usuario (o de todos)"""
+        if user_id is None:
+            self.conversations.clear()
+            self.denied.clear()
+        else:
+            self.conversations.discard(user_id)
+
+    def stats(self) -> dict:
+        return {
+            "users": {"size": len(self.users), "hits": self.users.hits, "misses": self.users.misses},
+            "conversations": {"size": len(self.conversations), "hits": self.conversations.hits,
+                              "misses": self.conversations.misses},
+            "denied": {"size": len(self.denied), "hits": self.denied.hits, "misses": self.denied.misses},
+        }
+
+
+# Instancia global
+identity_cache = IdentityCache(
+    ttl_seconds=Config.IDENTITY_CACHE_TTL_SECONDS,
+    max_users=Config.IDENTITY_CACHE_MAX_USERS,
+    negative_ttl_seconds=Config.IDENTITY_CACHE_NEGATIVE_TTL_SECONDS
+)
+
+
+def resolve_identity(allow_header: bool = False) -> int:
+    """
+    Identifica al usuario del request: el JWT (validado una sola vez) y, si
+    `allow_header` y ALLOW_USER_ID_HEADER lo permiten, el header X-User-ID
+    como alternativa. Si vienen ambos, deben coincidir.
+
+    Returns:
+        int: ID del usuario (también en g.user_id)
+
+    Raises:
+        IdentityError: Sin identidad, identidades distintas o usuario inexistente
+    """
+    if 'user_id' in g:
+        return g.user_id
+
+    verify_jwt_in_request(optional=allow_header)
+    identity = get_jwt_identity()
+    token_user = int(identity) if identity is not None else None
+
+    header = request.headers.get("X-User-ID") if allow_header else None
+    header_user = None
+    if header:
+        try:
+            header_user = int(header)
+        except ValueError:
+            raise IdentityError("X-User-ID debe ser un entero", 400)
+
+    if token_user is not None and header_user is not None and token_user != header_user:
+        raise IdentityError("X-User-ID no coincide con el token", 403)
+    user_id = token_user if token_user is not None else (header_user if Config.ALLOW_USER_ID_HEADER else None)
+    if user_id is None:
+        raise IdentityError("Se requiere autenticación (Authorization: Bearer o X-User-ID)")
+
+    bind_request_user(user_id)
+    if identity_cache.get_user(get_request_db(), user_id) is None:
+        raise IdentityError("Usuario no encontrado")
+    g.user_id = user_id
+    return user_id
+
+
+def authenticated(allow_header: bool = False):
+    """
+    Decorador: resuelve la identidad antes de la vista (en lugar de
+    @jwt_required + get_jwt_identity). La vista lee el usuario de g.user_id.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                resolve_identity(allow_header=allow_header)
+            except IdentityError as e:
+                return jsonify({'error': str(e)}), e.status
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
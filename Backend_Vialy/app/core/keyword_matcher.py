@@ -0,0 +1,188 @@
+"""
+Detección de palabras clave en consultas y mensajes.
+
+Las listas de palabras clave (categorías, intención e infracciones) se
+definen una sola vez aquí y se compilan en una única expresión regular: una
+pasada sobre el texto, sin tildes ni mayúsculas y respetando los límites de
+palabra, devuelve los puntajes por categoría, la intención y las
+infracciones mencionadas.
+"""
+
+import re
+import unicodedata
+from collections import namedtuple
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Tuple
+
+# Palabras clave por categoría de consulta
+CATEGORY_KEYWORDS = {
+    'MULTA': [
+        'multa', 'sanción', 'penalización', 'cuánto', 'cuesta', 'valor',
+        'infracción', 'comparendo', 'pagar', 'cuanto cuesta', 'precio',
+        'costo', 'fotomulta', 'sancionado', 'penalizado', 'castigo',
+        'sanciones', 'infracciones', 'comparendos', 'pena'
+    ],
+    'REQUISITO': [
+        'documento', 'requisito', 'necesito', 'tramite', 'permiso',
+        'llevar', 'presentar', 'documentos', 'requisitos', 'papeles',
+        'certificado', 'licencia', 'soat', 'seguro', 'tarjeta',
+        'necesarios', 'obligatorio', 'debo llevar', 'que necesito',
+        'documentación', 'cedula', 'identidad'
+    ],
+    'NORMATIVA': [
+        'ley', 'artículo', 'norma', 'código', 'dice', 'establece',
+        'legal', 'articulo', 'legislación', 'reglamento',
+        'normativa', 'permitido', 'prohibido', 'puede', 'debo',
+        'obligatorio', 'está prohibido', 'se permite', 'decreto', 'resolución'
+    ],
+    'PROCEDIMIENTO': [
+        'cómo', 'pasos', 'proceso', 'renovar', 'obtener', 'hacer',
+        'dónde', 'donde', 'trámite', 'procedimiento', 'solicitar',
+        'como hacer', 'como obtener', 'como renovar', 'gestionar',
+        'realizar', 'efectuar', 'adelantar', 'como se hace'
+    ]
+}
+
+# Intención del usuario (1=Información por defecto); gana la de mayor número
+INTENT_KEYWORDS = {
+    # Asesoría
+    3: ['cómo', 'como', 'pasos', 'proceso', 'debo', 'debería',
+        'me conviene', 'qué hago', 'que hago', 'ayuda'],
+    # Explicación
+    2: ['qué es', 'que es', 'por qué', 'por que', 'explica',
+        'funciona', 'significa', 'diferencia', 'cuál es', 'cual es'],
+}
+
+# Infracciones comunes y sus códigos de artículo
+COMMON_INFRACTIONS = {
+    'exceso_velocidad': {'article': '29', 'category': 'MULTA', 'keywords': ['exceso', 'velocidad', 'rápido', 'límite']},
+    'sin_licencia': {'article': 'D.1', 'category': 'MULTA', 'keywords': ['licencia', 'sin', 'no tiene']},
+    'no_usar_cinturon': {'article': '6', 'category': 'MULTA', 'keywords': ['cinturón', 'cinturon', 'seguridad']},
+    'semaforo_rojo': {'article': 'D.4', 'category': 'MULTA', 'keywords': ['semáforo', 'rojo', 'roja', 'luz roja']},
+    'sin_soat': {'article': 'D.2', 'category': 'MULTA', 'keywords': ['soat', 'seguro']},
+    'celular': {'article': '38', 'category': 'MULTA', 'keywords': ['celular', 'telefono', 'teléfono', 'mano']},
+    'estacionamiento': {'article': '2', 'category': 'MULTA', 'keywords': ['estacionar', 'estacionamiento', 'parqueo', 'aparcar']},
+}
+
+KeywordMatch = namedtuple('KeywordMatch', 'category scores intent infractions keywords')
+
+# Marcas diacríticas combinables del bloque latino (U+0300-U+036F)
+_LATIN_MARKS = re.compile('[\u0300-\u036f]+')
+
+
+def fold(value: str) -> str:
+    """Minúsculas y sin tildes ('Conducción' -> 'conduccion')"""
+    decomposed = unicodedata.normalize('NFKD', value.lower())
+    if decomposed.isascii():
+        return decomposed
+    # Texto latino: las únicas marcas posibles son las del bloque U+0300-U+036F
+    if max(decomposed) < '\u0370':
+        return _LATIN_MARKS.sub('', decomposed)
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def _trie_pattern(keywords: Iterable[str]) -> str:
+    """
+    Alternancia de las palabras clave agrupada por prefijos comunes
+    ('multa|multas|multar' -> 'multa(?:...)'), con las opciones más largas
+    antes que el final de la palabra para quedarse con la coincidencia más larga
+    """
+    trie: Dict[str, dict] = {}
+    for keyword in keywords:
+        node = trie
+        for ch in keyword:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def build(node: Dict[str, dict]) -> str:
+        branches = [
+            (r'\s+' if ch == ' ' else re.escape(ch)) + build(child)
+            for ch, child in sorted(node.items()) if ch
+        ]
+        if not branches:
+            return ''
+        return '(?:' + '|'.join(branches) + ')' + ('?' if '' in node else '')
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """
+    Todas las palabras clave en una sola expresión regular.
+
+    Cada palabra (o frase) se normaliza con `fold` y se busca como palabra
+    completa, admitiendo el plural y las terminaciones verbales -n/-r
+    ('multa' encuentra 'multas' y 'multar', pero no 'fotomultas'). El patrón es
+    una alternancia dentro de un lookahead anclado al inicio de cada palabra,
+    así las coincidencias pueden solaparse ('cuanto cuesta' y 'cuesta'); en
+    cada posición gana la palabra clave más larga y una frase también cuenta
+    las palabras clave con las que empieza ('como hacer' cuenta 'como').
+    """
+
+    def __init__(self, categories: Dict[str, List[str]], intents: Dict[int, List[str]],
+                 infractions: Dict[str, Dict]):
+        self.categories = list(categories)
+        entries: Dict[str, set] = {}
+
+        def add(keywords: Iterable[str], entry: Tuple[str, object]):
+            for keyword in keywords:
+                entries.setdefault(' '.join(fold(keyword).split()), set()).add(entry)
+
+        for category, keywords in categories.items():
+            add(keywords, ('category', category))
+        for intent, keywords in intents.items():
+            add(keywords, ('intent', intent))
+        for key, data in infractions.items():
+            add(data['keywords'], ('infraction', key))
+
+        self._entries = {keyword: tuple(values) for keyword, values in entries.items()}
+        # Una frase incluye las palabras clave con las que empieza
+        self._prefixes = {
+            keyword: frozenset(prefix for prefix in entries
+                               if keyword == prefix or keyword.startswith(prefix + ' '))
+            for keyword in entries
+        }
+        self._pattern = re.compile(rf'(?<!\w)(?=({_trie_pattern(entries)})(?:e?s|n|r)?(?!\w))')
+        self._empty_scores = {category: 0 for category in self.categories}
+
+    def match(self, text: str) -> KeywordMatch:
+        """
+        Analiza un texto en una pasada
+
+        Args:
+            text: Consulta o mensaje (sin normalizar)
+
+        Returns:
+            KeywordMatch: categoría ('GENERAL' sin coincidencias), puntajes por
+                categoría, intención (1, 2 o 3), infracciones y palabras clave encontradas
+        """
+        matched = {' '.join(m.split()) for m in self._pattern.findall(fold(text or ''))}
+        # Cada palabra clave cuenta una vez por texto, aunque aparezca varias veces
+        found = frozenset().union(*(self._prefixes[keyword] for keyword in matched))
+        scores = dict(self._empty_scores)
+        intent = 1
+        infractions = set()
+        for keyword in found:
+            for kind, value in self._entries[keyword]:
+                if kind == 'category':
+                    scores[value] += 1
+                elif kind == 'intent':
+                    intent = max(intent, value)
+                else:
+                    infractions.add(value)
+
+        # Empates: la primera categoría en el orden de definición
+        best = max(self.categories, key=lambda category: scores[category])
+        category = best if scores[best] > 0 else 'GENERAL'
+        return KeywordMatch(category, MappingProxyType(scores), intent, frozenset(infractions), found)
+
+
+# Instancia global
+keyword_matcher = KeywordMatcher(CATEGORY_KEYWORDS, INTENT_KEYWORDS, COMMON_INFRACTIONS)
+
+
+@lru_cache(maxsize=2048)
+def match_keywords(text: str) -> KeywordMatch:
+    """`keyword_matcher.match` con cache por texto (el resultado es inmutable)"""
+    return keyword_matcher.match(text)
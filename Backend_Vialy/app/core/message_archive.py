@@ -0,0 +1,261 @@
+"""
+Archivo de mensajes (almacenamiento frío).
+
+Los mensajes de conversaciones finalizadas hace más de ARCHIVE_AFTER_DAYS
+salen de `mensajes` y se guardan en `mensajes_archivados`, un bloque por
+conversación y mes con los mensajes serializados y comprimidos con zstd
+(zlib si zstandard no está instalado). La tabla caliente queda solo con las
+conversaciones recientes y las lecturas combinan ambos niveles.
+"""
+
+import heapq
+import json
+import logging
+import zlib
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+from sqlalchemy import exists, insert
+from sqlalchemy.orm import Session
+
+from app.core.identity import identity_cache
+from app.core.message_search import message_search
+from app.core.pagination import decode_cursor
+from app.models.models import Conversation, Message, MessageArchive
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+ZSTD_LEVEL = 10
+ZLIB_LEVEL = 9
+# Tamaño de los lotes de DELETE/INSERT por id (por debajo del límite de parámetros de SQLite)
+ID_CHUNK = 500
+
+# Mismos atributos que las filas de la consulta de mensajes de bd_routes
+ArchivedMessage = namedtuple('ArchivedMessage', 'id sender message created_at')
+
+
+def compress(data: bytes) -> tuple:
+    """
+    Comprime con zstd, o con zlib si zstandard no está instalado
+
+    Returns:
+        tuple: (datos comprimidos, códec)
+    """
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data), 'zstd'
+    return zlib.compress(data, ZLIB_LEVEL), 'zlib'
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    """
+    Descomprime un bloque según su códec
+
+    Raises:
+        RuntimeError: Si el bloque es zstd y zstandard no está instalado
+    """
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    if zstandard is None:
+        raise RuntimeError("El bloque está comprimido con zstd: instala zstandard para leerlo")
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+def _build_block(conversation_id: int, periodo: str, rows: Sequence) -> Dict:
+    payload = json.dumps(
+        [[r.id, r.sender, r.message, r.created_at.isoformat()] for r in rows],
+        ensure_ascii=False, separators=(',', ':')
+    ).encode('utf-8')
+    data, codec = compress(payload)
+    return {
+        "conversacion_id": conversation_id,
+        "periodo": periodo,
+        "message_count": len(rows),
+        "first_created_at": rows[0].created_at,
+        "last_created_at": rows[-1].created_at,
+        "codec": codec,
+        "payload": data,
+        "archived_at": datetime.utcnow()
+    }
+
+
+def _decode_block(block) -> List[ArchivedMessage]:
+    items = json.loads(decompress(block.payload, block.codec).decode('utf-8'))
+    return [ArchivedMessage(i, sender, message, datetime.fromisoformat(created_at))
+            for i, sender, message, created_at in items]
+
+
+def _row_key(row):
+    return row.created_at, row.id
+
+
+def load_archived_messages(db: Session, conversation_id: int) -> List[ArchivedMessage]:
+    """
+    Mensajes archivados de una conversación, ordenados por (created_at, id)
+    """
+    blocks = (
+        db.query(MessageArchive.payload, MessageArchive.codec)
+        .filter(MessageArchive.conversacion_id == conversation_id)
+        .order_by(MessageArchive.periodo, MessageArchive.id)
+        .all()
+    )
+    rows = [row for block in blocks for row in _decode_block(block)]
+    rows.sort(key=_row_key)
+    return rows
+
+
+def archived_page(rows: List[ArchivedMessage], before: Optional[str] = None, after: Optional[str] = None,
+                  descending: bool = False) -> List[ArchivedMessage]:
+    """
+    Aplica a los mensajes archivados el mismo cursor y orden que la consulta de la tabla caliente
+
+    Args:
+        rows: Mensajes de load_archived_messages (orden ascendente)
+        before: Cursor: solo mensajes anteriores
+        after: Cursor: solo mensajes posteriores
+        descending: Devolver en orden descendente
+    """
+    if before:
+        key = decode_cursor(before)
+        rows = [r for r in rows if _row_key(r) < key]
+    elif after:
+        key = decode_cursor(after)
+        rows = [r for r in rows if _row_key(r) > key]
+    return rows[::-1] if descending else rows
+
+
+def merge_tiers(hot: Iterable, archived: Iterable, descending: bool = False) -> Iterator:
+    """
+    Mezcla perezosamente mensajes de ambos niveles, ya ordenados en el mismo sentido
+    """
+    return heapq.merge(archived, hot, key=_row_key, reverse=descending)
+
+
+def archive_messages(db: Session, older_than_days: int, batch_size: int = 100) -> Dict[str, int]:
+    """
+    Mueve al archivo los mensajes de las conversaciones finalizadas antes de
+    `older_than_days` días. Un commit por lote de conversaciones.
+
+    Returns:
+        dict: conversaciones, mensajes y bloques archivados; bytes antes y después de comprimir
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    has_hot_messages = exists().where(Message.conversacion_id == Conversation.id)
+    stats = {"conversations": 0, "messages": 0, "blocks": 0, "raw_bytes": 0, "compressed_bytes": 0}
+
+    last_id = 0
+    while True:
+        ids = [row[0] for row in db.query(Conversation.id)
+               .filter(Conversation.status == 'finalizada', Conversation.ended_at < cutoff,
+                       Conversation.id > last_id, has_hot_messages)
+               .order_by(Conversation.id)
+               .limit(batch_size)]
+        if not ids:
+            break
+
+        rows = (
+            db.query(Message.id, Message.conversacion_id, Message.sender, Message.message, Message.created_at)
+            .filter(Message.conversacion_id.in_(ids))
+            .order_by(Message.conversacion_id, Message.created_at, Message.id)
+            .all()
+        )
+        groups = defaultdict(list)
+        for row in rows:
+            groups[(row.conversacion_id, row.created_at.strftime('%Y-%m'))].append(row)
+        blocks = [_build_block(conv_id, periodo, group) for (conv_id, periodo), group in groups.items()]
+
+        try:
+            db.execute(insert(MessageArchive), blocks)
+            # Se borran exactamente los mensajes leídos: los que lleguen durante el lote siguen calientes
+            message_ids = [row.id for row in rows]
+            # La búsqueda cubre solo la tabla caliente
+            message_search.unindex_messages(db, message_ids)
+            for start in range(0, len(message_ids), ID_CHUNK):
+                db.query(Message).filter(Message.id.in_(message_ids[start:start + ID_CHUNK])) \
+                    .delete(synchronize_session=False)
+            db.query(Conversation).filter(Conversation.id.in_(ids)) \
+                .update({Conversation.archived_at: datetime.utcnow()}, synchronize_session=False)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        stats["conversations"] += len(ids)
+        stats["messages"] += len(rows)
+        stats["blocks"] += len(blocks)
+        stats["raw_bytes"] += sum(len(row.message.encode('utf-8')) for row in rows)
+        stats["compressed_bytes"] += sum(len(block["payload"]) for block in blocks)
+        last_id = ids[-1]
+        logger.info(f"Archivadas {stats['conversations']} conversaciones ({stats['messages']} mensajes)")
+    if stats["conversations"]:
+        identity_cache.invalidate_conversations()
+    return stats
+
+
+def restore_messages(db: Session, conversation_ids: Optional[List[int]] = None, periodo: Optional[str] = None,
+                     batch_size: int = 100) -> Dict[str, int]:
+    """
+    Devuelve mensajes archivados a la tabla caliente (con sus ids originales)
+
+    Args:
+        db: Sesión de base de datos
+        conversation_ids: Restaurar solo estas conversaciones
+        periodo: Restaurar solo este mes ('YYYY-MM')
+        batch_size: Bloques por transacción
+
+    Returns:
+        dict: bloques y mensajes restaurados
+    """
+    query = db.query(MessageArchive)
+    if conversation_ids:
+        query = query.filter(MessageArchive.conversacion_id.in_(conversation_ids))
+    if periodo:
+        query = query.filter(MessageArchive.periodo == periodo)
+
+    stats = {"blocks": 0, "messages": 0}
+    last_id = 0
+    while True:
+        blocks = query.filter(MessageArchive.id > last_id).order_by(MessageArchive.id).limit(batch_size).all()
+        if not blocks:
+            break
+        rows = [
+            {"id": row.id, "conversacion_id": block.conversacion_id, "sender": row.sender,
+             "message": row.message, "created_at": row.created_at}
+            for block in blocks for row in _decode_block(block)
+        ]
+        touched = {block.conversacion_id for block in blocks}
+        try:
+            # SQLite reutiliza ids al borrar los más altos: si el original ya existe, se asigna uno nuevo
+            taken = set()
+            for start in range(0, len(rows), ID_CHUNK):
+                chunk_ids = [row["id"] for row in rows[start:start + ID_CHUNK]]
+                taken.update(i for (i,) in db.query(Message.id).filter(Message.id.in_(chunk_ids)))
+            with_id = [row for row in rows if row["id"] not in taken]
+            without_id = [{k: v for k, v in row.items() if k != "id"} for row in rows if row["id"] in taken]
+            for batch in (with_id, without_id):
+                for start in range(0, len(batch), ID_CHUNK):
+                    db.execute(insert(Message), batch[start:start + ID_CHUNK])
+            for block in blocks:
+                db.delete(block)
+            db.flush()
+            message_search.index_conversations(db, list(touched))
+            # Conversaciones sin bloques restantes vuelven a estar completas en la tabla caliente
+            db.query(Conversation).filter(
+                Conversation.id.in_(touched),
+                ~exists().where(MessageArchive.conversacion_id == Conversation.id)
+            ).update({Conversation.archived_at: None}, synchronize_session=False)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        stats["blocks"] += len(blocks)
+        stats["messages"] += len(rows)
+        last_id = blocks[-1].id
+    if stats["blocks"]:
+        identity_cache.invalidate_conversations()
+    return stats
@@ -0,0 +1,356 @@
+"""
+Búsqueda de texto completo en el historial de mensajes.
+
+El texto se analiza en Python (minúsculas, sin tildes, sin palabras vacías y
+con un stemmer ligero del español) y los términos resultantes se guardan en
+un índice auxiliar `mensajes_fts`, propio de cada motor:
+
+- SQLite: tabla virtual FTS5, ranking bm25
+- PostgreSQL: columna tsvector con índice GIN, ranking ts_rank_cd
+- MySQL: índice FULLTEXT, ranking de MATCH ... AGAINST
+
+Analizar en Python hace que los tres motores indexen exactamente los mismos
+términos (PostgreSQL no quita tildes sin la extensión unaccent y MySQL no
+tiene stemming). El índice se mantiene al insertar mensajes y solo cubre la
+tabla caliente: los mensajes archivados salen de él y vuelven al restaurarlos.
+"""
+
+import logging
+import re
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import column, func, inspect, insert, literal_column, select, table, text
+from sqlalchemy.dialects.mysql import match as mysql_match
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.config.settings import Config
+from app.core.keyword_matcher import fold
+from app.models.models import Conversation, Message
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TABLE = 'mensajes_fts'
+# Tamaño de los lotes de reindexación y de los IN por id
+INDEX_CHUNK = 500
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a al algo ante antes como con contra cual cuando de del desde donde durante e el ella ellas ellos en
+entre era es esa ese eso esta este esto estos estas fue ha hay la las le les lo los mas me mi mis muy
+ni no nos o otra otro para pero por porque que quien se segun sea ser si sin sobre su sus tambien te
+tiene tu un una unas unos y ya yo
+""".split())
+
+# Sufijos derivativos, del más largo al más corto (ya sin tildes)
+_SUFFIXES = (
+    'amientos', 'imientos', 'aciones', 'uciones', 'amiento', 'imiento', 'idades', 'mente',
+    'acion', 'ucion', 'cion', 'idad', 'ivas', 'ivos', 'iva', 'ivo', 'ar', 'er', 'ir',
+)
+
+
+def stem(word: str) -> str:
+    """
+    Stemmer ligero del español: quita un sufijo derivativo o el plural y la
+    vocal final ('multas' -> 'mult', 'licencias' -> 'licenci'). La búsqueda usa
+    los términos como prefijo, así que basta con que sea consistente.
+    """
+    if len(word) <= 4 or word.isdigit():
+        return word
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            return word[:-len(suffix)]
+    if word.endswith('es') and len(word) > 5 and word[-3] not in 'aeiou':
+        word = word[:-2]
+    elif word.endswith('s'):
+        word = word[:-1]
+    if word[-1] in 'aeo' and len(word) > 4:
+        word = word[:-1]
+    return word
+
+
+def analyze(value: str) -> List[str]:
+    """Términos indexables de un texto, en orden y sin palabras vacías"""
+    return [stem(token) for token in _TOKEN_RE.findall(fold(value or '')) if token not in STOPWORDS]
+
+
+def query_terms(value: str) -> List[str]:
+    """Términos únicos de una consulta, en el orden en que aparecen"""
+    return list(dict.fromkeys(analyze(value)))
+
+
+class _SearchBackend:
+    """Operaciones del índice que dependen del motor de base de datos"""
+
+    key = 'message_id'
+
+    def __init__(self):
+        self.fts = table(SEARCH_TABLE, column(self.key), column('usuario_id'), column('terms'), column('tsv'))
+
+    def ddl(self) -> List[str]:
+        raise NotImplementedError
+
+    def upsert(self, db: Session, entries: List[Dict]):
+        raise NotImplementedError
+
+    def match(self, user_id: int, terms: List[str]):
+        """Predicado de coincidencia (incluye el filtro por usuario)"""
+        raise NotImplementedError
+
+    def score(self, terms: List[str]):
+        """Puntaje de relevancia: mayor es mejor"""
+        raise NotImplementedError
+
+
+class _SqliteSearch(_SearchBackend):
+    key = 'rowid'
+
+    def ddl(self) -> List[str]:
+        # `owner` es un token 'u<id>' para que FTS5 filtre por usuario dentro del MATCH
+        return [f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(terms, owner)"]
+
+    def upsert(self, db: Session, entries: List[Dict]):
+        db.execute(text(f"INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, terms, owner) "
+                        f"VALUES (:id, :terms, 'u' || :usuario_id)"), entries)
+
+    def match(self, user_id: int, terms: List[str]):
+        expression = ' AND '.join(f'"{term}"*' for term in terms)
+        return literal_column(SEARCH_TABLE).op('MATCH')(f"owner:u{int(user_id)} AND terms:({expression})")
+
+    def score(self, terms: List[str]):
+        # bm25 es menor cuanto más relevante; la columna owner no cuenta
+        return -func.bm25(literal_column(SEARCH_TABLE), 1.0, 0.0)
+
+
+class _PostgresSearch(_SearchBackend):
+
+    def ddl(self) -> List[str]:
+        return [
+            f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} (message_id BIGINT PRIMARY KEY, "
+            f"usuario_id INTEGER NOT NULL, tsv TSVECTOR NOT NULL)",
+            f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_tsv ON {SEARCH_TABLE} USING GIN (tsv)",
+            f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_usuario ON {SEARCH_TABLE} (usuario_id)",
+        ]
+
+    def upsert(self, db: Session, entries: List[Dict]):
+        db.execute(text(
+            f"INSERT INTO {SEARCH_TABLE} (message_id, usuario_id, tsv) "
+            f"VALUES (:id, :usuario_id, to_tsvector('simple', :terms)) "
+            f"ON CONFLICT (message_id) DO UPDATE SET usuario_id = EXCLUDED.usuario_id, tsv = EXCLUDED.tsv"
+        ), entries)
+
+    def _tsquery(self, terms: List[str]):
+        return func.to_tsquery('simple', ' & '.join(f"{term}:*" for term in terms))
+
+    def match(self, user_id: int, terms: List[str]):
+        return (self.fts.c.usuario_id == user_id) & self.fts.c.tsv.op('@@')(self._tsquery(terms))
+
+    def score(self, terms: List[str]):
+        return func.ts_rank_cd(self.fts.c.tsv, self._tsquery(terms))
+
+
+class _MySQLSearch(_SearchBackend):
+
+    def ddl(self) -> List[str]:
+        # CREATE INDEX IF NOT EXISTS no existe en MySQL: los índices van en la tabla
+        return [
+            f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} (message_id BIGINT PRIMARY KEY, "
+            f"usuario_id INT NOT NULL, terms TEXT NOT NULL, KEY ix_{SEARCH_TABLE}_usuario (usuario_id), "
+            f"FULLTEXT KEY ix_{SEARCH_TABLE}_terms (terms)) ENGINE=InnoDB"
+        ]
+
+    def upsert(self, db: Session, entries: List[Dict]):
+        db.execute(text(f"REPLACE INTO {SEARCH_TABLE} (message_id, usuario_id, terms) "
+                        f"VALUES (:id, :usuario_id, :terms)"), entries)
+
+    def _against(self, terms: List[str]):
+        return mysql_match(self.fts.c.terms, against=' '.join(f"+{term}*" for term in terms)).in_boolean_mode()
+
+    def match(self, user_id: int, terms: List[str]):
+        return (self.fts.c.usuario_id == user_id) & self._against(terms)
+
+    def score(self, terms: List[str]):
+        return self._against(terms)
+
+
+_BACKENDS = {'sqlite': _SqliteSearch, 'postgresql': _PostgresSearch, 'mysql': _MySQLSearch,
+             'mariadb': _MySQLSearch}
+
+
+class MessageSearchIndex:
+    """
+    Índice de búsqueda de mensajes. Se activa en `ensure_index` según el motor;
+    si el motor no lo soporta, las operaciones de escritura no hacen nada y
+    `search` no está disponible.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.requested = enabled
+        self.backend: Optional[_SearchBackend] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    def ensure_index(self, engine: Engine):
+        """Crea el índice si falta y, si es nuevo, lo llena con los mensajes existentes"""
+        if not self.requested:
+            return
+        backend_cls = _BACKENDS.get(engine.dialect.name)
+        if backend_cls is None:
+            logger.warning(f"⚠️ Búsqueda de mensajes no soportada en {engine.dialect.name}")
+            return
+        backend = backend_cls()
+        created = not inspect(engine).has_table(SEARCH_TABLE)
+        try:
+            with engine.begin() as conn:
+                for statement in backend.ddl():
+                    conn.execute(text(statement))
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo crear el índice de búsqueda, búsqueda desactivada: {str(e)}")
+            return
+        self.backend = backend
+        if created:
+            from app.config.database import SessionLocal
+            db = SessionLocal()
+            try:
+                indexed = self.rebuild(db)
+                if indexed:
+                    logger.info(f"✅ Índice de búsqueda creado con {indexed} mensajes")
+            finally:
+                SessionLocal.remove()
+
+    def index(self, db: Session, rows: Iterable[Dict], usuario_id: Optional[int] = None):
+        """
+        Indexa mensajes recién insertados (filas con id, conversacion_id y message).
+        No hace commit: va en la misma transacción que el INSERT.
+
+        Args:
+            db: Sesión de base de datos
+            rows: Mensajes a indexar
+            usuario_id: Dueño de todas las filas, si el llamador ya lo conoce (evita consultarlo)
+        """
+        if not self.enabled:
+            return
+        rows = [row for row in rows if row.get("id") is not None]
+        if not rows:
+            return
+        conversation_ids = {row["conversacion_id"] for row in rows}
+        if usuario_id is not None:
+            owners = dict.fromkeys(conversation_ids, usuario_id)
+        else:
+            owners = dict(db.query(Conversation.id, Conversation.usuario_id)
+                          .filter(Conversation.id.in_(conversation_ids)))
+        entries = []
+        for row in rows:
+            terms = ' '.join(analyze(row["message"]))
+            if terms and row["conversacion_id"] in owners:
+                entries.append({"id": row["id"], "usuario_id": owners[row["conversacion_id"]], "terms": terms})
+        if entries:
+            self.backend.upsert(db, entries)
+
+    def unindex_messages(self, db: Session, message_ids: List[int]):
+        """Quita mensajes del índice (antes o después de borrarlos)"""
+        if not self.enabled or not message_ids:
+            return
+        key = self.backend.fts.c[self.backend.key]
+        for start in range(0, len(message_ids), INDEX_CHUNK):
+            db.execute(self.backend.fts.delete().where(key.in_(message_ids[start:start + INDEX_CHUNK])))
+
+    def unindex_conversations(self, db: Session, conversation_ids: List[int]):
+        """Quita del índice los mensajes de estas conversaciones. Llamar antes de borrarlos."""
+        if not self.enabled or not conversation_ids:
+            return
+        key = self.backend.fts.c[self.backend.key]
+        message_ids = select(Message.id).where(Message.conversacion_id.in_(conversation_ids))
+        db.execute(self.backend.fts.delete().where(key.in_(message_ids)))
+
+    def index_conversations(self, db: Session, conversation_ids: List[int]):
+        """(Re)indexa todos los mensajes calientes de estas conversaciones"""
+        if not self.enabled or not conversation_ids:
+            return
+        rows = db.query(Message.id, Message.conversacion_id, Message.message) \
+            .filter(Message.conversacion_id.in_(conversation_ids)).all()
+        for start in range(0, len(rows), INDEX_CHUNK):
+            self.index(db, [row._asdict() for row in rows[start:start + INDEX_CHUNK]])
+
+    def rebuild(self, db: Session, batch_size: int = INDEX_CHUNK) -> int:
+        """
+        Reconstruye el índice completo por lotes de ids de mensaje, un commit por lote
+
+        Returns:
+            int: Mensajes indexados
+        """
+        if not self.enabled:
+            return 0
+        db.execute(self.backend.fts.delete())
+        db.commit()
+        indexed = 0
+        last_id = 0
+        while True:
+            rows = (db.query(Message.id, Message.conversacion_id, Message.message)
+                    .filter(Message.id > last_id).order_by(Message.id).limit(batch_size).all())
+            if not rows:
+                break
+            self.index(db, [row._asdict() for row in rows])
+            db.commit()
+            indexed += len(rows)
+            last_id = rows[-1].id
+        return indexed
+
+    def search(self, db: Session, user_id: int, query: str, limit: int = 20, offset: int = 0,
+               conversation_id: Optional[int] = None) -> List:
+        """
+        Mensajes del usuario que contienen todos los términos de la consulta
+        (como prefijo), ordenados por relevancia y luego del más reciente.
+
+        Args:
+            db: Sesión de base de datos
+            user_id: Dueño de las conversaciones
+            query: Texto libre
+            limit: Tamaño de página
+            offset: Resultados a saltar
+            conversation_id: Restringir a una conversación
+
+        Returns:
+            list: Filas con id, conversacion_id, session_id, sender, message, created_at y score
+        """
+        terms = query_terms(query)
+        if not self.enabled or not terms:
+            return []
+        backend = self.backend
+        score = backend.score(terms).label('score')
+        stmt = (
+            select(Message.id, Message.conversacion_id, Conversation.session_id, Message.sender,
+                   Message.message, Message.created_at, score)
+            .select_from(backend.fts)
+            .join(Message, Message.id == backend.fts.c[backend.key])
+            .join(Conversation, Conversation.id == Message.conversacion_id)
+            .where(backend.match(user_id, terms), Conversation.usuario_id == user_id)
+            .order_by(score.desc(), Message.created_at.desc(), Message.id.desc())
+            .limit(limit).offset(offset)
+        )
+        if conversation_id is not None:
+            stmt = stmt.where(Message.conversacion_id == conversation_id)
+        return db.execute(stmt).all()
+
+
+def insert_message_rows(db: Session, rows: List[Dict]) -> List[Dict]:
+    """
+    Inserta mensajes en bloque y devuelve lo que necesita el índice (id,
+    conversacion_id y message de cada fila). Usa RETURNING en un solo INSERT
+    donde el motor lo soporta; MySQL inserta fila a fila.
+    """
+    if db.get_bind().dialect.insert_executemany_returning:
+        # Cada fila devuelta trae su propio texto: no hace falta preservar el orden
+        result = db.execute(insert(Message).returning(Message.id, Message.conversacion_id, Message.message), rows)
+        return [row._asdict() for row in result]
+    return [
+        {**row, "id": db.execute(insert(Message.__table__).values(**row)).inserted_primary_key[0]}
+        for row in rows
+    ]
+
+
+# Instancia global (el índice se crea en init_db)
+message_search = MessageSearchIndex(enabled=Config.MESSAGE_SEARCH_ENABLED)
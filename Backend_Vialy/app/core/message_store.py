@@ -0,0 +1,482 @@
+"""
+Persistencia de mensajes de chat.
+Inserción en bloque y escritura diferida (write-behind) opcional con archivo de respaldo.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import case, insert, or_
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.orm import Session
+
+from app.config.database import SessionLocal
+from app.config.settings import Config
+from app.core.active_sessions import active_sessions_counter
+from app.core.message_search import insert_message_rows, message_search
+from app.models.models import Conversation, Message
+
+logger = logging.getLogger(__name__)
+
+
+def build_message_row(conversation_id: int, sender: str, message: str,
+                      created_at: Optional[datetime] = None) -> Dict:
+    """Crea la fila de un mensaje lista para insertar"""
+    return {
+        "conversacion_id": conversation_id,
+        "sender": sender,
+        "message": message,
+        "created_at": created_at or datetime.utcnow()
+    }
+
+
+def build_turn_rows(conversation_id: int, user_message: str, assistant_message: str,
+                    created_at: Optional[datetime] = None) -> List[Dict]:
+    """
+    Crea las filas de un turno (pregunta y respuesta). La respuesta queda un
+    microsegundo después: cada mensaje pendiente tiene su propia fecha y los
+    cursores de página pueden separarlos.
+    """
+    created_at = created_at or datetime.utcnow()
+    return [
+        build_message_row(conversation_id, 'usuario', user_message, created_at),
+        build_message_row(conversation_id, 'chatbot', assistant_message, created_at + timedelta(microseconds=1))
+    ]
+
+
+def touch_conversations(db: Session, rows: List[Dict]) -> int:
+    """
+    Actualiza el resumen desnormalizado de las conversaciones que recibieron
+    mensajes (conteo, fecha y vista previa del último) y las marca como activas.
+    Sentencias UPDATE por ID, sin leer las conversaciones.
+
+    Args:
+        db: Sesión de base de datos
+        rows: Filas de mensajes ya insertados en esta transacción
+
+    Returns:
+        int: Conversaciones finalizadas que volvieron a estar activas (para
+        ajustar active_sessions_counter después del commit)
+    """
+    by_conversation: Dict[int, List[Dict]] = defaultdict(list)
+    for row in rows:
+        by_conversation[row["conversacion_id"]].append(row)
+
+    reactivated = 0
+    for conversation_id, conv_rows in by_conversation.items():
+        # Casi siempre no cambia ninguna fila: la conversación ya está activa
+        reactivated += db.query(Conversation).filter(
+            Conversation.id == conversation_id, Conversation.status != 'activa'
+        ).update({Conversation.status: 'activa', Conversation.ended_at: None}, synchronize_session=False)
+        # max() conserva el primero en empates: usar el último insertado
+        last = max(reversed(conv_rows), key=lambda row: row["created_at"])
+        # Un lote atrasado (p. ej. recuperado del spill) no debe retroceder el último mensaje
+        is_newer = or_(Conversation.last_message_at.is_(None), Conversation.last_message_at <= last["created_at"])
+        db.query(Conversation).filter(Conversation.id == conversation_id).update(
+            {
+                Conversation.message_count: Conversation.message_count + len(conv_rows),
+                Conversation.last_message_at: case((is_newer, last["created_at"]), else_=Conversation.last_message_at),
+                Conversation.last_message_preview: case(
+                    (is_newer, last["message"][:100]), else_=Conversation.last_message_preview
+                )
+            },
+            synchronize_session=False
+        )
+    return reactivated
+
+
+def insert_messages(db: Session, rows: List[Dict], usuario_id: Optional[int] = None) -> int:
+    """
+    Inserta mensajes en bloque, los agrega al índice de búsqueda y actualiza
+    el resumen de sus conversaciones.
+    No hace commit: el llamador controla la transacción.
+
+    Args:
+        db: Sesión de base de datos
+        rows: Filas creadas con build_message_row
+        usuario_id: Dueño de las conversaciones, si se conoce (el índice no lo consulta)
+
+    Returns:
+        int: Conversaciones reactivadas (ver touch_conversations)
+    """
+    if not rows:
+        return 0
+    if message_search.enabled:
+        # El índice necesita los ids: las filas originales no se modifican (son las del spill)
+        message_search.index(db, insert_message_rows(db, rows), usuario_id=usuario_id)
+    else:
+        db.execute(insert(Message), rows)
+    return touch_conversations(db, rows)
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class WriteBehindWriter:
+    """
+    Cola acotada de mensajes que un hilo en segundo plano persiste en bloque
+    cada `flush_interval_ms` o cada `batch_size` filas.
+
+    Si la BD no está disponible, los lotes se guardan en un archivo JSONL
+    (spill) que se reintenta después: tras cada lote escrito y, sin tráfico,
+    cada `spill_retry_seconds`. Cada proceso escribe su propio archivo
+    (`<spill>.<pid>.jsonl`): solo él lo lee y lo borra, y libera sus
+    pendientes al recuperarlo; los archivos de procesos que ya no existen los
+    adopta el primero que los encuentra. Si la BD rechaza filas concretas (p. ej.
+    una FK a una conversación eliminada), el lote se reintenta fila por fila y
+    solo las rechazadas van al archivo de descartes (dead letter), que no se
+    reintenta. Los mensajes aún no persistidos se pueden consultar con
+    `pending_for` para que las lecturas los incluyan.
+    """
+
+    def __init__(self, enabled: bool = False, max_queue: int = 10000, batch_size: int = 200,
+                 flush_interval_ms: int = 200, spill_path: Optional[str] = None,
+                 dead_letter_path: Optional[str] = None, spill_retry_seconds: float = 30):
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.spill_path = spill_path
+        self.dead_letter_path = dead_letter_path
+        self.spill_retry = spill_retry_seconds
+        self._last_replay = 0.0
+        self._queue: "queue.Queue[List[Dict]]" = queue.Queue(maxsize=max_queue)
+        self._pending: Dict[int, List[Dict]] = defaultdict(list)
+        self._pending_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        # Una sola escritura a la BD a la vez (hilo escritor, stop y discard)
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Inicia el hilo escritor (idempotente)"""
+        if not self.enabled or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="message-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        logger.info(f"✅ Escritura diferida de mensajes activa (lote={self.batch_size}, "
+                    f"intervalo={int(self.flush_interval * 1000)} ms)")
+
+    def stop(self, timeout: float = 10.0):
+        """Detiene el hilo y persiste todo lo pendiente"""
+        if not self._thread:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        # Si el hilo sigue escribiendo (BD lenta) no se compite con él: lo que quede va al spill
+        writer_alive = self._thread.is_alive()
+        self._thread = None
+        while True:
+            batch = self._drain(block=False)
+            if not batch:
+                break
+            if writer_alive:
+                self._spill(self._live(batch))
+            else:
+                self._flush(batch)
+        if writer_alive:
+            logger.warning("⚠️ El escritor de mensajes no terminó a tiempo: lo pendiente quedó en el spill")
+        logger.info("Escritura diferida de mensajes detenida")
+
+    def enqueue(self, rows: List[Dict]) -> bool:
+        """
+        Encola las filas de un turno sin bloquear
+
+        Returns:
+            bool: False si el escritor está inactivo o la cola está llena
+                (el llamador debe escribir de forma síncrona)
+        """
+        if not self.enabled or not self._thread:
+            return False
+        with self._pending_lock:
+            try:
+                self._queue.put_nowait(rows)
+            except queue.Full:
+                logger.warning("Cola de mensajes llena, escribiendo de forma síncrona")
+                return False
+            for row in rows:
+                self._pending[row["conversacion_id"]].append(row)
+        return True
+
+    def pending_for(self, conversation_id: int) -> List[Dict]:
+        """Mensajes de una conversación que aún no están en la BD"""
+        with self._pending_lock:
+            return list(self._pending.get(conversation_id, ()))
+
+    def discard(self, conversation_id: int) -> int:
+        """
+        Cancela los mensajes pendientes de una conversación que se va a eliminar.
+        Espera a que termine la escritura en curso, así ninguna fila de la
+        conversación llega a la BD después del borrado.
+
+        Args:
+            conversation_id: ID de la conversación
+
+        Returns:
+            int: Número de mensajes cancelados
+        """
+        if not self.enabled:
+            return 0
+        with self._flush_lock, self._pending_lock:
+            # Las filas siguen en la cola, pero _flush solo escribe las que están pendientes
+            return len(self._pending.pop(conversation_id, ()))
+
+    def _run(self):
+        self._replay_spill()
+        while not self._stop.is_set():
+            batch = self._drain(block=True)
+            if batch:
+                if self._flush(batch) and os.path.exists(self._spill_file()):
+                    self._replay_spill()
+            elif self.spill_path and time.monotonic() - self._last_replay >= self.spill_retry:
+                # Sin tráfico: la BD pudo recuperarse y el spill no debe esperar al próximo lote
+                self._replay_spill()
+
+    def _drain(self, block: bool) -> List[Dict]:
+        """Junta filas hasta completar un lote o agotar el intervalo"""
+        batch: List[Dict] = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if block and remaining > 0:
+                    batch.extend(self._queue.get(timeout=remaining))
+                else:
+                    batch.extend(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _live(self, batch: List[Dict]) -> List[Dict]:
+        """Filas del lote que siguen pendientes (sin las de conversaciones descartadas)"""
+        with self._pending_lock:
+            return [row for row in batch
+                    if any(candidate is row for candidate in self._pending.get(row["conversacion_id"], ()))]
+
+    def _persist(self, rows: List[Dict]):
+        """
+        Inserta filas en una transacción; si la BD rechaza alguna, reintenta
+        fila por fila para no perder las demás
+
+        Returns:
+            tuple: (persistidas, (fila, error) rechazadas, por reintentar si la BD no está disponible)
+        """
+        db = SessionLocal()
+        try:
+            try:
+                reactivated = insert_messages(db, rows)
+                db.commit()
+                active_sessions_counter.adjust(reactivated)
+                return rows, [], []
+            except (IntegrityError, DataError) as e:
+                db.rollback()
+                logger.warning(f"⚠️ Lote de {len(rows)} mensajes rechazado, reintentando fila por fila: {str(e)}")
+            except Exception as e:
+                db.rollback()
+                logger.error(f"❌ Error persistiendo {len(rows)} mensajes: {str(e)}")
+                return [], [], rows
+
+            saved, rejected = [], []
+            for i, row in enumerate(rows):
+                try:
+                    reactivated = insert_messages(db, [row])
+                    db.commit()
+                    active_sessions_counter.adjust(reactivated)
+                    saved.append(row)
+                except (IntegrityError, DataError) as e:
+                    db.rollback()
+                    rejected.append((row, str(e.orig)[:500]))
+                except Exception as e:
+                    db.rollback()
+                    logger.error(f"❌ Error persistiendo mensajes: {str(e)}")
+                    return saved, rejected, rows[i:]
+            return saved, rejected, []
+        finally:
+            SessionLocal.remove()
+
+    def _flush(self, batch: List[Dict]) -> bool:
+        """
+        Inserta un lote; las filas rechazadas van al archivo de descartes y,
+        si la BD no está disponible, el resto al spill
+
+        Returns:
+            bool: False si quedaron filas en el spill
+        """
+        with self._flush_lock:
+            batch = self._live(batch)
+            if not batch:
+                return True
+            saved, rejected, retry = self._persist(batch)
+            self._release(saved)
+            if rejected:
+                self._dead_letter(rejected)
+                self._release([row for row, _ in rejected])
+            if retry:
+                logger.error(f"❌ {len(retry)} mensajes enviados a spill")
+                self._spill(retry)
+            return not retry
+
+    def _release(self, rows: List[Dict]):
+        with self._pending_lock:
+            for row in rows:
+                pending = self._pending.get(row["conversacion_id"])
+                if not pending:
+                    continue
+                for i, candidate in enumerate(pending):
+                    if candidate is row:
+                        del pending[i]
+                        break
+                if not pending:
+                    del self._pending[row["conversacion_id"]]
+
+    def _release_spilled(self, rows: List[Dict]):
+        """Libera las filas leídas del spill (copias: se comparan por fecha y texto)"""
+        with self._pending_lock:
+            for row in rows:
+                pending = self._pending.get(row["conversacion_id"])
+                if not pending:
+                    continue
+                for i, candidate in enumerate(pending):
+                    if candidate["created_at"] == row["created_at"] and candidate["message"] == row["message"]:
+                        del pending[i]
+                        break
+                if not pending:
+                    del self._pending[row["conversacion_id"]]
+
+    def _append_jsonl(self, path: str, rows: List[Dict]):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Una sola escritura en modo append: las líneas de otros procesos no se intercalan
+        data = "".join(json.dumps({**row, "created_at": row["created_at"].isoformat()}) + "\n" for row in rows)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _spill_file(self) -> str:
+        """Archivo de spill de este proceso (el pid se lee en cada uso: los workers se crean con fork)"""
+        root, ext = os.path.splitext(self.spill_path)
+        return f"{root}.{os.getpid()}{ext}"
+
+    def _orphan_spills(self) -> List[str]:
+        """
+        Archivos de spill sin dueño: los de procesos que ya no existen y el
+        archivo sin pid de versiones anteriores
+        """
+        directory = os.path.dirname(os.path.abspath(self.spill_path))
+        root, ext = os.path.splitext(os.path.basename(self.spill_path))
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return []
+        orphans = []
+        for name in names:
+            if name in (root + ext, root + ext + ".replay"):
+                orphans.append(os.path.join(directory, name))
+            elif name.startswith(root + "."):
+                pid = name[len(root) + 1:].split(".", 1)[0]
+                if pid.isdigit() and int(pid) != os.getpid() and not _process_alive(int(pid)):
+                    orphans.append(os.path.join(directory, name))
+        return orphans
+
+    def _spill(self, rows: List[Dict]):
+        if not rows:
+            return
+        if not self.spill_path:
+            logger.error(f"❌ Sin archivo de spill configurado: se perdieron {len(rows)} mensajes")
+            self._release(rows)
+            return
+        with self._spill_lock:
+            self._append_jsonl(self._spill_file(), rows)
+
+    def _dead_letter(self, rejected: List[Tuple[Dict, str]]):
+        if not self.dead_letter_path:
+            logger.error(f"❌ {len(rejected)} mensajes rechazados por la BD descartados: {rejected[0][1]}")
+            return
+        with self._spill_lock:
+            self._append_jsonl(self.dead_letter_path, [{**row, "error": error} for row, error in rejected])
+        logger.error(f"❌ {len(rejected)} mensajes rechazados por la BD guardados en {self.dead_letter_path}: "
+                     f"{rejected[0][1]}")
+
+    def _replay_spill(self):
+        """Reintenta insertar los mensajes del spill de este proceso y de los huérfanos"""
+        if not self.spill_path:
+            return
+        self._last_replay = time.monotonic()
+        spill_file = self._spill_file()
+        replay_path = spill_file + ".replay"
+        claimed_path = replay_path + ".in"
+        with self._spill_lock:
+            for path in [spill_file] + self._orphan_spills():
+                try:
+                    # Renombrar es atómico: si dos procesos adoptan el mismo huérfano, solo uno lo obtiene
+                    os.rename(path, claimed_path)
+                except FileNotFoundError:
+                    continue
+                # Puede existir un .replay de un intento anterior: se acumula en él
+                with open(claimed_path, encoding='utf-8') as src, \
+                        open(replay_path, 'a', encoding='utf-8') as dst:
+                    dst.write(src.read())
+                os.remove(claimed_path)
+        if not os.path.exists(replay_path):
+            return
+        with open(replay_path, encoding='utf-8') as f:
+            spilled = [json.loads(line) for line in f if line.strip()]
+        for row in spilled:
+            row["created_at"] = datetime.fromisoformat(row["created_at"])
+
+        saved, rejected, retry = [], [], []
+        with self._flush_lock:
+            for start in range(0, len(spilled), self.batch_size):
+                batch = spilled[start:start + self.batch_size]
+                if retry:
+                    # La BD no está disponible: el resto vuelve al spill sin intentarlo
+                    retry.extend(batch)
+                    continue
+                batch_saved, batch_rejected, batch_retry = self._persist(batch)
+                saved.extend(batch_saved)
+                rejected.extend(batch_rejected)
+                retry.extend(batch_retry)
+
+            # El replay queda resuelto: lo que falta vuelve al spill y las rechazadas a descartes
+            with self._spill_lock:
+                if retry:
+                    self._append_jsonl(spill_file, retry)
+                os.remove(replay_path)
+            if rejected:
+                self._dead_letter(rejected)
+            # Los mensajes del spill siguen en memoria como pendientes: liberarlos
+            self._release_spilled(saved + [row for row, _ in rejected])
+
+        if retry:
+            logger.warning(f"Spill aún no se puede persistir: {len(retry)} mensajes para el próximo intento")
+        if saved:
+            logger.info(f"✅ {len(saved)} mensajes recuperados del spill")
+
+
+# Instancia global
+message_writer = WriteBehindWriter(
+    enabled=Config.MESSAGE_WRITE_BEHIND,
+    max_queue=Config.MESSAGE_WRITE_BEHIND_QUEUE_SIZE,
+    batch_size=Config.MESSAGE_WRITE_BEHIND_BATCH_SIZE,
+    flush_interval_ms=Config.MESSAGE_WRITE_BEHIND_INTERVAL_MS,
+    spill_path=Config.MESSAGE_SPILL_PATH,
+    dead_letter_path=Config.MESSAGE_DEAD_LETTER_PATH,
+    spill_retry_seconds=Config.MESSAGE_SPILL_RETRY_SECONDS
+)
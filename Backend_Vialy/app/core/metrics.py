@@ -0,0 +1,186 @@
+"""
+Métricas de /ask en el formato de texto de Prometheus (GET /metrics).
+
+- vialy_ask_stage_seconds{stage}: duración de cada etapa (cache, sesión,
+  clasificación, historial, recuperación, prompt, generación, persistencia)
+- vialy_ask_request_seconds{category, cache}: duración total por categoría y
+  resultado de la cache ('hit', 'semantic_hit', 'miss' o 'fine_table' para la
+  respuesta exacta desde la tabla de infracciones)
+- vialy_llm_requests_total{model, mode} y vialy_llm_tokens_total{model, type}:
+  llamadas al LLM y tokens de prompt y de respuesta que informa Ollama
+  (prompt_eval_count / eval_count)
+
+Con METRICS_ENABLED=false `stage` devuelve siempre el mismo context manager
+vacío y el resto de funciones retorna de inmediato: el costo es una
+comprobación de un atributo por llamada.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from typing import Dict, Iterable, List, Tuple
+
+from app.config.settings import Config
+
+# Límites superiores de los buckets (segundos): de 1 ms hasta el timeout del LLM
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Context manager compartido cuando las métricas están desactivadas
+_NOOP = nullcontext()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """Contador acumulado por combinación de etiquetas"""
+
+    def __init__(self, name: str, help_text: str, label_names: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels: str):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Histograma acumulativo con buckets fijos por combinación de etiquetas"""
+
+    def __init__(self, name: str, help_text: str, label_names: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # etiquetas -> [conteo por bucket (no acumulado, el último es +Inf), suma]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class _StageTimer:
+    """Mide un bloque y lo registra en el histograma de etapas"""
+
+    __slots__ = ('_histogram', '_stage', '_start')
+
+    def __init__(self, histogram: Histogram, stage: str):
+        self._histogram = histogram
+        self._stage = stage
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._histogram.observe(time.perf_counter() - self._start, self._stage)
+        return False
+
+
+class Metrics:
+    """Registro de las métricas de la aplicación"""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.stage_seconds = Histogram(
+            'vialy_ask_stage_seconds', 'Duración de cada etapa de /ask en segundos', ('stage',))
+        self.request_seconds = Histogram(
+            'vialy_ask_request_seconds', 'Duración total de /ask por categoría y resultado de la cache',
+            ('category', 'cache'))
+        self.llm_requests = Counter(
+            'vialy_llm_requests_total', 'Llamadas al LLM por modelo y modo', ('model', 'mode'))
+        self.llm_tokens = Counter(
+            'vialy_llm_tokens_total', 'Tokens de prompt y de respuesta informados por el LLM', ('model', 'type'))
+        self._metrics = (self.stage_seconds, self.request_seconds, self.llm_requests, self.llm_tokens)
+
+    def stage(self, name: str):
+        """
+        Context manager que mide una etapa de /ask
+
+        Example:
+            with metrics.stage('retrieval'):
+                sources, context = response_service.get_rag_context(query, query_ctx)
+        """
+        if not self.enabled:
+            return _NOOP
+        return _StageTimer(self.stage_seconds, name)
+
+    def observe_request(self, seconds: float, category: str, cache: str):
+        """Duración total de una consulta a /ask"""
+        if self.enabled:
+            self.request_seconds.observe(seconds, category or 'NONE', cache)
+
+    def count_llm_call(self, model: str, mode: str, prompt_tokens: int = 0, completion_tokens: int = 0):
+        """
+        Una llamada al LLM y los tokens que informó
+
+        Args:
+            model: Nombre del modelo
+            mode: 'continuation', 'transcript' o 'langchain'
+            prompt_tokens: prompt_eval_count de Ollama (0 si no se conoce)
+            completion_tokens: eval_count de Ollama (0 si no se conoce)
+        """
+        if not self.enabled:
+            return
+        self.llm_requests.inc(1, model, mode)
+        if prompt_tokens:
+            self.llm_tokens.inc(prompt_tokens, model, 'prompt')
+        if completion_tokens:
+            self.llm_tokens.inc(completion_tokens, model, 'completion')
+
+    def render(self) -> str:
+        """Todas las métricas en el formato de texto de Prometheus (versión 0.0.4)"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Instancia global
+metrics = Metrics(enabled=Config.METRICS_ENABLED)
@@ -0,0 +1,85 @@
+"""
+Almacén del estado de continuación de Ollama por sesión.
+
+La API /api/generate de Ollama devuelve un arreglo `context` con los tokens
+de la conversación. Reenviarlo en la siguiente petición permite continuar la
+conversación sin volver a procesar el historial completo como texto.
+"""
+
+import logging
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
+from app.config.settings import Config
+
+logger = logging.getLogger(__name__)
+
+
+class OllamaContextStore:
+    """Cache LRU acotada de contextos de Ollama, una entrada por sesión"""
+
+    def __init__(self, max_sessions: int = 500, max_tokens: int = 8192):
+        """
+        Args:
+            max_sessions: Número máximo de sesiones guardadas (LRU)
+            max_tokens: Tamaño máximo del contexto por sesión; si se supera,
+                la sesión vuelve al modo transcripción
+        """
+        self.max_sessions = max_sessions
+        self.max_tokens = max_tokens
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str, model: str) -> Optional[List[int]]:
+        """
+        Obtiene el contexto de una sesión si fue generado por el mismo modelo
+
+        Returns:
+            List[int] o None si no existe, fue desalojado o cambió el modelo
+        """
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            stored_model, tokens = entry
+            if stored_model != model:
+                # Los tokens de otro modelo no son válidos
+                del self._entries[session_id]
+                logger.info(f"Contexto Ollama descartado para {session_id}: modelo cambió")
+                return None
+            self._entries.move_to_end(session_id)
+            return tokens.tolist()
+
+    def put(self, session_id: str, model: str, context: Iterable[int]):
+        """Guarda el contexto devuelto por Ollama para una sesión"""
+        tokens = array('I', context)
+        with self._lock:
+            if len(tokens) > self.max_tokens:
+                # Demasiado largo: la próxima consulta reenvía el historial
+                self._entries.pop(session_id, None)
+                return
+            self._entries[session_id] = (model, tokens)
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_sessions:
+                self._entries.popitem(last=False)
+
+    def discard(self, session_id: str):
+        """Elimina el contexto de una sesión"""
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Instancia global
+ollama_context_store = OllamaContextStore(
+    max_sessions=Config.OLLAMA_CONTEXT_MAX_SESSIONS,
+    max_tokens=Config.OLLAMA_CONTEXT_MAX_TOKENS
+)
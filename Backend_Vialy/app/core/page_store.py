@@ -0,0 +1,208 @@
+"""
+Texto por página de los PDFs, para abrir una cita de /ask sin descargar el PDF.
+
+Las páginas se extraen una vez, al indexar (RAGSystem guarda las mismas que
+carga PyPDFLoader, así el `start_index` de cada chunk es un desplazamiento
+válido en el texto guardado), en un archivo comprimido por documento:
+
+    PAGE_STORE_PATH/<archivo>.pages.json.gz  {"archivo", "etag", "paginas": [...]}
+
+El ETag es el del contenido (app/core/document_cache.py): si el PDF servido
+cambia, sus páginas se vuelven a extraer cuando el catálogo de documentos
+avisa del cambio (app/core/document_catalog.py) o al pedirse. Las
+imágenes de página (opcionales, requieren PyMuPDF) se renderizan al pedirse por
+primera vez o con `python -m app.cli index-pages --images`, con el lado mayor
+limitado a PDF_PAGE_IMAGE_MAX_PX, y quedan en PAGE_STORE_PATH/<archivo>-<etag>/.
+"""
+
+import gzip
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Tuple, Union
+
+from app.config.settings import Config
+from app.core.document_cache import DocumentMeta, document_cache
+
+logger = logging.getLogger(__name__)
+
+
+def _meta(document: Union[str, DocumentMeta]) -> DocumentMeta:
+    """Metadatos de un PDF dado por ruta o ya resuelto (entrada del catálogo)"""
+    return document if isinstance(document, DocumentMeta) else document_cache.get(document)
+
+
+def _write_atomic(path: str, data: bytes):
+    """Escribe en un temporal y lo renombra (nunca queda un archivo a medias)"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class PageStore:
+    """Páginas de texto por documento, en disco y en memoria"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or Config.PAGE_STORE_PATH
+        # archivo -> (etag, páginas)
+        self._documents: Dict[str, Tuple[str, List[str]]] = {}
+        self._lock = threading.Lock()
+
+    def _store_file(self, filename: str) -> str:
+        return os.path.join(self.path, f"{filename}.pages.json.gz")
+
+    def _image_dir(self, filename: str, etag: str) -> str:
+        return os.path.join(self.path, f"{filename}-{etag[:12]}")
+
+    def save(self, pdf_path: str, pages: List[str]) -> int:
+        """
+        Guarda el texto de las páginas de un PDF (al indexar)
+
+        Args:
+            pdf_path: Ruta del PDF
+            pages: Texto de cada página, en orden
+
+        Returns:
+            int: Número de páginas guardadas
+        """
+        meta = document_cache.get(pdf_path)
+        payload = {'archivo': meta.filename, 'etag': meta.etag, 'paginas': list(pages)}
+        os.makedirs(self.path, exist_ok=True)
+        _write_atomic(self._store_file(meta.filename),
+                      gzip.compress(json.dumps(payload, ensure_ascii=False).encode('utf-8')))
+        with self._lock:
+            self._documents[meta.filename] = (meta.etag, payload['paginas'])
+        logger.info(f"📄 {len(pages)} páginas de {meta.filename} guardadas")
+        return len(pages)
+
+    def _load(self, filename: str, etag: str) -> Optional[List[str]]:
+        """Páginas guardadas en disco, si corresponden a esta versión del PDF"""
+        try:
+            with gzip.open(self._store_file(filename), 'rt', encoding='utf-8') as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Páginas de {filename} ilegibles, se extraen de nuevo: {str(e)}")
+            return None
+        return payload['paginas'] if payload.get('etag') == etag else None
+
+    def pages(self, document: Union[str, DocumentMeta]) -> List[str]:
+        """
+        Texto de todas las páginas de un PDF
+
+        Args:
+            document: Ruta del PDF o su entrada del catálogo
+
+        Returns:
+            list: Texto de cada página
+
+        Raises:
+            FileNotFoundError: Si el PDF no existe
+        """
+        meta = _meta(document)
+        cached = self._documents.get(meta.filename)
+        if cached is not None and cached[0] == meta.etag:
+            return cached[1]
+
+        with self._lock:
+            cached = self._documents.get(meta.filename)
+            if cached is not None and cached[0] == meta.etag:
+                return cached[1]
+            pages = self._load(meta.filename, meta.etag)
+            if pages is not None:
+                self._documents[meta.filename] = (meta.etag, pages)
+                return pages
+
+        # Sin extracción previa (o de otra versión del PDF): se hace una sola vez
+        from app.rag.fine_extractor import read_pdf_pages
+        logger.info(f"📄 Extrayendo páginas de {meta.filename}")
+        pages = read_pdf_pages(meta.path)
+        self.save(meta.path, pages)
+        return pages
+
+    def page(self, document: Union[str, DocumentMeta], number: int) -> Optional[str]:
+        """Texto de una página (numerada desde 1), o None si no existe"""
+        pages = self.pages(document)
+        return pages[number - 1] if 1 <= number <= len(pages) else None
+
+    def image(self, document: Union[str, DocumentMeta], number: int) -> Optional[str]:
+        """
+        PNG de una página, renderizado una vez con PyMuPDF
+
+        Args:
+            document: Ruta del PDF o su entrada del catálogo
+            number: Página (desde 1)
+
+        Returns:
+            str: Ruta del PNG, o None si la página no existe o PyMuPDF no está instalado
+        """
+        meta = _meta(document)
+        if meta.num_pages is None or not 1 <= number <= meta.num_pages:
+            return None
+        image_path = os.path.join(self._image_dir(meta.filename, meta.etag), f"p{number}.png")
+        if os.path.exists(image_path):
+            return image_path
+        try:
+            import fitz  # PyMuPDF
+        except ImportError:
+            return None
+
+        with fitz.open(meta.path) as doc:
+            page = doc[number - 1]
+            zoom = Config.PDF_PAGE_IMAGE_MAX_PX / max(page.rect.width, page.rect.height)
+            pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+            png = pixmap.tobytes('png')
+        os.makedirs(os.path.dirname(image_path), exist_ok=True)
+        _write_atomic(image_path, png)
+        return image_path
+
+    def on_document_event(self, event):
+        """
+        Suscriptor del catálogo de documentos: extrae las páginas de los PDFs
+        nuevos o modificados y olvida las de los eliminados
+        """
+        if event.kind == 'removed':
+            with self._lock:
+                self._documents.pop(event.meta.filename, None)
+        else:
+            self.pages(event.meta)
+
+    def images_available(self) -> bool:
+        """Si se pueden renderizar imágenes de página (PyMuPDF instalado)"""
+        try:
+            import fitz  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+
+def citation_fields(metadata: Dict, length: int) -> Dict:
+    """
+    Posición de un chunk en su página y enlace a /pdf/<archivo>/page/<n>
+
+    Args:
+        metadata: Metadatos del chunk ('source', 'page' desde 0 y 'start_index')
+        length: Longitud del texto del chunk
+
+    Returns:
+        dict: {'inicio', 'fin', 'enlace'} o vacío si el chunk no tiene página o posición
+    """
+    page = metadata.get('page')
+    start = metadata.get('start_index')
+    if not isinstance(page, int) or not isinstance(start, int) or start < 0:
+        return {}
+    filename = os.path.basename(metadata.get('source') or '')
+    if not filename.lower().endswith('.pdf'):
+        return {}
+    return {
+        'inicio': start,
+        'fin': start + length,
+        'enlace': f"/pdf/{filename}/page/{page + 1}?inicio={start}&fin={start + length}",
+    }
+
+
+# Instancia global
+page_store = PageStore()
@@ -0,0 +1,63 @@
+"""
+Paginación por cursor (keyset) sobre claves compuestas (fecha, id).
+
+Un cursor es un token opaco que codifica la fecha y el id de la última fila
+vista; la siguiente página se obtiene con un predicado sobre el índice en
+lugar de OFFSET, por lo que su costo no crece con el tamaño del historial.
+"""
+
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import and_, or_
+
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    """Codifica (fecha, id) como cursor opaco"""
+    raw = f"{timestamp.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Decodifica un cursor generado por encode_cursor
+
+    Raises:
+        ValueError: Si el cursor no es válido
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, row_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+
+def parse_limit(value: Optional[str], default: Optional[int] = None) -> Optional[int]:
+    """
+    Valida el parámetro `limit` (1..MAX_PAGE_SIZE)
+
+    Raises:
+        ValueError: Si no es un entero positivo
+    """
+    if value is None:
+        return default
+    limit = int(value)
+    if limit < 1:
+        raise ValueError("limit debe ser mayor que 0")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def keyset_before(timestamp_column, id_column, cursor: str):
+    """Predicado para filas estrictamente anteriores al cursor"""
+    timestamp, row_id = decode_cursor(cursor)
+    return or_(timestamp_column < timestamp, and_(timestamp_column == timestamp, id_column < row_id))
+
+
+def keyset_after(timestamp_column, id_column, cursor: str):
+    """Predicado para filas estrictamente posteriores al cursor"""
+    timestamp, row_id = decode_cursor(cursor)
+    return or_(timestamp_column > timestamp, and_(timestamp_column == timestamp, id_column > row_id))
@@ -0,0 +1,99 @@
+"""
+Contexto de la consulta de un request.
+
+`/ask` crea un QueryContext por pregunta y lo pasa a cada etapa (cache de
+respuestas, clasificación y búsqueda RAG). El texto normalizado, los tokens,
+las palabras clave y el embedding se calculan la primera vez que alguna etapa
+los pide y las demás reutilizan el mismo valor: la pregunta se vectoriza una
+sola vez por request.
+"""
+
+import hashlib
+import logging
+import re
+from functools import cached_property
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.core.keyword_matcher import KeywordMatch, fold, match_keywords
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def find_vectorstore(qa_chain):
+    """Vectorstore detrás del retriever de la cadena RAG, o None"""
+    retriever = getattr(qa_chain, 'retriever', None)
+    return getattr(retriever, 'vectorstore', None)
+
+
+def find_embeddings(qa_chain):
+    """Modelo de embeddings del vectorstore de la cadena RAG, o None"""
+    vectorstore = find_vectorstore(qa_chain)
+    embeddings = getattr(vectorstore, 'embeddings', None) or getattr(vectorstore, 'embedding_function', None)
+    return embeddings if hasattr(embeddings, 'embed_query') else None
+
+
+def unit_vector(values) -> np.ndarray:
+    """Vector float32 de norma 1 (el producto punto es la similitud coseno)"""
+    vector = np.asarray(values, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm > 0 else vector
+
+
+class QueryContext:
+    """Datos derivados de una consulta, calculados a lo sumo una vez"""
+
+    def __init__(self, query: str, embeddings=None):
+        """
+        Args:
+            query: Pregunta del usuario
+            embeddings: Modelo con `embed_query` (el mismo del vectorstore), opcional
+        """
+        self.query = query
+        self._embeddings = embeddings
+        # Llamadas reales al modelo de embeddings (0 o 1)
+        self.embedding_calls = 0
+
+    @cached_property
+    def normalized(self) -> str:
+        """Minúsculas, sin tildes y con espacios simples"""
+        return ' '.join(fold(self.query).split())
+
+    @cached_property
+    def tokens(self) -> Tuple[str, ...]:
+        return tuple(_TOKEN_RE.findall(self.normalized))
+
+    @cached_property
+    def cache_key(self) -> str:
+        """Clave de la cache de respuestas exacta"""
+        return hashlib.md5(self.normalized.encode()).hexdigest()
+
+    @cached_property
+    def keywords(self) -> KeywordMatch:
+        """Categoría, intención e infracciones por palabras clave"""
+        return match_keywords(self.query)
+
+    @property
+    def has_embeddings(self) -> bool:
+        return self._embeddings is not None
+
+    @cached_property
+    def embedding(self) -> Optional[List[float]]:
+        """Embedding de la consulta (None sin modelo o si falló)"""
+        if self._embeddings is None:
+            return None
+        self.embedding_calls += 1
+        try:
+            return list(self._embeddings.embed_query(self.query))
+        except Exception as e:
+            logger.warning(f"No se pudo calcular el embedding de la consulta: {str(e)}")
+            return None
+
+    @cached_property
+    def vector(self) -> Optional[np.ndarray]:
+        """Embedding normalizado para comparar por similitud coseno"""
+        embedding = self.embedding
+        return unit_vector(embedding) if embedding is not None else None
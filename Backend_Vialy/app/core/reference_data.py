@@ -3,6 +3,10 @@ Datos de referencia del Código Nacional de Tránsito Colombiano
 Valores actualizados para 2025 según Artículo 131
 """
 
+from typing import Optional
+
+from app.config.settings import Config
+
 # SMMLV 2025 (Salario Mínimo Mensual Legal Vigente)
 SMMLV_2025 = 1_423_500
 
@@ -159,7 +163,7 @@ DOCUMENTOS_OBLIGATORIOS = [
     },
     {
         'nombre': 'Certificado de revisión técnico-mecánica',
-        'descripcion': 'Para vehículos particulares de más de 2 años',
+        'descripcion': 'Para vehículos de más de 2 años (particulares) o 1 año (públicos)',
         'obligatorio': True
     }
 ]
@@ -213,6 +217,16 @@ LIMITES_VELOCIDAD = {
     'autopista_doble_calzada': 120
 }
 
+# Puntos en la licencia
+PUNTOS_LICENCIA = {
+    'total_inicial': 100,
+    'perdida_licencia': 0,
+    'recuperacion_puntos': {
+        'tiempo_sin_infracciones': '12 meses',
+        'puntos_recuperados': 'Todos'
+    }
+}
+
 def get_multa_info(tipo: str) -> dict:
     """
     Obtiene información de una multa por tipo
@@ -249,170 +263,61 @@ def format_pesos(valor: int) -> str:
     """
     return f"${valor:,}".replace(',', '.')
 
-def buscar_infraccion_por_keyword(keyword: str) -> list:
+def get_anio_multas(anio: Optional[int] = None) -> int:
     """
-    Busca infracciones que coincidan con una palabra clave
+    Año con el que se liquidan las multas
     
     Args:
-        keyword: Palabra a buscar
+        anio: Año pedido (por defecto Config.SMMLV_YEAR o el más reciente configurado)
         
     Returns:
-        list: Lista de infracciones que coinciden
+        int: Año de liquidación
     """
-    keyword = keyword.lower()
-    resultados = []
-    
-    for key, info in INFRACCIONES_COMUNES.items():
-        if keyword in info['descripcion'].lower() or keyword in key:
-            resultados.append({
-                'key': key,
-                'info': info
-            })
-    
-    return resultados
+    return anio or Config.SMMLV_YEAR or max(Config.SMMLV_BY_YEAR)
 
-# Documentos obligatorios
-DOCUMENTOS_OBLIGATORIOS = [
-    {
-        'nombre': 'Licencia de conducción',
-        'descripcion': 'Vigente y correspondiente a la categoría del vehículo',
-        'obligatorio': True
-    },
-    {
-        'nombre': 'Documento de identidad',
-        'descripcion': 'Cédula de ciudadanía o extranjería',
-        'obligatorio': True
-    },
-    {
-        'nombre': 'SOAT',
-        'descripcion': 'Seguro Obligatorio de Accidentes de Tránsito vigente',
-        'obligatorio': True
-    },
-    {
-        'nombre': 'Tarjeta de propiedad',
-        'descripcion': 'Documento de propiedad del vehículo',
-        'obligatorio': True
-    },
-    {
-        'nombre': 'Certificado de revisión técnico-mecánica',
-        'descripcion': 'Para vehículos de más de 2 años (particulares) o 1 año (públicos)',
-        'obligatorio': True
-    }
-]
-
-# Costos aproximados 2025
-COSTOS_TRAMITES = {
-    'licencia_nueva': {
-        'min': 350_000,
-        'max': 500_000,
-        'descripcion': 'Obtener licencia nueva por primera vez'
-    },
-    'renovacion_licencia': {
-        'min': 200_000,
-        'max': 300_000,
-        'descripcion': 'Renovación de licencia de conducción'
-    },
-    'soat_moto': {
-        'min': 350_000,
-        'max': 450_000,
-        'descripcion': 'SOAT para motocicleta'
-    },
-    'soat_carro': {
-        'min': 500_000,
-        'max': 800_000,
-        'descripcion': 'SOAT para automóvil'
-    },
-    'revision_tecnomecanica': {
-        'min': 70_000,
-        'max': 150_000,
-        'descripcion': 'Revisión técnico-mecánica'
-    },
-    'examen_medico': {
-        'min': 40_000,
-        'max': 80_000,
-        'descripcion': 'Examen médico para licencia'
-    },
-    'curso_conduccion': {
-        'min': 800_000,
-        'max': 1_500_000,
-        'descripcion': 'Curso de conducción completo'
-    }
-}
-
-# Límites de velocidad
-LIMITES_VELOCIDAD = {
-    'zona_escolar': 30,
-    'zona_residencial': 30,
-    'zona_urbana': 50,
-    'zona_rural': 80,
-    'autopista': 100,
-    'autopista_doble_calzada': 120
-}
-
-# Puntos en la licencia
-PUNTOS_LICENCIA = {
-    'total_inicial': 100,
-    'perdida_licencia': 0,
-    'recuperacion_puntos': {
-        'tiempo_sin_infracciones': '12 meses',
-        'puntos_recuperados': 'Todos'
-    }
-}
-
-def get_multa_info(tipo: str) -> dict:
+def get_smmlv(anio: Optional[int] = None) -> int:
     """
-    Obtiene información de una multa por tipo
+    SMMLV configurado para un año (Config.SMMLV_BY_YEAR)
     
     Args:
-        tipo: Tipo de multa (A, B, C, D, E)
+        anio: Año de liquidación (ver get_anio_multas)
         
     Returns:
-        dict: Información de la multa
-    """
-    return MULTAS_TIPOS.get(tipo.upper(), None)
-
-def get_infraccion_info(key: str) -> dict:
-    """
-    Obtiene información de una infracción específica
-    
-    Args:
-        key: Clave de la infracción
+        int: Salario mínimo mensual del año
         
-    Returns:
-        dict: Información de la infracción
+    Raises:
+        KeyError: Si el año no está configurado
     """
-    return INFRACCIONES_COMUNES.get(key, None)
+    return Config.SMMLV_BY_YEAR[get_anio_multas(anio)]
 
-def format_pesos(valor: int) -> str:
+def valor_multa(smldv: int, anio: Optional[int] = None) -> int:
     """
-    Formatea un valor en pesos colombianos
+    Valor en pesos de una multa expresada en salarios mínimos diarios
     
     Args:
-        valor: Valor numérico
+        smldv: Número de SMLDV de la multa
+        anio: Año de liquidación (ver get_smmlv)
         
     Returns:
-        str: Valor formateado (ej: $1,423,500)
+        int: Valor en pesos (SMLDV = SMMLV / 30)
     """
-    return f"${valor:,}".replace(',', '.')
+    return round(smldv * get_smmlv(anio) / 30)
 
 def buscar_infraccion_por_keyword(keyword: str) -> list:
     """
-    Busca infracciones que coincidan con una palabra clave
+    Busca infracciones que coincidan con una palabra clave (sin distinguir
+    tildes y tolerando errores de escritura, ver app/core/reference_search.py)
     
     Args:
         keyword: Palabra a buscar
         
     Returns:
-        list: Lista de infracciones que coinciden
+        list: Lista de infracciones que coinciden, de la más a la menos relevante
     """
-    keyword = keyword.lower()
-    resultados = []
-    
-    for key, info in INFRACCIONES_COMUNES.items():
-        if keyword in info['descripcion'].lower() or keyword in key:
-            resultados.append({
-                'key': key,
-                'info': info
-            })
-    
-    return resultados
\ No newline at end of file
+    # Import local: reference_search indexa las tablas de este módulo
+    from app.core.reference_search import search_reference
+
+    return [
+        {'key': hit.key, 'info': hit.data}
+        for hit in search_reference(keyword, 'infraccion', len(INFRACCIONES_COMUNES))
+    ]
@@ -0,0 +1,253 @@
+"""
+Búsqueda sobre los datos de referencia del Código de Tránsito.
+
+Las tablas de app/core/reference_data.py (infracciones, tipos de multa,
+trámites, documentos y límites de velocidad) se indexan una sola vez al
+importar el módulo en un índice invertido término -> documentos. Los términos
+se normalizan con `fold` (sin tildes ni mayúsculas) y cada palabra de la
+consulta se resuelve, en este orden:
+
+1. Igual a un término del índice o con la misma raíz (`stem`: 'multas' y 'multa')
+2. Prefijo de un término ('licen' -> 'licencia')
+3. A distancia de edición 1 o 2 según su longitud ('velosidad' -> 'velocidad'),
+   con el esquema de borrados de SymSpell: los borrados de cada término se
+   precalculan, así una consulta solo compara contra los candidatos que
+   comparten un borrado en lugar de recorrer el vocabulario.
+
+Gana el documento que cubre más palabras de la consulta y, a igual cobertura,
+el de mayor puntaje (peso del campo por calidad de la coincidencia).
+"""
+
+import bisect
+import logging
+import re
+from collections import namedtuple
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from app.core.keyword_matcher import fold
+from app.core.message_search import STOPWORDS, stem
+from app.core.reference_data import (
+    COSTOS_TRAMITES, DOCUMENTOS_OBLIGATORIOS, INFRACCIONES_COMUNES, LIMITES_VELOCIDAD, MULTAS_TIPOS
+)
+
+logger = logging.getLogger(__name__)
+
+# Tipos de documento del índice
+KINDS = ('infraccion', 'multa', 'tramite', 'documento', 'velocidad')
+
+# Códigos de literal ("c.29", "d.1") como un solo término
+_TOKEN_RE = re.compile(r"[a-z]\.\d+|[a-z0-9]+")
+
+# Distancia de edición máxima: 0 hasta 3 letras, 1 hasta 7 y 2 desde 8
+MAX_EDIT_DISTANCE = 2
+MIN_PREFIX_LEN = 3
+
+# Calidad de la coincidencia de una palabra de la consulta
+EXACT_FACTOR = 1.0
+PREFIX_FACTOR = 0.8
+
+ReferenceHit = namedtuple('ReferenceHit', 'kind key score matched data')
+
+
+def _max_distance(word: str) -> int:
+    if len(word) < 4 or not word.isalpha():
+        return 0
+    return 1 if len(word) < 8 else MAX_EDIT_DISTANCE
+
+
+def _deletes(word: str, distance: int) -> Set[str]:
+    """La palabra y todas las variantes con hasta `distance` letras borradas"""
+    variants = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w)) if len(w) > 1}
+        variants |= frontier
+    return variants
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """
+    Distancia de Damerau-Levenshtein (alineamiento óptimo: una transposición
+    de letras vecinas cuenta como una edición)
+
+    Returns:
+        int: La distancia, o max_distance + 1 si la supera
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def tokenize(value: str) -> List[str]:
+    """Palabras de un texto sin tildes ni palabras vacías, en orden"""
+    return [token for token in _TOKEN_RE.findall(fold(value or '')) if token not in STOPWORDS]
+
+
+def _reference_documents():
+    """(tipo, clave, datos, [(texto, peso), ...]) por cada entrada de las tablas de referencia"""
+    for key, info in INFRACCIONES_COMUNES.items():
+        yield 'infraccion', key, info, [
+            (key.replace('_', ' '), 3.0),
+            (info['descripcion'], 2.0),
+            (f"articulo {info['articulo']} multa tipo {info['tipo_multa']}", 1.0),
+            (' '.join(info['otras_sanciones']), 0.5),
+        ]
+    for tipo, info in MULTAS_TIPOS.items():
+        yield 'multa', tipo, {'tipo': tipo, **info}, [
+            (f"multa tipo {tipo}", 3.0),
+            (info['descripcion'], 2.0),
+            (f"{info['smldv']} smldv", 1.0),
+        ]
+    for key, info in COSTOS_TRAMITES.items():
+        yield 'tramite', key, info, [
+            (key.replace('_', ' '), 3.0),
+            (info['descripcion'], 2.0),
+            ('costo tramite precio', 0.5),
+        ]
+    for documento in DOCUMENTOS_OBLIGATORIOS:
+        yield 'documento', documento['nombre'], documento, [
+            (documento['nombre'], 3.0),
+            (documento['descripcion'], 1.0),
+            ('documento obligatorio', 0.5),
+        ]
+    for zona, limite in LIMITES_VELOCIDAD.items():
+        yield 'velocidad', zona, {'zona': zona, 'limite_kmh': limite}, [
+            (zona.replace('_', ' '), 3.0),
+            ('limite velocidad maxima', 1.0),
+        ]
+
+
+class ReferenceIndex:
+    """Índice invertido con coincidencia por raíz, prefijo y distancia de edición"""
+
+    def __init__(self, documents: Iterable[Tuple[str, str, dict, List[Tuple[str, float]]]]):
+        """
+        Args:
+            documents: (tipo, clave, datos, [(texto, peso), ...]) por documento
+        """
+        self._documents: List[Tuple[str, str, dict]] = []
+        # término -> {documento: peso del mejor campo en que aparece}
+        self._postings: Dict[str, Dict[int, float]] = {}
+        for doc_id, (kind, key, data, fields) in enumerate(documents):
+            self._documents.append((kind, key, data))
+            for text, weight in fields:
+                for term in tokenize(text):
+                    postings = self._postings.setdefault(term, {})
+                    postings[doc_id] = max(postings.get(doc_id, 0.0), weight)
+
+        self._terms = sorted(self._postings)
+        self._stems: Dict[str, Set[str]] = {}
+        self._deletes: Dict[str, Set[str]] = {}
+        for term in self._terms:
+            self._stems.setdefault(stem(term), set()).add(term)
+            if _max_distance(term):
+                for variant in _deletes(term, MAX_EDIT_DISTANCE):
+                    self._deletes.setdefault(variant, set()).add(term)
+
+        # Las palabras de las consultas se repiten mucho: cada una se resuelve una vez
+        self.expand = lru_cache(maxsize=8192)(self._expand)
+
+        logger.info(f"📚 Índice de referencia: {len(self._documents)} documentos, "
+                    f"{len(self._terms)} términos, {len(self._deletes)} borrados")
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def _expand(self, token: str) -> Dict[str, float]:
+        """
+        Términos del índice que corresponden a una palabra de la consulta
+
+        Returns:
+            dict: término -> factor de calidad (1.0 exacta o misma raíz, menor
+                para prefijo y distancia de edición); vacío si no hay ninguno
+        """
+        exact = {term: EXACT_FACTOR for term in self._stems.get(stem(token), ())}
+        if token in self._postings:
+            exact[token] = EXACT_FACTOR
+        if exact:
+            return exact
+
+        matches: Dict[str, float] = {}
+        if len(token) >= MIN_PREFIX_LEN:
+            start = bisect.bisect_left(self._terms, token)
+            for term in self._terms[start:]:
+                if not term.startswith(token):
+                    break
+                matches[term] = PREFIX_FACTOR
+
+        max_distance = _max_distance(token)
+        if max_distance:
+            candidates = set()
+            for variant in _deletes(token, max_distance):
+                candidates |= self._deletes.get(variant, set())
+            best = {}
+            for term in candidates:
+                distance = edit_distance(token, term, max_distance)
+                if distance <= max_distance:
+                    best[term] = distance
+            # Como SymSpell: solo los candidatos más cercanos
+            if best:
+                closest = min(best.values())
+                for term, distance in best.items():
+                    if distance == closest:
+                        matches[term] = max(matches.get(term, 0.0), 1.0 / (1 + distance))
+        return matches
+
+    def search(self, query: str, kind: Optional[str] = None, limit: int = 5) -> Tuple[ReferenceHit, ...]:
+        """
+        Busca en las tablas de referencia
+
+        Args:
+            query: Texto libre ('multa por exceso de velosidad', 'C.29', 'soat moto')
+            kind: Restringe a un tipo de documento (ver KINDS)
+            limit: Número máximo de resultados
+
+        Returns:
+            tuple: ReferenceHit ordenados por relevancia
+        """
+        coverage: Dict[int, int] = {}
+        scores: Dict[int, float] = {}
+        matched: Dict[int, Set[str]] = {}
+        for token in dict.fromkeys(tokenize(query)):
+            best: Dict[int, float] = {}
+            for term, factor in self.expand(token).items():
+                for doc_id, weight in self._postings[term].items():
+                    if kind and self._documents[doc_id][0] != kind:
+                        continue
+                    if weight * factor > best.get(doc_id, 0.0):
+                        best[doc_id] = weight * factor
+                    matched.setdefault(doc_id, set()).add(term)
+            # Cada palabra de la consulta suma una vez por documento
+            for doc_id, score in best.items():
+                coverage[doc_id] = coverage.get(doc_id, 0) + 1
+                scores[doc_id] = scores.get(doc_id, 0.0) + score
+
+        ranked = sorted(scores, key=lambda doc_id: (-coverage[doc_id], -scores[doc_id], doc_id))[:limit]
+        return tuple(
+            ReferenceHit(*self._documents[doc_id][:2], round(scores[doc_id], 3),
+                         tuple(sorted(matched[doc_id])), self._documents[doc_id][2])
+            for doc_id in ranked
+        )
+
+
+# Instancia global
+reference_index = ReferenceIndex(_reference_documents())
+
+
+@lru_cache(maxsize=2048)
+def search_reference(query: str, kind: Optional[str] = None, limit: int = 5) -> Tuple[ReferenceHit, ...]:
+    """`reference_index.search` con cache por consulta (los datos de referencia no cambian)"""
+    return reference_index.search(query, kind, limit)
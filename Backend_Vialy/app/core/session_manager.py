@@ -2,25 +2,140 @@
 Gestión de sesiones de conversación asociadas a un usuario.
 """
 
+import atexit
 import uuid
+import threading
+import time
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta
 from typing import Dict, Optional
 import logging
+from sqlalchemy import and_, func, or_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from app.models.models import Conversation, Message
-from app.config.database import SessionLocal
+from app.config.database import SessionLocal, read_router
+from app.config.settings import Config
+from app.core.active_sessions import active_sessions_counter
+from app.core.message_store import build_turn_rows, insert_messages, message_writer
+from app.core.context_manager import ConversationContextManager, ConversationContextState
+from app.core.identity import identity_cache
+from app.core.message_archive import load_archived_messages
+from app.core.message_search import message_search
 
 logger = logging.getLogger(__name__)
 
+
+class SessionOwnershipError(Exception):
+    """La sesión existe pero pertenece a otro usuario"""
+
+
+class SessionState:
+    """Estado en memoria de una sesión: ID de conversación, últimos mensajes y contexto"""
+    
+    __slots__ = ('conversation_id', 'usuario_id', 'messages', 'last_access', 'context')
+    
+    def __init__(self, conversation_id: int, usuario_id: int, max_messages: int):
+        self.conversation_id = conversation_id
+        self.usuario_id = usuario_id
+        # Buffer circular con (remitente, vista previa) ya formateados
+        self.messages = deque(maxlen=max_messages)
+        self.last_access = time.monotonic()
+        # ConversationContextState, cargado en el primer uso (None = sin cargar)
+        self.context: Optional[ConversationContextState] = None
+    
+    def append(self, sender: str, message: str):
+        label = "Usuario" if sender == 'usuario' else "Asistente"
+        # Limitar longitud para no hacerlo muy largo
+        preview = message[:100] + "..." if len(message) > 100 else message
+        self.messages.append((label, preview))
+
+
+class SessionStateCache:
+    """Cache LRU de estados de sesión con expiración por inactividad"""
+    
+    def __init__(self, max_messages: int = 10, idle_timeout_seconds: int = 1800, max_sessions: int = 5000):
+        """
+        Args:
+            max_messages: Mensajes recientes guardados por sesión
+            idle_timeout_seconds: Segundos sin uso antes de desalojar una sesión
+            max_sessions: Límite de sesiones en memoria
+        """
+        self.max_messages = max_messages
+        self.idle_timeout = idle_timeout_seconds
+        self.max_sessions = max_sessions
+        self._states: "OrderedDict[str, SessionState]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, session_id: str) -> Optional[SessionState]:
+        """Obtiene el estado de una sesión y lo marca como usado"""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            state = self._states.get(session_id)
+            if state is not None:
+                state.last_access = now
+                self._states.move_to_end(session_id)
+            return state
+    
+    def put(self, session_id: str, state: SessionState):
+        """Guarda el estado de una sesión"""
+        with self._lock:
+            state.last_access = time.monotonic()
+            self._states[session_id] = state
+            self._states.move_to_end(session_id)
+            while len(self._states) > self.max_sessions:
+                self._states.popitem(last=False)
+    
+    def discard(self, session_id: str):
+        """Elimina el estado de una sesión"""
+        with self._lock:
+            self._states.pop(session_id, None)
+    
+    def clear(self):
+        with self._lock:
+            self._states.clear()
+    
+    def _evict_idle(self, now: float):
+        # El orden LRU garantiza que las sesiones inactivas están al inicio
+        while self._states:
+            session_id, state = next(iter(self._states.items()))
+            if now - state.last_access < self.idle_timeout:
+                break
+            del self._states[session_id]
+    
+    def __len__(self) -> int:
+        return len(self._states)
+
+
+# Cache compartida entre las instancias de SessionManager (una por request)
+session_state_cache = SessionStateCache(
+    max_messages=Config.MAX_CONVERSATION_HISTORY * 2,
+    idle_timeout_seconds=Config.SESSION_CACHE_IDLE_SECONDS,
+    max_sessions=Config.SESSION_CACHE_MAX_SESSIONS
+)
+
 class SessionManager:
     """Gestor de sesiones con BD, cada sesión asociada a un usuario"""
     
-    def __init__(self, max_history: int = 5, session_timeout_hours: int = 24, db: Optional[Session] = None):
+    def __init__(self, max_history: int = 5, session_timeout_hours: int = 24, db: Optional[Session] = None,
+                 state_cache: Optional[SessionStateCache] = None):
         self.max_history = max_history
         self.session_timeout = timedelta(hours=session_timeout_hours)
-        self.db = db or SessionLocal()
+        self._db = db
+        # `is not None`: una cache vacía tiene len 0 y con `or` se cambiaría por la global
+        self.state_cache = state_cache if state_cache is not None else session_state_cache
         logger.info(f"SessionManager inicializado (max_history={max_history}, BD={'sí' if db else 'no'})")
     
+    @property
+    def db(self) -> Session:
+        """
+        Sesión de BD recibida o, si no se pasó ninguna, la del hilo actual
+        (la misma del request en curso), obtenida en cada uso y no al crear
+        la instancia para que la global no comparta una sesión entre hilos.
+        """
+        return self._db if self._db is not None else SessionLocal()
+    
     def get_or_create_session(self, usuario_id: int, session_id: Optional[str] = None) -> str:
         """
         Obtiene o crea una sesión para un usuario.
@@ -36,6 +151,10 @@ class SessionManager:
         if not session_id:
             session_id = str(uuid.uuid4())
         
+        # Sesión en cache: no hace falta consultar la BD
+        if self.state_cache.get(session_id) is not None:
+            return session_id
+        
         try:
             conv = self.db.query(Conversation).filter_by(session_id=session_id).first()
             if not conv:
@@ -48,47 +167,258 @@ class SessionManager:
                 )
                 self.db.add(conv)
                 self.db.commit()
+                identity_cache.add_conversation(usuario_id, conv.id)
                 logger.info(f"✅ Nueva conversación creada: {session_id} (usuario_id={usuario_id})")
+                # Conversación nueva: estado y contexto vacíos, sin leer la BD
+                state = self._new_state(conv)
+                state.context = ConversationContextState(conv.id)
+                self.state_cache.put(session_id, state)
             else:
-                conv.updated_at = datetime.utcnow()
-                self.db.commit()
+                self._load_state(session_id, conv)
             return session_id
         except Exception as e:
             logger.error(f"❌ Error creando sesión: {str(e)}")
             self.db.rollback()
             return session_id
 
+    def _new_state(self, conv: Conversation) -> SessionState:
+        return SessionState(conv.id, conv.usuario_id, self.state_cache.max_messages)
+
+    def _load_state(self, session_id: str, conv: Optional[Conversation] = None) -> Optional[SessionState]:
+        """
+        Carga en cache el estado de una sesión desde la BD (solo en el primer uso)
+        
+        Returns:
+            SessionState o None si la conversación no existe
+        """
+        if conv is None:
+            conv = self.db.query(Conversation).filter_by(session_id=session_id).first()
+            if not conv:
+                return None
+        
+        # Mensajes aún en la cola de escritura diferida (antes de leer la BD para no perder ninguno)
+        pending = message_writer.pending_for(conv.id)
+        
+        # Últimos N mensajes: ordenar descendente con límite y luego invertir
+        recent = (
+            self.db.query(Message.sender, Message.message, Message.created_at)
+            .filter_by(conversacion_id=conv.id)
+            .order_by(Message.created_at.desc(), Message.id.desc())
+            .limit(self.state_cache.max_messages)
+            .all()
+        )
+        # Conversación archivada y reactivada: completar con los últimos mensajes del archivo
+        missing = self.state_cache.max_messages - len(recent)
+        if missing > 0 and conv.archived_at is not None:
+            archived = load_archived_messages(self.db, conv.id)[-missing:]
+            recent.extend((m.sender, m.message, m.created_at) for m in reversed(archived))
+        persisted = {(created_at, sender, message) for sender, message, created_at in recent}
+        state = self._new_state(conv)
+        for sender, message, _ in reversed(recent):
+            state.append(sender, message)
+        for row in pending:
+            if (row["created_at"], row["sender"], row["message"]) not in persisted:
+                state.append(row["sender"], row["message"])
+        self.state_cache.put(session_id, state)
+        return state
+
+    def _get_state(self, session_id: str) -> Optional[SessionState]:
+        """Obtiene el estado de la sesión desde la cache o, si falta, desde la BD"""
+        state = self.state_cache.get(session_id)
+        if state is None:
+            state = self._load_state(session_id)
+        return state
+
+    def get_session_owner(self, session_id: str) -> Optional[int]:
+        """
+        Usuario dueño de una sesión, o None si aún no existe. Usa la cache de
+        estado: el estado queda cargado para el resto del request.
+        """
+        state = self._get_state(session_id)
+        return state.usuario_id if state else None
+
+    def _context_state(self, state: SessionState) -> ConversationContextState:
+        """Contexto de la conversación en memoria (una consulta la primera vez)"""
+        if state.context is None:
+            state.context = ConversationContextManager(self.db).load_state(state.conversation_id)
+        return state.context
+
+    def get_conversation_context(self, session_id: str, max_items: int = 5) -> str:
+        """
+        Contexto de la conversación formateado para el prompt
+
+        Returns:
+            str: Texto ya generado (se regenera solo cuando el contexto cambia),
+                o "" si la sesión no existe o aún no hay contexto relevante
+        """
+        try:
+            state = self._get_state(session_id)
+            if not state:
+                return ""
+            context = self._context_state(state)
+            contexts = ConversationContextManager(self.db)
+            if not contexts.should_provide_context(context):
+                return ""
+            return contexts.get_formatted_context(context, max_items=max_items)
+        except Exception as e:
+            logger.error(f"❌ Error obteniendo contexto para sesión {session_id}: {str(e)}")
+            return ""
+
+    def get_conversation_id(self, session_id: str) -> Optional[int]:
+        """Obtiene el ID numérico de la conversación de una sesión"""
+        state = self._get_state(session_id)
+        return state.conversation_id if state else None
+
     def add_message(self, session_id: str, user_message: str, assistant_message: str, category: Optional[str] = None):
         """Agrega mensajes a la conversación"""
         try:
-            conv = self.db.query(Conversation).filter_by(session_id=session_id).first()
-            if not conv:
+            state = self._get_state(session_id)
+            if not state:
                 logger.warning(f"Conversación {session_id} no encontrada")
                 return
             
-            # CORREGIDO: Usar los nombres correctos de los campos
-            user_msg = Message(
-                conversacion_id=conv.id, 
-                sender='usuario',  # Cambiado de 'role' a 'sender'
-                message=user_message  # Cambiado de 'content' a 'message'
-            )
-            assistant_msg = Message(
-                conversacion_id=conv.id, 
-                sender='chatbot',  # Cambiado de 'role' a 'sender'
-                message=assistant_message  # Cambiado de 'content' a 'message'
-            )
-            self.db.add_all([user_msg, assistant_msg])
-            
-            # Actualizar la conversación
-            conv.ended_at = None  # Mantener activa
-            conv.status = 'activa'
+            now = datetime.utcnow()
+            rows = build_turn_rows(state.conversation_id, user_message, assistant_message, now)
+            if not message_writer.enqueue(rows):
+                # Inserta los mensajes y mantiene la conversación activa sin leerla
+                reactivated = insert_messages(self.db, rows)
+                self.db.commit()
+                active_sessions_counter.adjust(reactivated)
             
-            self.db.commit()
+            # Write-through: la cache refleja lo que quedó persistido
+            state.append('usuario', user_message)
+            state.append('chatbot', assistant_message)
             logger.info(f"✅ Mensajes guardados en {session_id}")
         except Exception as e:
             logger.error(f"❌ Error guardando mensajes: {str(e)}")
             self.db.rollback()
 
+    def record_turn(self, usuario_id: int, session_id: str, user_message: str, assistant_message: str,
+                    category: Optional[str] = None) -> Optional[int]:
+        """
+        Persiste un turno completo en una sola transacción (unit of work):
+        crea la conversación si no existe, inserta ambos mensajes, actualiza el
+        contexto de la conversación y hace un único commit.
+
+        Args:
+            usuario_id: ID del usuario
+            session_id: ID de la sesión
+            user_message: Mensaje del usuario
+            assistant_message: Respuesta del asistente
+            category: Categoría detectada (opcional)
+
+        Returns:
+            int: ID numérico de la conversación, o None si falló
+
+        Raises:
+            SessionOwnershipError: Si la sesión pertenece a otro usuario (p. ej.
+                la creó otra petición en paralelo con el mismo session_id)
+        """
+        if usuario_id is None:
+            raise ValueError("usuario_id es obligatorio para registrar un turno")
+
+        # Dos intentos: si otra petición creó la misma sesión en paralelo, se reintenta con la existente
+        for attempt in range(2):
+            state = self._get_state(session_id)
+            if state is not None and state.usuario_id != usuario_id:
+                logger.warning(f"Sesión {session_id} pertenece a otro usuario: turno descartado")
+                raise SessionOwnershipError(session_id)
+            now = datetime.utcnow()
+            contexts = ConversationContextManager(self.db)
+            try:
+                if state is None:
+                    conv = Conversation(
+                        session_id=session_id,
+                        usuario_id=usuario_id,
+                        started_at=now,
+                        status='activa',
+                        primary_topic=category
+                    )
+                    self.db.add(conv)
+                    self.db.flush()  # Obtiene conv.id dentro de la misma transacción
+                    conversation_id = conv.id
+                    context = ConversationContextState(conversation_id, primary_topic=category)
+                else:
+                    conversation_id = state.conversation_id
+                    context = self._context_state(state)
+
+                rows = build_turn_rows(conversation_id, user_message, assistant_message, now)
+                # Conversación existente: los mensajes pueden persistirse en segundo plano
+                if state is None or not message_writer.enqueue(rows):
+                    reactivated = insert_messages(self.db, rows, usuario_id=usuario_id)
+                    context_saved = self._write_context(contexts, context, user_message, assistant_message, category)
+                    self.db.commit()
+                    active_sessions_counter.adjust(reactivated + (1 if state is None else 0))
+                    if not context_saved:
+                        # El contexto en memoria quedó adelantado: se recarga en el siguiente uso
+                        context = None
+                        if state is not None:
+                            state.context = None
+                else:
+                    # Sin commit en este request: read-your-writes se marca al encolar
+                    read_router.mark_write(usuario_id)
+                    self._commit_context(state, contexts, user_message, assistant_message, category)
+            except IntegrityError as e:
+                self.db.rollback()
+                if state is not None:
+                    # El contexto en memoria puede haber quedado adelantado: se recarga
+                    state.context = None
+                if attempt == 0 and state is None:
+                    logger.warning(f"Sesión {session_id} creada en paralelo, reintentando")
+                    continue
+                logger.error(f"❌ Error guardando turno: {str(e)}")
+                return None
+            except Exception as e:
+                logger.error(f"❌ Error guardando turno: {str(e)}")
+                self.db.rollback()
+                if state is not None:
+                    state.context = None
+                return None
+
+            if state is None:
+                state = SessionState(conversation_id, usuario_id, self.state_cache.max_messages)
+                state.context = context
+                self.state_cache.put(session_id, state)
+                identity_cache.add_conversation(usuario_id, conversation_id)
+                logger.info(f"✅ Nueva conversación creada: {session_id} (usuario_id={usuario_id})")
+            state.append('usuario', user_message)
+            state.append('chatbot', assistant_message)
+            logger.info(f"✅ Turno guardado en {session_id}")
+            return conversation_id
+        return None
+
+    def _write_context(self, contexts: ConversationContextManager, context: ConversationContextState,
+                       user_message: str, assistant_message: str, category: Optional[str]) -> bool:
+        """
+        Actualiza el contexto en un SAVEPOINT de la transacción del turno: si
+        falla, se deshace solo el contexto y los mensajes se guardan igual
+
+        Returns:
+            bool: False si el contexto no se pudo escribir
+        """
+        try:
+            with self.db.begin_nested():
+                contexts.update_context(context, user_message, assistant_message, category)
+            return True
+        except Exception as e:
+            logger.warning(f"No se pudo guardar el contexto de la conversación {context.conversation_id}: {str(e)}")
+            return False
+
+    def _commit_context(self, state: SessionState, contexts: ConversationContextManager,
+                        user_message: str, assistant_message: str, category: Optional[str]):
+        """
+        Con escritura diferida los mensajes no pasan por esta transacción: el
+        contexto se guarda en una propia. Si falla, el turno sigue siendo válido
+        y el contexto se recarga de la BD en el siguiente uso.
+        """
+        try:
+            contexts.update_context(state.context, user_message, assistant_message, category)
+            self.db.commit()
+        except Exception as e:
+            logger.warning(f"No se pudo guardar el contexto de la conversación {state.conversation_id}: {str(e)}")
+            self.db.rollback()
+            state.context = None
+
     def get_history(self, session_id: str, max_messages: Optional[int] = None) -> str:
         """
         Obtiene el historial de una conversación como texto formateado.
@@ -101,35 +431,153 @@ class SessionManager:
             str: Historial formateado o mensaje de error
         """
         try:
-            # Buscar la conversación por session_id
-            conv = self.db.query(Conversation).filter_by(session_id=session_id).first()
-            if not conv:
+            state = self._get_state(session_id)
+            if not state:
                 return "Sin historial."
             
-            # Consultar los mensajes de esta conversación
-            query = self.db.query(Message).filter_by(conversacion_id=conv.id).order_by(Message.created_at.asc())
-            
-            # Limitar si se especifica max_messages
-            if max_messages:
-                query = query.limit(max_messages)
-            
-            messages = query.all()
-            
-            if not messages:
+            if not state.messages:
                 return "Sin historial previo."
             
-            # Formatear el historial
-            history_lines = []
-            for msg in messages:
-                sender = "Usuario" if msg.sender == 'usuario' else "Asistente"
-                # Limitar longitud para no hacerlo muy largo
-                content_preview = msg.message[:100] + "..." if len(msg.message) > 100 else msg.message
-                history_lines.append(f"{sender}: {content_preview}")
+            # Últimos mensajes desde el buffer en memoria
+            messages = list(state.messages)
+            if max_messages:
+                messages = messages[-max_messages:]
             
-            return "\n".join(history_lines)
+            return "\n".join(f"{sender}: {preview}" for sender, preview in messages)
             
         except Exception as e:
             logger.error(f"❌ Error obteniendo historial para sesión {session_id}: {str(e)}", exc_info=True)
             return "Error recuperando historial."
-# Instancia global
-session_manager = SessionManager()
+
+    def clear_session(self, session_id: str) -> bool:
+        """
+        Elimina una conversación y sus mensajes
+        
+        Returns:
+            bool: True si la conversación existía
+        """
+        self.state_cache.discard(session_id)
+        try:
+            conv = self.db.query(Conversation).filter_by(session_id=session_id).first()
+            if not conv:
+                return False
+            owner_id = conv.usuario_id
+            was_active = conv.status == 'activa'
+            # Sin esto, un lote pendiente insertaría mensajes de una conversación ya borrada
+            message_writer.discard(conv.id)
+            message_search.unindex_conversations(self.db, [conv.id])
+            self.db.query(Message).filter_by(conversacion_id=conv.id).delete()
+            self.db.delete(conv)
+            self.db.commit()
+            if was_active:
+                active_sessions_counter.adjust(-1)
+            identity_cache.invalidate_conversations(owner_id)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Error eliminando sesión {session_id}: {str(e)}")
+            self.db.rollback()
+            raise
+
+    def cleanup_expired_sessions(self) -> int:
+        """
+        Finaliza las conversaciones activas sin actividad durante `session_timeout`
+        con un único UPDATE (índice status + last_message_at) y recalcula el
+        conteo de sesiones activas.
+        
+        Pensado para la tarea en segundo plano: los endpoints no deben llamarlo.
+        
+        Returns:
+            int: Número de conversaciones finalizadas
+        """
+        cutoff = datetime.utcnow() - self.session_timeout
+        # Sin mensajes, la última actividad es el inicio de la conversación
+        idle = or_(
+            Conversation.last_message_at < cutoff,
+            and_(Conversation.last_message_at.is_(None), Conversation.started_at < cutoff)
+        )
+        try:
+            expired = (
+                self.db.query(Conversation)
+                .filter(Conversation.status == 'activa', idle)
+                .update(
+                    {
+                        Conversation.status: 'finalizada',
+                        Conversation.ended_at: func.coalesce(Conversation.last_message_at, Conversation.started_at)
+                    },
+                    synchronize_session=False
+                )
+            )
+            self.db.commit()
+            active_sessions_counter.set(self._count_active())
+            if expired:
+                logger.info(f"✅ {expired} conversaciones expiradas finalizadas")
+            return expired
+        except Exception as e:
+            logger.error(f"❌ Error finalizando sesiones expiradas: {str(e)}")
+            self.db.rollback()
+            return 0
+
+    def get_active_sessions_count(self) -> int:
+        """
+        Número de conversaciones activas desde el conteo en memoria.
+        Solo consulta la BD si la tarea de expiración no lo ha actualizado.
+        """
+        count = active_sessions_counter.get()
+        if count is None:
+            count = self._count_active()
+            active_sessions_counter.set(count)
+        return count
+
+    def _count_active(self) -> int:
+        return self.db.query(func.count(Conversation.id)).filter(Conversation.status == 'activa').scalar()
+
+
+class SessionExpiryJob:
+    """Hilo que ejecuta `cleanup_expired_sessions` cada `interval_seconds`"""
+    
+    def __init__(self, interval_seconds: int = 300, session_timeout_hours: int = 24):
+        self.interval = interval_seconds
+        self.session_timeout_hours = session_timeout_hours
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self):
+        """Inicia la tarea (idempotente)"""
+        if self.interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="session-expiry", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        logger.info(f"✅ Expiración de sesiones activa (cada {self.interval} s, "
+                    f"timeout={self.session_timeout_hours} h)")
+    
+    def stop(self, timeout: float = 5.0):
+        if not self._thread:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+    
+    def run_once(self) -> int:
+        """Ejecuta una pasada con una sesión de BD propia del hilo"""
+        manager = SessionManager(session_timeout_hours=self.session_timeout_hours, db=SessionLocal())
+        try:
+            return manager.cleanup_expired_sessions()
+        finally:
+            SessionLocal.remove()
+    
+    def _run(self):
+        # Primera pasada al arrancar para tener el conteo de sesiones activas
+        while True:
+            self.run_once()
+            if self._stop.wait(self.interval):
+                break
+
+
+# Instancias globales
+session_manager = SessionManager(session_timeout_hours=Config.SESSION_TIMEOUT_HOURS)
+session_expiry_job = SessionExpiryJob(
+    interval_seconds=Config.SESSION_EXPIRY_INTERVAL_SECONDS,
+    session_timeout_hours=Config.SESSION_TIMEOUT_HOURS
+)
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, String, Text, DateTime, Integer, ForeignKey, Enum
+from sqlalchemy import Column, String, Text, DateTime, Integer, ForeignKey, Enum, Index, LargeBinary, JSON, Boolean
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -37,9 +37,30 @@ class Conversation(Base):
     ended_at = Column(DateTime, nullable=True)
     status = Column(Enum('activa', 'finalizada'), default='activa')
     
+    # Resumen desnormalizado (se mantiene al insertar mensajes, ver message_store.touch_conversations)
+    message_count = Column(Integer, nullable=False, default=0, server_default='0')
+    last_message_at = Column(DateTime, nullable=True)
+    last_message_preview = Column(String(100), nullable=True)
+    # Fecha del último archivado de sus mensajes (NULL = todos en la tabla caliente)
+    archived_at = Column(DateTime, nullable=True)
+    # Categoría del primer turno (ver app/core/context_manager.py)
+    primary_topic = Column(String(50), nullable=True)
+    
     # Relaciones
     usuario = relationship('Usuario', back_populates='conversaciones')
     messages = relationship('Message', back_populates='conversation', cascade='all, delete-orphan')
+    archives = relationship('MessageArchive', back_populates='conversation', cascade='all, delete-orphan')
+    context = relationship('ConversationContext', back_populates='conversation', uselist=False,
+                           cascade='all, delete-orphan')
+    
+    __table_args__ = (
+        # Listado de conversaciones de un usuario ordenado por fecha
+        Index('ix_conversaciones_usuario_started', 'usuario_id', 'started_at'),
+        # Conteo de sesiones activas y cierre de sesiones expiradas
+        Index('ix_conversaciones_status_ended', 'status', 'ended_at'),
+        # Expiración de conversaciones activas inactivas
+        Index('ix_conversaciones_status_last_message', 'status', 'last_message_at'),
+    )
     
     def __repr__(self):
         return f'<Conversation {self.session_id}>'
@@ -57,5 +78,77 @@ class Message(Base):
     # Relación
     conversation = relationship('Conversation', back_populates='messages')
     
+    __table_args__ = (
+        # Historial de una conversación ordenado por fecha (paginación por cursor)
+        Index('ix_mensajes_conversacion_created', 'conversacion_id', 'created_at'),
+    )
+    
+    def __repr__(self):
+        return f'<Message {self.id}>'
+
+class MessageArchive(Base):
+    """Mensajes archivados: un bloque comprimido por conversación y mes (ver app/core/message_archive.py)"""
+    __tablename__ = 'mensajes_archivados'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    conversacion_id = Column(Integer, ForeignKey('conversaciones.id'), nullable=False)
+    periodo = Column(String(7), nullable=False)  # 'YYYY-MM' de created_at de los mensajes
+    message_count = Column(Integer, nullable=False)
+    first_created_at = Column(DateTime, nullable=False)
+    last_created_at = Column(DateTime, nullable=False)
+    codec = Column(String(10), nullable=False)  # 'zstd' o 'zlib'
+    payload = Column(LargeBinary(16777215), nullable=False)  # MEDIUMBLOB en MySQL
+    archived_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    # Relación
+    conversation = relationship('Conversation', back_populates='archives')
+    
+    __table_args__ = (
+        # Lectura de los bloques de una conversación
+        Index('ix_mensajes_archivados_conversacion', 'conversacion_id', 'periodo'),
+        # Restauración por mes
+        Index('ix_mensajes_archivados_periodo', 'periodo'),
+    )
+    
+    def __repr__(self):
+        return f'<MessageArchive {self.conversacion_id} {self.periodo}>'
+
+class ConversationContext(Base):
+    """Contexto acumulado de una conversación (temas, infracciones, artículos, preguntas)"""
+    __tablename__ = 'contexto_conversaciones'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    conversation_id = Column(Integer, ForeignKey('conversaciones.id'), nullable=False, unique=True)
+    # Listas JSON sin duplicados; en memoria se manejan como conjuntos
+    topics = Column(JSON, nullable=False, default=list)
+    infractions_mentioned = Column(JSON, nullable=False, default=list)
+    articles_cited = Column(JSON, nullable=False, default=list)
+    main_questions = Column(JSON, nullable=False, default=list)
+    key_answers = Column(JSON, nullable=False, default=list)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    # Relación
+    conversation = relationship('Conversation', back_populates='context')
+    
+    def __repr__(self):
+        return f'<ConversationContext {self.conversation_id}>'
+
+class Infraccion(Base):
+    """Infracciones extraídas del Código: literales del Art. 131 y grados de alcoholemia del Art. 152 (ver app/rag/fine_extractor.py)"""
+    __tablename__ = 'infracciones'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    codigo = Column(String(20), nullable=False, unique=True)  # 'C.29', 'F', '152-2.1' (grado.reincidencia)
+    articulo = Column(String(10), nullable=False)
+    literal = Column(String(1), nullable=False)  # Tipo de multa (A-F)
+    descripcion = Column(Text, nullable=False)
+    texto = Column(Text, nullable=False)
+    smldv = Column(Integer)  # None: la multa la fija otro artículo (literal F -> Art. 152)
+    otras_sanciones = Column(JSON, nullable=False, default=list)
+    vigente = Column(Boolean, nullable=False, default=True)
+    pagina = Column(Integer)  # Página del PDF (desde 1)
+    fuente = Column(String(255))
+    extraido_en = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
     def __repr__(self):
-        return f'<Message {self.id}>'
\ No newline at end of file
+        return f'<Infraccion {self.codigo}>'
@@ -0,0 +1,305 @@
+"""
+Extracción de las tablas de multas del Código Nacional de Tránsito.
+
+Lee del PDF indexado los literales del Artículo 131 (A.1 ... E.4 y F) y los
+grados de alcoholemia del Artículo 152 y los convierte en filas estructuradas
+(código, descripción, tipo de multa, SMLDV y otras sanciones) para la tabla
+`infracciones` (ver app/core/fine_store.py y el comando `ingest-fines`).
+
+El texto que devuelve el PDF trae palabras partidas por espacios sueltos
+('sa ncionado', 'inm ovilización'); se reparan uniendo los dos fragmentos
+cuando la palabra unida aparece en el documento más veces que alguno de ellos.
+"""
+
+import bisect
+import logging
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"[^\W\d_]+")
+# Palabra seguida de puntuación ('ucir,' -> 'ucir', ',')
+_LEADING_WORD_RE = re.compile(r"([^\W\d_]+)(.*)", re.DOTALL)
+_SPLIT_RE = re.compile(r"(\s+)")
+# Guion con espacios sueltos entre dos palabras ('técnico -mecánica')
+_HYPHEN_RE = re.compile(r"(?<=[^\W\d_]) ?- ?(?=[^\W\d_])")
+
+# Inicio de un artículo al comienzo de la línea ("Artículo 131. Modificado por ...")
+_ARTICLE_RE = r"(?m)^\s*Art[ií]culo\s+{number}\s*[.°]"
+# Texto original o anterior de un artículo modificado, citado al final de su versión vigente
+_ORIGINAL_TEXT_RE = r"Texto\s+(?:inicial|anterior)\s+del\s+art[ií]culo\s+{number}"
+# Los parágrafos van después de las listas de literales y sanciones
+_PARAGRAPH_RE = re.compile(r"^\s*Par[áa]grafo\b", re.IGNORECASE)
+
+# Art. 131: encabezado de literal ("B. Será sancionado ...") e ítem ("B.1.", "C. 29", "C.4")
+_LITERAL_RE = re.compile(r"^\s*([A-F])\.\s+(?=[^\W\d])")
+_ITEM_RE = re.compile(r"^\s*([A-E])\s?\.\s?(\d{1,2})\s?\.?\s+")
+# "cuatro (4) salarios mínimos", "mil ochenta (1.080) salarios mínimos"
+_SMLDV_RE = re.compile(r"\((\d{1,3}(?:\.\d{3})*)\)\s*salarios", re.IGNORECASE)
+
+# Art. 152: grado ("2. Primer grado de embriaguez ..."), reincidencia ("2.1. Primera Vez") y sanción
+_GRADE_RE = re.compile(r"^\s*(\d)\.\s+(?=[^\W\d])")
+_OCCURRENCE_RE = re.compile(r"^\s*\d\.\d\.?\s+(Primera|Segunda|Tercera)\s+vez\b", re.IGNORECASE)
+_SANCTION_RE = re.compile(r"^\s*\d\.\d\.\d\.?\s+")
+
+# Nota de vigencia al inicio de un literal ("Eliminado por la Ley 1696 de 2013, artículo 4°.")
+_LEGAL_NOTE_RE = re.compile(
+    r"^(?:Eliminado|Literal adicionado|Adicionado|Modificado)\s+por\s+la\s+Ley\s+[^.]*?\d+\s*°?\.\s*",
+    re.IGNORECASE
+)
+_NOTE_RE = re.compile(r"\s*\(Nota:.*?\)\.?", re.IGNORECASE | re.DOTALL)
+_SENTENCE_END_RE = re.compile(r"(?<=[^\W\d_)])\.(?:\s|$)")
+
+# Otras sanciones mencionadas en el texto de un literal
+_SANCTION_PATTERNS = (
+    (re.compile(r"motocicletas\s+se\s+proceder[áa]\s+a\s+su\s+inmovilizaci[óo]n", re.IGNORECASE),
+     'Inmovilización (motos)'),
+    (re.compile(r"inmoviliza", re.IGNORECASE), 'Inmovilización del vehículo'),
+    (re.compile(r"suspen\w*\s+(?:de\s+)?la\s+licencia", re.IGNORECASE), 'Suspensión de la licencia'),
+    (re.compile(r"art[ií]culo\s+152", re.IGNORECASE), 'Multa según el grado de alcoholemia (Art. 152)'),
+)
+
+OCCURRENCES = {'primera': 1, 'segunda': 2, 'tercera': 3}
+
+
+def read_pdf_pages(path: str) -> List[str]:
+    """
+    Texto de cada página del PDF
+
+    Usa pypdf, la misma librería con la que PyPDFLoader carga el PDF para el RAG.
+    """
+    from pypdf import PdfReader
+
+    return [page.extract_text() or '' for page in PdfReader(path).pages]
+
+
+def word_counts(text: str) -> Counter:
+    """Frecuencia de cada palabra (en minúsculas) en el documento"""
+    return Counter(word.lower() for word in _WORD_RE.findall(text))
+
+
+def repair_split_words(text: str, counts: Counter) -> str:
+    """
+    Une palabras partidas por un espacio suelto ('vis ibilidad' -> 'visibilidad').
+    Dos fragmentos se unen si la palabra resultante aparece en el documento
+    más veces que el menos frecuente de ellos: 'u n' se une ('un' es mucho más
+    común que 'n') pero 'a la' o 'sin o' no.
+    """
+    parts = _SPLIT_RE.split(text)
+    repaired = [parts[0]]
+    i = 1
+    while i < len(parts) - 1:
+        separator, word = parts[i], parts[i + 1]
+        previous = repaired[-1]
+        match = _LEADING_WORD_RE.fullmatch(word)
+        fragment = match.group(1) if match else ''
+        if (separator == ' ' and previous.isalpha() and fragment
+                and counts[(previous + fragment).lower()] > min(counts[previous.lower()], counts[fragment.lower()])):
+            repaired[-1] = previous + word
+        else:
+            repaired.extend((separator, word))
+        i += 2
+    return ''.join(repaired)
+
+
+def _clean(text: str, counts: Counter) -> str:
+    return _HYPHEN_RE.sub('-', repair_split_words(' '.join(text.split()), counts))
+
+
+def _article_span(text: str, number: int) -> Optional[Tuple[int, int]]:
+    """Inicio y fin del texto vigente de un artículo (sin su texto inicial citado)"""
+    start = re.search(_ARTICLE_RE.format(number=number), text)
+    if start is None:
+        return None
+    end = len(text)
+    for pattern in (_ARTICLE_RE.format(number=number + 1), _ORIGINAL_TEXT_RE.format(number=number)):
+        match = re.compile(pattern, re.IGNORECASE).search(text, start.end())
+        if match:
+            end = min(end, match.start())
+    return start.start(), end
+
+
+def _lines(text: str, start: int, end: int):
+    """(desplazamiento, línea) de cada línea no vacía del tramo"""
+    offset = start
+    for line in text[start:end].split('\n'):
+        if line.strip():
+            yield offset, line
+        offset += len(line) + 1
+
+
+def _smldv(text: str) -> Optional[int]:
+    """Salarios mínimos diarios citados en el texto ('(1.080) salarios' -> 1080)"""
+    found = _SMLDV_RE.search(text)
+    return int(found.group(1).replace('.', '')) if found else None
+
+
+def _description(text: str) -> str:
+    """Primera oración del literal, sin notas de vigencia ni de la Corte"""
+    text = _NOTE_RE.sub('', _LEGAL_NOTE_RE.sub('', text))
+    match = _SENTENCE_END_RE.search(text)
+    return (text[:match.start()] if match else text).strip(' .') + '.'
+
+
+def _other_sanctions(text: str) -> List[str]:
+    sanctions = []
+    for pattern, label in _SANCTION_PATTERNS:
+        if pattern.search(text):
+            # La inmovilización solo de motos no implica la del vehículo en general
+            if label == 'Inmovilización del vehículo' and 'Inmovilización (motos)' in sanctions:
+                continue
+            sanctions.append(label)
+    return sanctions
+
+
+def parse_article_131(text: str, counts: Counter, page_of=None) -> List[Dict]:
+    """
+    Literales del Artículo 131
+
+    Args:
+        text: Texto completo del documento
+        counts: Frecuencia de palabras del documento (ver word_counts)
+        page_of: Función desplazamiento -> número de página (opcional)
+
+    Returns:
+        list: Un dict por literal ('A.1' ... 'E.4' y 'F')
+    """
+    span = _article_span(text, 131)
+    if span is None:
+        logger.warning("No se encontró el Artículo 131 en el documento")
+        return []
+
+    fines = []
+    literal, header, smldv = None, [], None
+    code, item, item_offset = None, [], 0
+
+    def finish_item():
+        if code is None:
+            return
+        body = _clean(' '.join(item), counts)
+        fines.append({
+            'codigo': code,
+            'articulo': '131',
+            'literal': literal,
+            'descripcion': _description(body),
+            'texto': body,
+            'smldv': smldv,
+            'otras_sanciones': _other_sanctions(body),
+            'vigente': not body.lower().startswith('eliminado'),
+            'pagina': page_of(item_offset) if page_of else None,
+        })
+
+    for offset, line in _lines(text, *span):
+        if _PARAGRAPH_RE.match(line):
+            break
+        item_match = _ITEM_RE.match(line)
+        literal_match = None if item_match else _LITERAL_RE.match(line)
+        if item_match:
+            finish_item()
+            if smldv is None and header:
+                smldv = _smldv(' '.join(header))
+                header = []
+            code = f"{item_match.group(1)}.{int(item_match.group(2))}"
+            item, item_offset = [line[item_match.end():]], offset
+        elif literal_match:
+            finish_item()
+            literal, smldv = literal_match.group(1), None
+            rest = line[literal_match.end():]
+            if literal == 'F':
+                # El literal F no tiene ítems: es una sola conducta con la multa del Art. 152
+                code, item, item_offset, header = 'F', [rest], offset, []
+            else:
+                code, item, header = None, [], [rest]
+        elif code is not None:
+            item.append(line)
+        else:
+            header.append(line)
+    finish_item()
+    return fines
+
+
+def parse_article_152(text: str, counts: Counter, page_of=None) -> List[Dict]:
+    """
+    Sanciones por grado de alcoholemia y reincidencia del Artículo 152
+    (la multa del literal F del Artículo 131)
+
+    Returns:
+        list: Un dict por grado y reincidencia, con código '152-<grado>.<vez>'
+    """
+    span = _article_span(text, 152)
+    if span is None:
+        logger.warning("No se encontró el Artículo 152 en el documento")
+        return []
+
+    fines = []
+    grade, grade_text, occurrence = None, [], None
+    sanctions, occurrence_offset = [], 0
+
+    def finish_occurrence():
+        if occurrence is None:
+            return
+        cleaned = [_clean(s, counts).rstrip(' .') for s in sanctions]
+        fine = next((s for s in cleaned if s.lower().startswith('multa')), '')
+        grade_description = _clean(' '.join(grade_text), counts).split(', se impondrá')[0].rstrip(' ,:')
+        fines.append({
+            'codigo': f"152-{grade}.{occurrence}",
+            'articulo': '152',
+            'literal': 'F',
+            'descripcion': f"{grade_description} ({list(OCCURRENCES)[occurrence - 1]} vez).",
+            'texto': '. '.join(cleaned) + '.',
+            'smldv': _smldv(fine),
+            'otras_sanciones': [s for s in cleaned if s != fine],
+            'vigente': True,
+            'pagina': page_of(occurrence_offset) if page_of else None,
+        })
+
+    for offset, line in _lines(text, *span):
+        if _PARAGRAPH_RE.match(line):
+            break
+        occurrence_match = _OCCURRENCE_RE.match(line)
+        sanction_match = _SANCTION_RE.match(line)
+        grade_match = None if occurrence_match or sanction_match else _GRADE_RE.match(line)
+        if occurrence_match:
+            finish_occurrence()
+            # Por posición: el PDF numera mal algunas sanciones ('2.2.1' dentro de '2.1')
+            occurrence = OCCURRENCES[occurrence_match.group(1).lower()]
+            sanctions, occurrence_offset = [], offset
+        elif sanction_match and occurrence is not None:
+            sanctions.append(line[sanction_match.end():])
+        elif grade_match:
+            finish_occurrence()
+            grade, grade_text, occurrence = int(grade_match.group(1)), [line[grade_match.end():]], None
+        elif occurrence is not None and sanctions:
+            sanctions[-1] += ' ' + line
+        elif grade is not None and occurrence is None:
+            grade_text.append(line)
+    finish_occurrence()
+    return fines
+
+
+def extract_fines(pages: List[str]) -> List[Dict]:
+    """
+    Tablas de multas del documento (Art. 131 y Art. 152)
+
+    Args:
+        pages: Texto de cada página (ver read_pdf_pages)
+
+    Returns:
+        list: Filas para la tabla `infracciones`; 'pagina' es el número de página desde 1
+    """
+    text = '\n'.join(pages)
+    starts = []
+    offset = 0
+    for page in pages:
+        starts.append(offset)
+        offset += len(page) + 1
+
+    def page_of(position: int) -> int:
+        return bisect.bisect_right(starts, position)
+
+    counts = word_counts(text)
+    fines = parse_article_131(text, counts, page_of) + parse_article_152(text, counts, page_of)
+    logger.info(f"📑 {len(fines)} infracciones extraídas del documento")
+    return fines
@@ -4,6 +4,7 @@ from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 import os
 import logging
+from app.core.page_store import page_store
 
 logger = logging.getLogger(__name__)
 
@@ -26,10 +27,17 @@ class RAGSystem:
             loader = PyPDFLoader(PDF_PATH)
             documents = loader.load()
 
-            # Split
+            # Texto por página para /pdf/<archivo>/page/<n> (no bloquea el RAG si falla)
+            try:
+                page_store.save(PDF_PATH, [doc.page_content for doc in documents])
+            except Exception as e:
+                logger.warning(f"⚠️ No se guardaron las páginas del PDF: {e}")
+
+            # Split (start_index: posición de cada chunk en su página, para resaltar la cita)
             splitter = RecursiveCharacterTextSplitter(
                 chunk_size=1000,
-                chunk_overlap=200
+                chunk_overlap=200,
+                add_start_index=True
             )
             chunks = splitter.split_documents(documents)
 
@@ -1,9 +1,18 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+import json
+from types import SimpleNamespace
+from typing import Optional
+from flask import Blueprint, Response, g, request, jsonify, stream_with_context
+from flask_jwt_extended import create_access_token
 from sqlalchemy.orm import Session
-from app.config.database import SessionLocal
+from app.config.database import detach_request_db, get_request_db, read_only, reset_db_stats
 from app.models.models import Usuario, Conversation, Message
-import bcrypt
+from app.core.active_sessions import active_sessions_counter
+from app.core.message_store import message_writer, build_message_row, touch_conversations
+from app.core.identity import authenticated, identity_cache
+from app.core.message_archive import archived_page, load_archived_messages, merge_tiers
+from app.core.message_search import message_search
+from app.core.pagination import decode_cursor, encode_cursor, keyset_after, keyset_before, parse_limit
+from app.services.password_service import PasswordServiceBusy, password_service
 from datetime import datetime
 
 # Crear blueprint para rutas
@@ -12,13 +21,11 @@ bd_routes = Blueprint('routes', __name__)
 def register_routes(app):
     app.register_blueprint(routes_bp)
 
-# Función auxiliar para obtener DB session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def _busy_response():
+    """503 cuando el pool de contraseñas está saturado"""
+    response = jsonify({'success': False, 'message': 'Servicio ocupado, intenta de nuevo'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
 
 # Ruta de registro de usuario
 @bd_routes.route('/register', methods=['POST'])
@@ -35,12 +42,15 @@ def register():
     if not all([first_name, last_name, email, password]):
         return jsonify({'error': 'Campos obligatorios faltantes'}), 400
 
-    db = next(get_db())
+    db = get_request_db()
     if db.query(Usuario).filter_by(email=email).first():
         return jsonify({'error': 'Email ya registrado'}), 400
 
-    # Hash de password
-    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    # Hash de password (en el pool de procesos de bcrypt)
+    try:
+        hashed = password_service.hash_password(password)
+    except PasswordServiceBusy:
+        return _busy_response()
 
     nuevo_usuario = Usuario(
         first_name=first_name,
@@ -49,10 +59,12 @@ def register():
         birth_date = datetime.strptime(birth_date, '%d/%m/%Y') if birth_date else None,
         phone_number=phone_number,
         country_code=country_code,
-        password_hash=hashed.decode('utf-8')
+        password_hash=hashed
     )
     db.add(nuevo_usuario)
     db.commit()
+    # Un X-User-ID usado antes del registro pudo quedar en cache como inexistente
+    identity_cache.invalidate_user(nuevo_usuario.id)
     return jsonify({'message': 'Usuario registrado exitosamente'}), 201
 
 @bd_routes.route('/login', methods=['POST'])
@@ -64,10 +76,24 @@ def login():
     if not email or not password:
         return jsonify({'success': False, 'message': 'Email y password requeridos'}), 400
 
-    db = next(get_db())
-    usuario = db.query(Usuario).filter_by(email=email).first()
-    if not usuario or not bcrypt.checkpw(password.encode('utf-8'), usuario.password_hash.encode('utf-8')):
-        return jsonify({'success': False, 'message': 'Credenciales inválidas'}), 401
+    db = get_request_db()
+    usuario = db.query(Usuario.id, Usuario.email, Usuario.first_name, Usuario.last_name, Usuario.password_hash) \
+        .filter(Usuario.email == email).first()
+    # bcrypt tarda: la conexión vuelve al pool mientras se verifica la contraseña
+    db.rollback()
+    try:
+        if not usuario or not password_service.verify_password(password, usuario.password_hash):
+            return jsonify({'success': False, 'message': 'Credenciales inválidas'}), 401
+        # Hash con un costo anterior: se actualiza ahora que tenemos la contraseña en claro
+        new_hash = password_service.rehash_if_needed(password, usuario.password_hash)
+    except PasswordServiceBusy:
+        return _busy_response()
+    if new_hash:
+        # Solo si el hash no cambió mientras tanto (p. ej. un cambio de contraseña)
+        db.query(Usuario).filter(Usuario.id == usuario.id, Usuario.password_hash == usuario.password_hash) \
+            .update({Usuario.password_hash: new_hash}, synchronize_session=False)
+        db.commit()
+    identity_cache.remember_user(usuario)
 
     access_token = create_access_token(identity=str(usuario.id))
     
@@ -84,88 +110,321 @@ def login():
 
 # Ruta para crear conversación (requiere auth)
 @bd_routes.route('/conversations', methods=['POST'])
-@jwt_required()
+@authenticated()
 def create_conversation():
-    user_id = int(get_jwt_identity())
+    user_id = g.user_id
     data = request.get_json()
     session_id = data.get('session_id')
 
     if not session_id:
         return jsonify({'error': 'session_id requerido'}), 400
 
-    db = next(get_db())
+    db = get_request_db()
     nueva_conv = Conversation(usuario_id=user_id, session_id=session_id)
     db.add(nueva_conv)
     db.commit()
+    identity_cache.add_conversation(user_id, nueva_conv.id)
+    active_sessions_counter.adjust(1)
     return jsonify({'id': nueva_conv.id, 'message': 'Conversación creada'}), 201
 
+def _page_params():
+    """
+    Lee los parámetros de paginación por cursor: limit, before y after
+
+    Raises:
+        ValueError: Si algún parámetro es inválido
+    """
+    limit = parse_limit(request.args.get('limit'))
+    before = request.args.get('before')
+    after = request.args.get('after')
+    if before and after:
+        raise ValueError("Usa before o after, no ambos")
+    for cursor in (before, after):
+        if cursor:
+            decode_cursor(cursor)
+    return limit, before, after
+
+def _wants_ndjson() -> bool:
+    """El cliente pidió NDJSON en streaming (?format=ndjson o Accept: application/x-ndjson)"""
+    return (request.args.get('format') == 'ndjson'
+            or request.accept_mimetypes.best == 'application/x-ndjson')
+
+def _ndjson_response(rows, serialize, headers: Optional[dict] = None) -> Response:
+    """Respuesta en streaming, una fila JSON por línea, sin materializar la lista"""
+    # El generador se ejecuta después del teardown: la sesión del request pasa a él
+    db = detach_request_db()
+    endpoint = request.endpoint
+
+    def generate():
+        reset_db_stats(endpoint)
+        try:
+            for row in rows:
+                yield json.dumps(serialize(row), ensure_ascii=False) + "\n"
+        finally:
+            if db is not None:
+                db.close()
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson', headers=headers)
+
+def _serialize_conversation(c) -> dict:
+    return {
+        'id': c.id,
+        'session_id': c.session_id,
+        'status': c.status,
+        'started_at': c.started_at.isoformat(),
+        'ended_at': c.ended_at.isoformat() if c.ended_at else None,
+        'message_count': c.message_count,
+        'last_message_preview': c.last_message_preview or "Sin mensajes",
+        'last_message_time': (c.last_message_at or c.started_at).isoformat()
+    }
+
+def _serialize_message(m) -> dict:
+    return {'id': m.id, 'sender': m.sender, 'message': m.message, 'created_at': m.created_at.isoformat()}
+
 # Ruta para listar conversaciones del usuario (requiere auth)
+# Sin parámetros devuelve la lista completa; con limit/before/after pagina por cursor
+# sobre (started_at, id) y con ?format=ndjson transmite las filas en streaming.
 @bd_routes.route('/conversations', methods=['GET'])
-@jwt_required()
+@authenticated()
+@read_only
 def get_conversations():
-    user_id = int(get_jwt_identity())
-    db = next(get_db())
-    convs = db.query(Conversation).filter_by(usuario_id=user_id).order_by(Conversation.started_at.desc()).all()
-    
-    result = []
-    for c in convs:
-        # Contar mensajes de la conversación
-        message_count = db.query(Message).filter_by(conversacion_id=c.id).count()
-        
-        # Obtener último mensaje para preview
-        last_message = db.query(Message).filter_by(conversacion_id=c.id).order_by(Message.created_at.desc()).first()
-        last_message_preview = last_message.message[:100] if last_message else "Sin mensajes"
-        last_message_time = last_message.created_at.isoformat() if last_message else c.started_at.isoformat()
-        
-        result.append({
-            'id': c.id,
-            'session_id': c.session_id,
-            'status': c.status,
-            'started_at': c.started_at.isoformat(),
-            'ended_at': c.ended_at.isoformat() if c.ended_at else None,
-            'message_count': message_count,
-            'last_message_preview': last_message_preview,
-            'last_message_time': last_message_time
-        })
-    
-    return jsonify(result), 200
+    user_id = g.user_id
+    try:
+        limit, before, after = _page_params()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    db = get_request_db()
+    # Una sola consulta: el conteo y el último mensaje están desnormalizados en la conversación
+    query = db.query(
+        Conversation.id, Conversation.session_id, Conversation.status,
+        Conversation.started_at, Conversation.ended_at, Conversation.message_count,
+        Conversation.last_message_at, Conversation.last_message_preview
+    ).filter(Conversation.usuario_id == user_id)
+
+    # Orden natural: más recientes primero; `after` pide las más nuevas que el cursor
+    if after:
+        query = query.filter(keyset_after(Conversation.started_at, Conversation.id, after))
+        query = query.order_by(Conversation.started_at.asc(), Conversation.id.asc())
+    else:
+        if before:
+            query = query.filter(keyset_before(Conversation.started_at, Conversation.id, before))
+        query = query.order_by(Conversation.started_at.desc(), Conversation.id.desc())
+
+    if _wants_ndjson():
+        if limit:
+            query = query.limit(limit)
+        return _ndjson_response(query.yield_per(500), _serialize_conversation)
+
+    if limit is None and not before and not after:
+        return jsonify([_serialize_conversation(c) for c in query.all()]), 200
+
+    limit = limit or 50
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after:
+        rows.reverse()
+    return jsonify({
+        'conversations': [_serialize_conversation(c) for c in rows],
+        'has_more': has_more,
+        'before_cursor': encode_cursor(rows[-1].started_at, rows[-1].id) if rows else None,
+        'after_cursor': encode_cursor(rows[0].started_at, rows[0].id) if rows else None
+    }), 200
 
 # Ruta para enviar mensaje (requiere auth)
 @bd_routes.route('/messages', methods=['POST'])
-@jwt_required()
+@authenticated()
 def send_message():
-    user_id = int(get_jwt_identity())
+    user_id = g.user_id
     data = request.get_json()
     conversation_id = data.get('conversation_id')
     message = data.get('message')
 
     if not conversation_id or not message:
         return jsonify({'error': 'conversation_id y message requeridos'}), 400
+    try:
+        conversation_id = int(conversation_id)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'conversation_id debe ser un entero'}), 400
 
-    db = next(get_db())
-    conv = db.query(Conversation).filter_by(id=conversation_id, usuario_id=user_id).first()
-    if not conv:
+    db = get_request_db()
+    # Propiedad desde la cache de identidad: sin consultar la conversación
+    if identity_cache.conversation_access(db, user_id, conversation_id) is None:
         return jsonify({'error': 'Conversación no encontrada'}), 404
 
-    nuevo_msg = Message(conversacion_id=conversation_id, sender='usuario', message=message)
+    nuevo_msg = Message(conversacion_id=conversation_id, sender='usuario', message=message,
+                        created_at=datetime.utcnow())
     db.add(nuevo_msg)
+    db.flush()
+    message_id = nuevo_msg.id
+    message_search.index(db, [{'id': message_id, 'conversacion_id': conversation_id, 'message': message}],
+                         usuario_id=user_id)
+    reactivated = touch_conversations(db, [build_message_row(conversation_id, 'usuario', message, nuevo_msg.created_at)])
     db.commit()
+    active_sessions_counter.adjust(reactivated)
 
     # Aquí puedes agregar lógica para respuesta del chatbot (ej. llamar a una función de IA)
     # Por ahora, solo guardamos el mensaje del usuario
 
-    return jsonify({'id': nuevo_msg.id, 'message': 'Mensaje enviado'}), 201
+    return jsonify({'id': message_id, 'message': 'Mensaje enviado'}), 201
+
+# Ruta para buscar en el historial del usuario (requiere auth)
+# ?q=texto libre (todas las palabras, sin tildes ni plurales), ordenado por relevancia.
+# Pagina con limit/offset; conversation_id restringe a una conversación.
+@bd_routes.route('/messages/search', methods=['GET'])
+@authenticated()
+@read_only
+def search_messages():
+    user_id = g.user_id
+    q = (request.args.get('q') or '').strip()
+    if not q:
+        return jsonify({'error': 'q requerido'}), 400
+    try:
+        limit = parse_limit(request.args.get('limit'), default=20)
+        offset = int(request.args.get('offset', 0))
+        conversation_id = request.args.get('conversation_id', type=int)
+        if offset < 0:
+            raise ValueError("offset no puede ser negativo")
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not message_search.enabled:
+        return jsonify({'error': 'Búsqueda no disponible'}), 503
+
+    db = get_request_db()
+    rows = message_search.search(db, user_id, q, limit=limit + 1, offset=offset, conversation_id=conversation_id)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return jsonify({
+        'results': [
+            {**_serialize_message(r), 'conversation_id': r.conversacion_id, 'session_id': r.session_id,
+             'score': round(float(r.score), 4)}
+            for r in rows
+        ],
+        'has_more': has_more,
+        'next_offset': offset + len(rows) if has_more else None
+    }), 200
 
 # Ruta para obtener mensajes de una conversación (requiere auth)
+# Sin parámetros devuelve todos los mensajes; con limit/before/after pagina por cursor
+# sobre (created_at, id) y con ?format=ndjson transmite las filas en streaming
+# (paginado: has_more y los cursores en las cabeceras X-Has-More, X-Before-Cursor y X-After-Cursor).
+# Si la conversación fue archivada, combina la tabla caliente con el archivo comprimido.
 @bd_routes.route('/messages/<int:conversation_id>', methods=['GET'])
-@jwt_required()
+@authenticated()
+@read_only
 def get_messages(conversation_id):
-    user_id = int(get_jwt_identity())
-    db = next(get_db())
-    conv = db.query(Conversation).filter_by(id=conversation_id, usuario_id=user_id).first()
-    if not conv:
+    user_id = g.user_id
+    try:
+        limit, before, after = _page_params()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    db = get_request_db()
+    access = identity_cache.conversation_access(db, user_id, conversation_id)
+    if access is None:
         return jsonify({'error': 'Conversación no encontrada'}), 404
+    has_archive = access.archived
+    if not has_archive and access.status == 'finalizada':
+        # Solo una conversación finalizada puede haberse archivado después de llenar la cache
+        # (p. ej. desde la CLI en otro proceso): se confirma en la BD
+        has_archive = db.query(Conversation.archived_at).filter(Conversation.id == conversation_id).scalar() is not None
+        if has_archive:
+            identity_cache.invalidate_conversations(user_id)
+
+    # Mensajes aún en la cola de escritura diferida (leídos antes que la BD para no perder ninguno).
+    # Son más nuevos que cualquier mensaje persistido y se ordenan con ellos antes de aplicar el límite.
+    pending = _pending_messages(conversation_id, before, after)
+
+    query = db.query(Message.id, Message.sender, Message.message, Message.created_at) \
+        .filter(Message.conversacion_id == conversation_id)
+
+    paginated = limit is not None or before or after
+    descending = bool(paginated and not after)
+    if descending:
+        # Página más reciente o anterior al cursor: se lee descendente y se invierte
+        if before:
+            query = query.filter(keyset_before(Message.created_at, Message.id, before))
+        query = query.order_by(Message.created_at.desc(), Message.id.desc())
+    else:
+        if after:
+            query = query.filter(keyset_after(Message.created_at, Message.id, after))
+        query = query.order_by(Message.created_at.asc(), Message.id.asc())
+
+    # Nivel frío: solo se consulta si la conversación tiene mensajes archivados
+    archived = []
+    if has_archive:
+        archived = archived_page(load_archived_messages(db, conversation_id), before, after, descending)
+
+    def fetch(n=None):
+        hot = query.limit(n).all() if n else query.all()
+        if archived:
+            hot = list(merge_tiers(hot, archived, descending))[:n]
+        # Un pendiente que ya se guardó entre la lectura de la cola y la consulta no se repite
+        persisted = {(m.created_at, m.sender, m.message) for m in hot}
+        extra = [m for m in pending if (m.created_at, m.sender, m.message) not in persisted]
+        if not extra:
+            return hot
+        return sorted(hot + extra, key=_message_key, reverse=descending)[:n]
+
+    if _wants_ndjson():
+        if not paginated:
+            def stream_rows():
+                persisted = set()
+                for m in merge_tiers(query.yield_per(500), archived):
+                    persisted.add((m.created_at, m.sender, m.message))
+                    yield m
+                for m in pending:
+                    if (m.created_at, m.sender, m.message) not in persisted:
+                        yield m
+            return _ndjson_response(stream_rows(), _serialize_message)
+        # Página: has_more y los cursores van en cabeceras, las líneas son solo mensajes
+        limit = limit or 50
+        rows = fetch(limit + 1)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if descending:
+            rows.reverse()
+        headers = {'X-Has-More': 'true' if has_more else 'false'}
+        if rows:
+            headers['X-Before-Cursor'] = _message_cursor(rows[0], 0)
+            headers['X-After-Cursor'] = _message_cursor(rows[-1], PENDING_MESSAGE_ID)
+        return _ndjson_response(rows, _serialize_message, headers)
+
+    if not paginated:
+        return jsonify([_serialize_message(m) for m in fetch()]), 200
+
+    limit = limit or 50
+    msgs = fetch(limit + 1)
+    has_more = len(msgs) > limit
+    msgs = msgs[:limit]
+    if descending:
+        msgs.reverse()
+    return jsonify({
+        'messages': [_serialize_message(m) for m in msgs],
+        'has_more': has_more,
+        'before_cursor': _message_cursor(msgs[0], 0) if msgs else None,
+        'after_cursor': _message_cursor(msgs[-1], PENDING_MESSAGE_ID) if msgs else None
+    }), 200
+
+# Los mensajes pendientes aún no tienen id: en su clave de orden y en el cursor
+# "after" usan el máximo (van después de cualquier fila con la misma fecha) y en
+# el cursor "before" usan 0. Ninguna página repite el mensaje una vez guardado.
+PENDING_MESSAGE_ID = 2 ** 63 - 1
+
+def _pending_messages(conversation_id: int, before: Optional[str], after: Optional[str]) -> list:
+    """Mensajes de la escritura diferida que caen dentro del cursor, en orden ascendente"""
+    rows = [SimpleNamespace(id=None, sender=row['sender'], message=row['message'], created_at=row['created_at'])
+            for row in message_writer.pending_for(conversation_id)]
+    if before:
+        key = decode_cursor(before)
+        rows = [m for m in rows if _message_key(m) < key]
+    elif after:
+        key = decode_cursor(after)
+        rows = [m for m in rows if _message_key(m) > key]
+    return sorted(rows, key=_message_key)
+
+def _message_key(m):
+    return m.created_at, PENDING_MESSAGE_ID if m.id is None else m.id
 
-    msgs = db.query(Message).filter_by(conversacion_id=conversation_id).order_by(Message.created_at).all()
-    result = [{'id': m.id, 'sender': m.sender, 'message': m.message, 'created_at': m.created_at.isoformat()} for m in msgs]
-    return jsonify(result), 200
+def _message_cursor(m, pending_id: int) -> str:
+    return encode_cursor(m.created_at, pending_id if m.id is None else m.id)
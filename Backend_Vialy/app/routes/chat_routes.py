@@ -3,10 +3,25 @@ Rutas de chat - Versión completa con usuario_id y DB
 """
 
 import logging
-import hashlib
+import time
+import uuid
+from typing import Optional
+import numpy as np
 from flask import Blueprint, request, jsonify, g
-from app.config.database import get_db
-from app.core.session_manager import SessionManager
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
+from app.config.database import get_request_db, get_db_stats, read_only
+from app.config.settings import Config
+from app.core.fine_store import fine_store
+from app.core.identity import IdentityError, authenticated, resolve_identity
+from app.core.query_context import QueryContext, find_embeddings
+from app.core.active_sessions import active_sessions_counter
+from app.core.session_manager import SessionManager, SessionOwnershipError
+from app.core.message_search import message_search
+from app.core.message_store import message_writer
+from app.core.metrics import metrics
+from app.core.ollama_context import ollama_context_store
+from app.core.page_store import citation_fields
 from app.models.models import Message  # Importar Message para los endpoints
 
 logger = logging.getLogger(__name__)
@@ -18,17 +33,35 @@ qa_chain = None
 llm_model = None
 classification_service = None
 response_service = None
-# Cache de respuestas
+# Modelo de embeddings del vectorstore (uno por consulta, compartido por todas las etapas)
+query_embeddings = None
+# Cache de respuestas (clave: QueryContext.cache_key)
 response_cache = {}
+# Embedding normalizado de cada pregunta en cache (solo con SEMANTIC_CACHE_THRESHOLD > 0)
+response_cache_vectors = {}
 MAX_CACHE_SIZE = 100
 
-def get_cache_key(query: str) -> str:
-    """Genera una clave de cache para una query"""
-    return hashlib.md5(query.lower().strip().encode()).hexdigest()
+def find_cached_response(query_ctx: QueryContext) -> Optional[str]:
+    """
+    Clave de la respuesta en cache para la consulta: coincidencia exacta del
+    texto normalizado o, si la cache semántica está activa, la pregunta
+    guardada más similar por encima del umbral (con el embedding del contexto)
+    """
+    if query_ctx.cache_key in response_cache:
+        return query_ctx.cache_key
+    if Config.SEMANTIC_CACHE_THRESHOLD <= 0 or not response_cache_vectors or not query_ctx.has_embeddings:
+        return None
+    vector = query_ctx.vector
+    if vector is None:
+        return None
+    keys = list(response_cache_vectors)
+    similarities = np.vstack([response_cache_vectors[key] for key in keys]) @ vector
+    best = int(np.argmax(similarities))
+    return keys[best] if similarities[best] >= Config.SEMANTIC_CACHE_THRESHOLD else None
 
 def initialize_services():
     """Inicializa todos los servicios necesarios"""
-    global qa_chain, llm_model, classification_service, response_service
+    global qa_chain, llm_model, classification_service, response_service, query_embeddings
     
     try:
         logger.info("[INIT] 🚀 Iniciando servicios...")
@@ -42,7 +75,8 @@ def initialize_services():
         from app.services.classification_service import ClassificationService
         from app.services.response_service import ResponseService
         
-        classification_service = ClassificationService(llm_model)
+        query_embeddings = find_embeddings(qa_chain)
+        classification_service = ClassificationService(llm_model, embeddings=query_embeddings)
         response_service = ResponseService(qa_chain, llm_model)
         logger.info("[INIT] ✅ Servicios de clasificación y respuesta inicializados")
         
@@ -55,10 +89,11 @@ services_initialized = initialize_services()
 
 @chat_bp.before_request
 def inject_db():
-    """Asigna la sesión de DB a g.db para cada request"""
-    g.db = next(get_db())
+    """Asigna la sesión de DB del request a g.db (se cierra en el teardown de la app)"""
+    g.db = get_request_db()
 
 @chat_bp.route('/ask', methods=['POST'])
+@authenticated(allow_header=True)
 def ask_question():
     if not services_initialized or not all([qa_chain, llm_model, classification_service, response_service]):
         return jsonify({"error": "Servicios no disponibles", "status": "degraded"}), 503
@@ -72,68 +107,107 @@ def ask_question():
         if not query or len(query) < 3:
             return jsonify({"error": "Consulta demasiado corta"}), 400
 
-        # Obtener usuario obligatorio
-        usuario_id = request.headers.get("X-User-ID")
-        if not usuario_id:
-            return jsonify({"error": "Se requiere X-User-ID en headers"}), 400
-        try:
-            usuario_id = int(usuario_id)
-        except ValueError:
-            return jsonify({"error": "X-User-ID debe ser un entero"}), 400
+        # Usuario resuelto por @authenticated: JWT o, sin token, X-User-ID
+        usuario_id = g.user_id
+        started = time.perf_counter()
 
         # Crear instancia de SessionManager con la conexión a DB
         session_manager = SessionManager(db=g.db)
         
-        # Obtener o crear sesión
-        session_id = request.headers.get("X-Session-ID")
-        session_id = session_manager.get_or_create_session(usuario_id=usuario_id, session_id=session_id)
+        # La conversación se crea (si falta) al persistir el turno en record_turn
+        session_id = request.headers.get("X-Session-ID") or str(uuid.uuid4())
+        # La sesión de otro usuario no se puede continuar (el estado queda en cache para el historial)
+        with metrics.stage('session_lookup'):
+            owner_id = session_manager.get_session_owner(session_id)
+        if owner_id is not None and owner_id != usuario_id:
+            return jsonify({"error": "La sesión pertenece a otro usuario"}), 403
+
+        # Texto normalizado, keywords y embedding de la consulta: se calculan una vez y
+        # los reutilizan la cache, la clasificación y la búsqueda RAG
+        query_ctx = QueryContext(query, embeddings=query_embeddings)
 
         # Revisar cache
-        cache_key = get_cache_key(query)
-        if cache_key in response_cache:
-            cached_response = response_cache[cache_key].copy()
+        with metrics.stage('cache_lookup'):
+            cached_key = find_cached_response(query_ctx)
+        if cached_key is not None:
+            cached_response = response_cache[cached_key].copy()
             cached_response['session_id'] = session_id
-            session_manager.add_message(session_id=session_id, user_message=query, assistant_message=cached_response['response'], category=cached_response.get('category'))
+            with metrics.stage('persistence'):
+                try:
+                    cached_response['conversation_id'] = session_manager.record_turn(
+                        usuario_id=usuario_id, session_id=session_id, user_message=query,
+                        assistant_message=cached_response['response'], category=cached_response.get('category')
+                    )
+                except SessionOwnershipError:
+                    return jsonify({"error": "La sesión pertenece a otro usuario"}), 403
+            # El contexto de Ollama no incluye este turno: volver a modo transcripción
+            ollama_context_store.discard(session_id)
+            metrics.observe_request(time.perf_counter() - started, cached_response.get('category'),
+                                    'hit' if cached_key == query_ctx.cache_key else 'semantic_hit')
             return jsonify(cached_response), 200
 
         # Clasificación
-        try:
-            category, intent = classification_service.analyze_query(query)
-        except Exception:
-            category = "GENERAL"
-            intent = 1
-
-        # 🔴 FALTA ESTA LÍNEA: Obtener historial ANTES de usarlo
-        history = session_manager.get_history(session_id, max_messages=3)
+        with metrics.stage('classification'):
+            try:
+                category, intent = classification_service.analyze_query(query, query_ctx=query_ctx)
+            except Exception:
+                category = "GENERAL"
+                intent = 1
 
-        # Generar respuesta
-        try:
-            if hasattr(response_service, 'process_query'):
-                # ✅ Ahora history está definido
-                result = response_service.process_query(query=query, category=category, history=history)
-            else:
-                rag_result = qa_chain.invoke({"query": query})
-                source_docs = rag_result.get("source_documents", [])
-                context_texts = [doc.page_content.strip() for doc in source_docs]
-                context = "\n\n".join(f"- {ctx}" for ctx in context_texts) if context_texts else "Sin contexto."
-                # ✅ Ahora history está definido
-                response_text = response_service.generate_response(query=query, category=category, history=history, context=context)
-                formatted_sources = [
-                    {"extracto": doc.page_content[:300], "pagina": doc.metadata.get("page"), "archivo": doc.metadata.get("source", "documento")}
-                    for doc in source_docs[:3]
-                ]
-                result = {"response": response_text, "sources": formatted_sources, "context_used": len(formatted_sources) > 0}
-        except Exception as e:
-            logger.error(f"Error generando respuesta: {e}", exc_info=True)
-            return jsonify({"error": "Error generando respuesta"}), 500
+        # Consulta que cita un código de infracción (C.29, D.1): respuesta exacta desde la
+        # tabla extraída del Código, sin RAG ni LLM
+        with metrics.stage('fine_table'):
+            result = fine_store.exact_answer(query, g.db) if Config.EXACT_FINE_ANSWERS else None
+        cache_outcome = 'miss' if result is None else 'fine_table'
+        if result is not None:
+            # El contexto de Ollama no incluye este turno: volver a modo transcripción
+            ollama_context_store.discard(session_id)
+        else:
+            with metrics.stage('history'):
+                # 🔴 FALTA ESTA LÍNEA: Obtener historial ANTES de usarlo
+                history = session_manager.get_history(session_id, max_messages=3)
+                # Contexto acumulado (temas, infracciones, artículos): texto en cache; sesión nueva = sin contexto
+                conversation_context = session_manager.get_conversation_context(session_id) if owner_id is not None else ""
 
-        # Guardar mensajes
-        session_manager.add_message(session_id=session_id, user_message=query, assistant_message=result['response'], category=category)
+            # Generar respuesta
+            try:
+                if hasattr(response_service, 'process_query'):
+                    # ✅ Ahora history está definido
+                    result = response_service.process_query(query=query, category=category, history=history,
+                                                            session_id=session_id, conversation_context=conversation_context,
+                                                            query_ctx=query_ctx)
+                else:
+                    with metrics.stage('retrieval'):
+                        rag_result = qa_chain.invoke({"query": query})
+                    source_docs = rag_result.get("source_documents", [])
+                    context_texts = [doc.page_content.strip() for doc in source_docs]
+                    context = "\n\n".join(f"- {ctx}" for ctx in context_texts) if context_texts else "Sin contexto."
+                    # ✅ Ahora history está definido
+                    response_text = response_service.generate_response(query=query, category=category, history=history, context=context,
+                                                                       session_id=session_id, conversation_context=conversation_context)
+                    formatted_sources = [
+                        {"extracto": doc.page_content[:300], "pagina": doc.metadata.get("page"), "archivo": doc.metadata.get("source", "documento"),
+                         **citation_fields(doc.metadata, len(doc.page_content))}
+                        for doc in source_docs[:3]
+                    ]
+                    result = {"response": response_text, "sources": formatted_sources, "context_used": len(formatted_sources) > 0}
+            except Exception as e:
+                logger.error(f"Error generando respuesta: {e}", exc_info=True)
+                return jsonify({"error": "Error generando respuesta"}), 500
 
-        # Obtener el conversation_id numérico para devolverlo al frontend
-        from app.models.models import Conversation
-        conv = g.db.query(Conversation).filter_by(session_id=session_id).first()
-        conversation_id = conv.id if conv else None
+        # Guardar el turno completo en una sola transacción y obtener el conversation_id numérico
+        # Otra petición pudo crear la misma sesión para otro usuario mientras se generaba la respuesta
+        with metrics.stage('persistence'):
+            try:
+                conversation_id = session_manager.record_turn(
+                    usuario_id=usuario_id, session_id=session_id, user_message=query,
+                    assistant_message=result['response'], category=category
+                )
+            except SessionOwnershipError:
+                return jsonify({"error": "La sesión pertenece a otro usuario"}), 403
+        db_stats = get_db_stats()
+        logger.info(f"⏱️ BD en /ask: {db_stats['queries']} consultas, {db_stats['commits']} commits, {db_stats['time_ms']} ms, "
+                    f"{query_ctx.embedding_calls} embeddings")
 
         # Construir respuesta
         response = {
@@ -148,14 +222,19 @@ def ask_question():
 
         # Guardar cache
         if len(response_cache) >= MAX_CACHE_SIZE:
-            response_cache.pop(next(iter(response_cache)))
-        response_cache[cache_key] = {
+            oldest = next(iter(response_cache))
+            response_cache.pop(oldest)
+            response_cache_vectors.pop(oldest, None)
+        if Config.SEMANTIC_CACHE_THRESHOLD > 0 and query_ctx.vector is not None:
+            response_cache_vectors[query_ctx.cache_key] = query_ctx.vector
+        response_cache[query_ctx.cache_key] = {
             "response": result['response'],
             "sources": result.get('sources', []),
             "context_used": result.get('context_used', False),
             "category": category,
             "intent": intent
         }
+        metrics.observe_request(time.perf_counter() - started, category, cache_outcome)
 
         return jsonify(response), 200
 
@@ -184,16 +263,22 @@ def clear_history():
             conv = session_manager.db.query(Conversation).filter_by(session_id=session_id).first()
             if conv:
                 # ✅ Importamos Message al inicio del archivo, así que está disponible
-                # Eliminar mensajes asociados primero
+                # Eliminar mensajes asociados primero (incluidos los pendientes de escritura)
+                message_writer.discard(conv.id)
+                message_search.unindex_conversations(session_manager.db, [conv.id])
                 session_manager.db.query(Message).filter_by(conversacion_id=conv.id).delete()
                 # Eliminar conversación
+                was_active = conv.status == 'activa'
                 session_manager.db.delete(conv)
                 session_manager.db.commit()
+                if was_active:
+                    active_sessions_counter.adjust(-1)
                 success = True
             else:
                 success = False
         
         if success:
+            ollama_context_store.discard(session_id)
             return jsonify({"message": "Historial limpiado correctamente", "session_id": session_id}), 200
         return jsonify({"error": "Sesión no encontrada"}), 404
     except Exception as e:
@@ -201,10 +286,17 @@ def clear_history():
         return jsonify({"error": "Error al limpiar historial"}), 500
 
 @chat_bp.route('/session/<session_id>', methods=['GET'])
+@read_only
 def get_session_info(session_id):
     """Endpoint para obtener info de sesión"""
     try:
-        session_manager = SessionManager(db=g.db)
+        try:
+            # Solo un JWT válido asocia el usuario (lectura desde la primaria si escribió hace poco);
+            # X-User-ID no se verifica aquí y no puede elegir la afinidad de otro usuario
+            resolve_identity()
+        except (IdentityError, JWTExtendedException, PyJWTError):
+            pass
+        session_manager = SessionManager(db=get_request_db())
         
         # Verificar si el método get_session_info existe
         if hasattr(session_manager, 'get_session_info'):
@@ -214,14 +306,13 @@ def get_session_info(session_id):
             from app.models.models import Conversation
             conv = session_manager.db.query(Conversation).filter_by(session_id=session_id).first()
             if conv:
-                # ✅ Importamos Message al inicio del archivo
-                message_count = session_manager.db.query(Message).filter_by(conversacion_id=conv.id).count()
                 info = {
                     "session_id": conv.session_id,
                     "usuario_id": conv.usuario_id,
                     "started_at": conv.started_at.isoformat() if conv.started_at else None,
                     "status": conv.status,
-                    "message_count": message_count
+                    # Conteo desnormalizado: incluye los mensajes archivados
+                    "message_count": conv.message_count
                 }
             else:
                 info = None
@@ -237,18 +328,8 @@ def get_session_info(session_id):
 def get_active_sessions():
     """Número de sesiones activas"""
     try:
-        session_manager = SessionManager(db=g.db)
-        
-        # Verificar si los métodos existen
-        if hasattr(session_manager, 'cleanup_expired_sessions'):
-            session_manager.cleanup_expired_sessions()
-        
-        if hasattr(session_manager, 'get_active_sessions_count'):
-            count = session_manager.get_active_sessions_count()
-        else:
-            # Alternativa: contar conversaciones activas
-            from app.models.models import Conversation
-            count = session_manager.db.query(Conversation).filter_by(status='activa').count()
+        # Conteo en memoria que actualiza session_expiry_job (sin COUNT por request)
+        count = SessionManager(db=g.db).get_active_sessions_count()
         
         return jsonify({
             "active_sessions": count, 
@@ -263,8 +344,8 @@ def get_active_sessions():
 def clear_cache():
     """Limpia cache de respuestas"""
     try:
-        global response_cache
-        response_cache = {}
+        response_cache.clear()
+        response_cache_vectors.clear()
         return jsonify({"message": "Cache limpiado correctamente"}), 200
     except Exception as e:
         logger.error(f"Error limpiando cache: {str(e)}")
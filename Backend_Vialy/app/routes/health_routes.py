@@ -3,8 +3,10 @@ Rutas de salud y estado del servicio.
 """
 
 import logging
-from flask import Blueprint, jsonify
+from flask import Blueprint, Response, jsonify
 from app.config.settings import Config
+from app.config.database import get_pool_stats
+from app.core.metrics import metrics
 from app.core.session_manager import session_manager
 
 logger = logging.getLogger(__name__)
@@ -17,9 +19,7 @@ def health_check():
     """Endpoint para verificar el estado del servicio"""
     from app.routes.chat_routes import qa_chain, llm_model
     
-    # Limpiar sesiones expiradas
-    session_manager.cleanup_expired_sessions()
-    
+    # Las sesiones expiradas las finaliza session_expiry_job; aquí solo se lee el conteo en memoria
     return jsonify({
         "status": "healthy" if qa_chain and llm_model else "degraded",
         "model": Config.MODEL_NAME,
@@ -28,6 +28,18 @@ def health_check():
         "version": Config.API_VERSION
     }), 200
 
+@health_bp.route('/health/db', methods=['GET'])
+def db_pool_health():
+    """Métricas del pool de conexiones (ocupación, overflow, espera y uso por endpoint)"""
+    return jsonify(get_pool_stats()), 200
+
+@health_bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Latencia por etapa de /ask y tokens del LLM en formato Prometheus (METRICS_ENABLED=true)"""
+    if not metrics.enabled:
+        return jsonify({"error": "Métricas desactivadas (METRICS_ENABLED=false)"}), 404
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @health_bp.route('/', methods=['GET'])
 def root():
     """Endpoint raíz con información de la API"""
@@ -36,10 +48,14 @@ def root():
         "endpoints": {
             "documentación": "/docs",
             "salud": "/health",
+            "pool_bd": "/health/db (GET)",
             "consultas": "/ask (POST)",
             "limpiar_historial": "/clear-history (POST)",
             "info_sesión": "/session/<session_id> (GET)",
-            "sesiones_activas": "/sessions/active (GET)"
+            "sesiones_activas": "/sessions/active (GET)",
+            "buscar_infracciones": "/infracciones/search?q= (GET)",
+            "documentos": "/pdf/list (GET)",
+            "métricas": "/metrics (GET)"
         },
         "version": Config.API_VERSION,
         "features": [
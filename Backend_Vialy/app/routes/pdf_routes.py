@@ -4,27 +4,92 @@ Rutas para servir el PDF del Código de Tránsito
 
 import os
 import logging
-from flask import Blueprint, send_file, jsonify
+from urllib.parse import quote
+from flask import Blueprint, current_app, send_file, jsonify, request
 from werkzeug.utils import secure_filename
+from app.config.settings import Config
+from app.core.document_catalog import describe, document_catalog
+from app.core.page_store import page_store
 
 logger = logging.getLogger(__name__)
 
 # Crear blueprint
 pdf_bp = Blueprint('pdf', __name__)
 
-# Ruta de documentos
-DOCUMENTS_PATH = os.getenv('DOCUMENTS_PATH')
+# Los PDFs de DOCUMENTS_PATH se consultan en el catálogo en memoria, sin tocar el disco
 # Nombre del PDF del código de tránsito
 PDF_FILENAME = 'codigo_transito.pdf'
 
+
+def _set_cache_headers(response, meta, etag=None):
+    """ETag del contenido (o `etag`), Last-Modified y Cache-Control según PDF_CACHE_MAX_AGE"""
+    response.set_etag(etag or meta.etag)
+    response.last_modified = meta.last_modified
+    if Config.PDF_CACHE_MAX_AGE > 0:
+        response.cache_control.public = True
+        response.cache_control.max_age = Config.PDF_CACHE_MAX_AGE
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+def _send_pdf(meta, as_attachment=False, download_name=None):
+    """
+    Sirve un PDF con revalidación (ETag/If-None-Match -> 304) y rangos (206)
+
+    Con PDF_SENDFILE_MODE los archivos grandes los entrega el proxy
+    (X-Accel-Redirect o X-Sendfile), que también atiende Range y la
+    revalidación; Flask solo responde los encabezados.
+
+    Args:
+        meta: Entrada del catálogo (DocumentMeta)
+        as_attachment: Descargar en lugar de visualizar
+        download_name: Nombre sugerido al descargar
+
+    Returns:
+        Response: 200, 206 o 304
+    """
+    mode = Config.PDF_SENDFILE_MODE
+
+    if mode in ('x-accel', 'x-sendfile') and meta.size >= Config.PDF_SENDFILE_MIN_BYTES:
+        response = current_app.response_class(mimetype='application/pdf')
+        if mode == 'x-accel':
+            response.headers['X-Accel-Redirect'] = f"{Config.PDF_ACCEL_PREFIX.rstrip('/')}/{quote(meta.filename)}"
+        else:
+            response.headers['X-Sendfile'] = meta.path
+        response.headers.set('Content-Disposition', 'attachment' if as_attachment else 'inline',
+                             filename=download_name or meta.filename)
+        return response
+
+    # Revalidación sin abrir el archivo
+    if request.if_none_match.contains_weak(meta.etag):
+        return _set_cache_headers(current_app.response_class(status=304), meta)
+
+    try:
+        response = send_file(
+            meta.path,
+            mimetype='application/pdf',
+            as_attachment=as_attachment,
+            download_name=download_name,
+            etag=meta.etag,
+            last_modified=meta.last_modified,
+        )
+    except FileNotFoundError:
+        # Eliminado después del último barrido del catálogo
+        document_catalog.refresh()
+        return jsonify({"error": "PDF no encontrado"}), 404
+    return _set_cache_headers(response, meta)
+
+
 @pdf_bp.route('/pdf/codigo-transito', methods=['GET'])
 @pdf_bp.route('/pdf/view/codigo_transito.pdf', methods=['GET'])
 def view_codigo_transito():
     """Sirve el PDF del Código de Tránsito para visualización"""
     try:
-        file_path = os.path.join(DOCUMENTS_PATH, PDF_FILENAME)
+        meta = document_catalog.get(PDF_FILENAME)
         
-        if not os.path.exists(file_path):
+        if meta is None:
+            file_path = os.path.join(document_catalog.path, PDF_FILENAME)
             logger.error(f"PDF no encontrado en: {file_path}")
             return jsonify({
                 "error": "Código de Tránsito no encontrado",
@@ -32,11 +97,7 @@ def view_codigo_transito():
             }), 404
         
         # Servir el archivo PDF
-        return send_file(
-            file_path,
-            mimetype='application/pdf',
-            as_attachment=False,
-        )
+        return _send_pdf(meta, as_attachment=False)
         
     except Exception as e:
         logger.error(f"Error sirviendo PDF: {str(e)}")
@@ -48,20 +109,15 @@ def view_codigo_transito():
 def download_codigo_transito():
     """Descarga el PDF del Código de Tránsito"""
     try:
-        file_path = os.path.join(DOCUMENTS_PATH, PDF_FILENAME)
+        meta = document_catalog.get(PDF_FILENAME)
         
-        if not os.path.exists(file_path):
+        if meta is None:
             return jsonify({
                 "error": "Código de Tránsito no encontrado"
             }), 404
         
         # Servir el archivo PDF para descarga
-        return send_file(
-            file_path,
-            mimetype='application/pdf',
-            as_attachment=True,
-            download_name='Codigo_Nacional_Transito_Colombia.pdf'
-        )
+        return _send_pdf(meta, as_attachment=True, download_name='Codigo_Nacional_Transito_Colombia.pdf')
         
     except Exception as e:
         logger.error(f"Error descargando PDF: {str(e)}")
@@ -73,37 +129,29 @@ def download_codigo_transito():
 def pdf_info():
     """Obtiene información del PDF del Código de Tránsito"""
     try:
-        file_path = os.path.join(DOCUMENTS_PATH, PDF_FILENAME)
+        meta = document_catalog.get(PDF_FILENAME)
         
-        if not os.path.exists(file_path):
+        if meta is None:
             return jsonify({
                 "error": "Código de Tránsito no encontrado",
                 "available": False
             }), 404
         
-        # Obtener información básica
-        file_size = os.path.getsize(file_path)
-        
-        # Intentar obtener número de páginas
-        num_pages = None
-        try:
-            import fitz  # PyMuPDF
-            doc = fitz.open(file_path)
-            num_pages = len(doc)
-            doc.close()
-        except:
-            pass
-        
-        return jsonify({
+        # Tamaño, páginas y ETag del catálogo (calculados una vez por versión del archivo)
+        response = jsonify({
             "available": True,
             "filename": PDF_FILENAME,
             "title": "Código Nacional de Tránsito Colombiano",
-            "size_bytes": file_size,
-            "size_mb": round(file_size / (1024 * 1024), 2),
-            "num_pages": num_pages,
+            "size_bytes": meta.size,
+            "size_mb": round(meta.size / (1024 * 1024), 2),
+            "num_pages": meta.num_pages,
+            "etag": meta.etag,
+            "last_modified": meta.last_modified.isoformat(),
             "view_url": "/pdf/codigo-transito",
             "download_url": f"/pdf/download/{PDF_FILENAME}"
-        }), 200
+        })
+        # 304 si el cliente ya tiene la información de esta versión
+        return _set_cache_headers(response, meta).make_conditional(request)
         
     except Exception as e:
         logger.error(f"Error obteniendo info de PDF: {str(e)}")
@@ -111,32 +159,19 @@ def pdf_info():
             "error": "Error al obtener información del PDF",
             "available": False
         }), 500
+
+@pdf_bp.route('/pdf/list', methods=['GET'])
 def list_pdfs():
     """Lista todos los PDFs disponibles"""
     try:
-        if not os.path.exists(DOCUMENTS_PATH):
+        if not document_catalog.available:
             return jsonify({
                 "error": "Carpeta de documentos no encontrada",
                 "pdfs": []
             }), 404
         
-        # Listar archivos PDF
-        files = os.listdir(DOCUMENTS_PATH)
-        pdf_files = [f for f in files if f.lower().endswith('.pdf')]
-        
-        # Obtener información de cada PDF
-        pdfs_info = []
-        for pdf_file in pdf_files:
-            file_path = os.path.join(DOCUMENTS_PATH, pdf_file)
-            file_size = os.path.getsize(file_path)
-            
-            pdfs_info.append({
-                "filename": pdf_file,
-                "display_name": pdf_file.replace('.pdf', '').replace('_', ' ').title(),
-                "size": file_size,
-                "size_mb": round(file_size / (1024 * 1024), 2),
-                "url": f"/pdf/view/{pdf_file}"
-            })
+        # Nombre, tamaño, páginas y hash de cada PDF, desde el catálogo
+        pdfs_info = [describe(meta) for meta in document_catalog.list()]
         
         return jsonify({
             "pdfs": pdfs_info,
@@ -161,19 +196,15 @@ def view_pdf(filename):
                 "error": "El archivo debe ser un PDF"
             }), 400
         
-        file_path = os.path.join(DOCUMENTS_PATH, filename)
+        meta = document_catalog.get(filename)
         
-        if not os.path.exists(file_path):
+        if meta is None:
             return jsonify({
                 "error": "PDF no encontrado"
             }), 404
         
         # Servir el archivo PDF
-        return send_file(
-            file_path,
-            mimetype='application/pdf',
-            as_attachment=False,  # Para visualizar en el navegador
-        )
+        return _send_pdf(meta, as_attachment=False)
         
     except Exception as e:
         logger.error(f"Error sirviendo PDF: {str(e)}")
@@ -193,23 +224,131 @@ def download_pdf(filename):
                 "error": "El archivo debe ser un PDF"
             }), 400
         
-        file_path = os.path.join(DOCUMENTS_PATH, filename)
+        meta = document_catalog.get(filename)
         
-        if not os.path.exists(file_path):
+        if meta is None:
             return jsonify({
                 "error": "PDF no encontrado"
             }), 404
         
         # Servir el archivo PDF para descarga
-        return send_file(
-            file_path,
-            mimetype='application/pdf',
-            as_attachment=True,  # Para descargar
-            download_name=filename
-        )
+        return _send_pdf(meta, as_attachment=True, download_name=filename)
         
     except Exception as e:
         logger.error(f"Error descargando PDF: {str(e)}")
         return jsonify({
             "error": "Error al descargar PDF"
-        }), 500
\ No newline at end of file
+        }), 500
+
+def _parse_highlight(args, length):
+    """
+    Tramo a resaltar a partir de ?inicio=&fin= (el start_index del chunk citado)
+
+    Returns:
+        tuple: (inicio, fin) dentro del texto de la página, o None si no se pidió
+
+    Raises:
+        ValueError: Si los parámetros no son enteros válidos
+    """
+    if args.get('inicio') is None:
+        return None
+    try:
+        start = int(args.get('inicio'))
+        end = int(args.get('fin')) if args.get('fin') is not None else length
+    except ValueError:
+        raise ValueError("inicio y fin deben ser enteros")
+    if start < 0 or end < start:
+        raise ValueError("Se requiere 0 <= inicio <= fin")
+    return min(start, length), min(end, length)
+
+@pdf_bp.route('/pdf/<filename>/page/<int:number>', methods=['GET'])
+def pdf_page(filename, number):
+    """Texto de una página (desde 1) y, con ?inicio=&fin=, el tramo de la cita"""
+    try:
+        # Sanitizar nombre de archivo
+        filename = secure_filename(filename)
+        
+        if not filename.lower().endswith('.pdf'):
+            return jsonify({
+                "error": "El archivo debe ser un PDF"
+            }), 400
+        
+        meta = document_catalog.get(filename)
+        
+        if meta is None:
+            return jsonify({
+                "error": "PDF no encontrado"
+            }), 404
+        
+        # Texto extraído al indexar (una búsqueda en memoria)
+        pages = page_store.pages(meta)
+        if not 1 <= number <= len(pages):
+            return jsonify({
+                "error": "Página no encontrada",
+                "total_paginas": len(pages)
+            }), 404
+        text = pages[number - 1]
+        
+        try:
+            highlight = _parse_highlight(request.args, len(text))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        response = jsonify({
+            "archivo": filename,
+            "pagina": number,
+            "total_paginas": len(pages),
+            "texto": text,
+            "resaltado": {
+                "inicio": highlight[0],
+                "fin": highlight[1],
+                "texto": text[highlight[0]:highlight[1]]
+            } if highlight else None,
+            "imagen_url": f"/pdf/{filename}/page/{number}/image" if page_store.images_available() else None,
+            "pdf_url": f"/pdf/view/{filename}#page={number}"
+        })
+        return _set_cache_headers(response, meta, f"{meta.etag}-p{number}").make_conditional(request)
+        
+    except Exception as e:
+        logger.error(f"Error obteniendo página de PDF: {str(e)}")
+        return jsonify({
+            "error": "Error al obtener la página"
+        }), 500
+
+@pdf_bp.route('/pdf/<filename>/page/<int:number>/image', methods=['GET'])
+def pdf_page_image(filename, number):
+    """Imagen PNG de una página (requiere PyMuPDF), renderizada una sola vez"""
+    try:
+        # Sanitizar nombre de archivo
+        filename = secure_filename(filename)
+        
+        if not filename.lower().endswith('.pdf'):
+            return jsonify({
+                "error": "El archivo debe ser un PDF"
+            }), 400
+        
+        meta = document_catalog.get(filename)
+        
+        if meta is None:
+            return jsonify({
+                "error": "PDF no encontrado"
+            }), 404
+        
+        etag = f"{meta.etag}-p{number}-img"
+        if request.if_none_match.contains_weak(etag):
+            return _set_cache_headers(current_app.response_class(status=304), meta, etag)
+        
+        image_path = page_store.image(meta, number)
+        if image_path is None:
+            return jsonify({
+                "error": "Imagen de página no disponible"
+            }), 404
+        
+        response = send_file(image_path, mimetype='image/png', etag=etag, last_modified=meta.last_modified)
+        return _set_cache_headers(response, meta, etag)
+        
+    except Exception as e:
+        logger.error(f"Error sirviendo imagen de página: {str(e)}")
+        return jsonify({
+            "error": "Error al obtener la imagen de la página"
+        }), 500
@@ -0,0 +1,44 @@
+"""
+Rutas de consulta de los datos de referencia (infracciones, multas, trámites,
+documentos y límites de velocidad).
+"""
+
+import logging
+from flask import Blueprint, jsonify, request
+from app.core.pagination import parse_limit
+from app.core.reference_search import KINDS, search_reference
+
+logger = logging.getLogger(__name__)
+
+# Crear blueprint
+reference_bp = Blueprint('reference', __name__)
+
+# Longitud máxima de la consulta
+MAX_QUERY_LENGTH = 200
+
+# Búsqueda en las tablas de referencia, sin tildes y tolerando errores de escritura
+# ?q=texto libre, ?tipo=infraccion|multa|tramite|documento|velocidad, ?limit=N
+@reference_bp.route('/infracciones/search', methods=['GET'])
+def search_infracciones():
+    q = (request.args.get('q') or '').strip()
+    if not q:
+        return jsonify({'error': 'q requerido'}), 400
+    if len(q) > MAX_QUERY_LENGTH:
+        return jsonify({'error': f'q no puede superar {MAX_QUERY_LENGTH} caracteres'}), 400
+    kind = request.args.get('tipo') or None
+    if kind is not None and kind not in KINDS:
+        return jsonify({'error': f"tipo debe ser uno de: {', '.join(KINDS)}"}), 400
+    try:
+        limit = parse_limit(request.args.get('limit'), default=10)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    hits = search_reference(q, kind, limit)
+    return jsonify({
+        'query': q,
+        'results': [
+            {'tipo': hit.kind, 'clave': hit.key, 'score': hit.score,
+             'coincidencias': list(hit.matched), 'datos': hit.data}
+            for hit in hits
+        ]
+    }), 200
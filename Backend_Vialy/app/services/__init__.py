@@ -4,5 +4,6 @@ Módulo de servicios de negocio.
 
 from .classification_service import ClassificationService
 from .response_service import ResponseService
+from .password_service import PasswordService, PasswordServiceBusy
 
-__all__ = ['ClassificationService', 'ResponseService']
\ No newline at end of file
+__all__ = ['ClassificationService', 'ResponseService', 'PasswordService', 'PasswordServiceBusy']
\ No newline at end of file
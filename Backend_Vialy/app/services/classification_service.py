@@ -1,102 +1,147 @@
 """
 Servicio de clasificación de consultas.
-VERSIÓN OPTIMIZADA: Solo usa keywords, sin llamadas al LLM.
+VERSIÓN OPTIMIZADA: sin llamadas al LLM. Por keywords o, con
+CLASSIFIER_MODE=centroid, por el centroide de embeddings más cercano.
 """
 
 import logging
-import re
-from typing import Tuple
-from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.config.settings import Config
+from app.core.keyword_matcher import CATEGORY_KEYWORDS, match_keywords
+from app.core.query_context import QueryContext, unit_vector
 
 logger = logging.getLogger(__name__)
 
+# Preguntas de ejemplo por categoría para los centroides
+CATEGORY_EXAMPLES = {
+    'MULTA': [
+        '¿Cuánto cuesta la multa por no tener SOAT?',
+        'valor del comparendo por pasarse un semáforo en rojo',
+        '¿Qué sanción tiene conducir en estado de embriaguez?',
+        'me llegó una fotomulta por exceso de velocidad',
+        '¿Cuánto debo pagar por estacionar en sitio prohibido?',
+    ],
+    'REQUISITO': [
+        '¿Qué documentos debo llevar cuando manejo?',
+        'requisitos para sacar la licencia de conducción',
+        '¿Es obligatorio tener el SOAT vigente?',
+        '¿Qué papeles pide la policía en un retén?',
+        'qué necesito para la revisión técnico mecánica',
+    ],
+    'NORMATIVA': [
+        '¿Qué dice el artículo 131 del código de tránsito?',
+        '¿Está prohibido usar el celular mientras conduzco?',
+        '¿Es legal usar vidrios polarizados?',
+        '¿Cuál es el límite de velocidad en zona urbana según la ley?',
+        '¿Qué establece el código sobre el uso del casco?',
+    ],
+    'PROCEDIMIENTO': [
+        '¿Cómo renuevo la licencia de conducción?',
+        'pasos para pagar un comparendo',
+        '¿Dónde solicito el duplicado de la licencia?',
+        'cómo hago el curso para el descuento de la multa',
+        '¿Cómo saco el carro de los patios?',
+    ],
+}
+
+
+class CentroidClassifier:
+    """
+    Clasificador por centroide más cercano: el centroide de cada categoría es
+    el promedio normalizado de los embeddings de sus ejemplos (calculados una
+    vez al iniciar). Clasificar es un producto matriz-vector con el embedding
+    de la consulta que ya se calcula para la búsqueda RAG.
+    """
+    
+    def __init__(self, embeddings, examples: Dict[str, List[str]] = None,
+                 min_similarity: float = 0.35):
+        """
+        Args:
+            embeddings: Modelo con `embed_documents` (el mismo del vectorstore)
+            examples: Preguntas de ejemplo por categoría
+            min_similarity: Similitud coseno mínima para aceptar una categoría
+        """
+        examples = examples or CATEGORY_EXAMPLES
+        self.categories = list(examples)
+        self.min_similarity = min_similarity
+        texts = [text for category in self.categories for text in examples[category]]
+        vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        
+        centroids, start = [], 0
+        for category in self.categories:
+            count = len(examples[category])
+            centroids.append(unit_vector(vectors[start:start + count].mean(axis=0)))
+            start += count
+        self.centroids = np.vstack(centroids)
+    
+    def classify(self, vector: np.ndarray) -> Tuple[Optional[str], float]:
+        """
+        Returns:
+            Tuple[Optional[str], float]: (categoría o None si no supera el mínimo, similitud)
+        """
+        similarities = self.centroids @ vector
+        best = int(np.argmax(similarities))
+        similarity = float(similarities[best])
+        return (self.categories[best] if similarity >= self.min_similarity else None), similarity
+
 class ClassificationService:
     """Servicio para clasificar consultas de usuarios - SOLO KEYWORDS"""
     
-    # Palabras clave AMPLIADAS para mejor clasificación
-    KEYWORDS = {
-        'MULTA': [
-            'multa', 'sanción', 'penalización', 'cuánto', 'cuesta', 'valor',
-            'infracción', 'comparendo', 'pagar', 'cuanto cuesta', 'precio',
-            'costo', 'fotomulta', 'sancionado', 'penalizado', 'castigo',
-            'sanciones', 'infracciones', 'comparendos'
-        ],
-        'REQUISITO': [
-            'documento', 'requisito', 'necesito', 'tramite', 'permiso',
-            'llevar', 'presentar', 'documentos', 'requisitos', 'papeles',
-            'certificado', 'licencia', 'soat', 'seguro', 'tarjeta',
-            'necesarios', 'obligatorio', 'debo llevar', 'que necesito'
-        ],
-        'NORMATIVA': [
-            'ley', 'artículo', 'norma', 'código', 'dice', 'establece',
-            'legal', 'articulo', 'artículo', 'legislación', 'reglamento',
-            'normativa', 'permitido', 'prohibido', 'puede', 'debo',
-            'obligatorio', 'está prohibido', 'se permite'
-        ],
-        'PROCEDIMIENTO': [
-            'cómo', 'pasos', 'proceso', 'renovar', 'obtener', 'hacer',
-            'dónde', 'donde', 'trámite', 'procedimiento', 'solicitar',
-            'como hacer', 'como obtener', 'como renovar', 'gestionar',
-            'realizar', 'efectuar', 'adelantar', 'como se hace'
-        ]
-    }
+    # Palabras clave compartidas con el detector de contexto (ver app/core/keyword_matcher.py)
+    KEYWORDS = CATEGORY_KEYWORDS
     
-    def __init__(self, llm_model=None):
+    def __init__(self, llm_model=None, embeddings=None, mode: str = None):
         """
         Inicializa el servicio de clasificación
         
         Args:
             llm_model: Modelo LLM (no se usa en esta versión)
+            embeddings: Modelo de embeddings del vectorstore (requerido por el modo 'centroid')
+            mode: 'keywords' o 'centroid' (por defecto CLASSIFIER_MODE)
         """
         self.llm_model = llm_model
-        logger.info("ClassificationService inicializado (modo KEYWORDS)")
-    
-    @lru_cache(maxsize=512)
-    def _quick_classify(self, query_lower: str) -> str:
-        """
-        Clasificación rápida basada en palabras clave
+        self.embeddings = embeddings
+        self.mode = (mode or Config.CLASSIFIER_MODE).lower()
+        self.centroid_classifier: Optional[CentroidClassifier] = None
         
-        Args:
-            query_lower: Query en minúsculas
-            
-        Returns:
-            str: Categoría detectada
-        """
-        scores = {category: 0 for category in self.KEYWORDS.keys()}
-        
-        # Contar coincidencias de keywords
-        for category, keywords in self.KEYWORDS.items():
-            for keyword in keywords:
-                if keyword in query_lower:
-                    scores[category] += 1
-        
-        # Obtener la categoría con más coincidencias
-        max_score = max(scores.values())
-        
-        if max_score > 0:
-            # Retornar la categoría con más coincidencias
-            for category, score in scores.items():
-                if score == max_score:
-                    return category
-        
-        # Si no hay coincidencias, es GENERAL
-        return 'GENERAL'
+        if self.mode == 'centroid':
+            try:
+                if embeddings is None:
+                    raise ValueError("no hay modelo de embeddings")
+                self.centroid_classifier = CentroidClassifier(
+                    embeddings, min_similarity=Config.CLASSIFIER_MIN_SIMILARITY
+                )
+            except Exception as e:
+                logger.warning(f"⚠️ Clasificador por centroides no disponible, usando keywords: {str(e)}")
+                self.mode = 'keywords'
+        logger.info(f"ClassificationService inicializado (modo {self.mode.upper()})")
     
-    def classify_query(self, query: str) -> str:
+    def _category(self, ctx: QueryContext) -> str:
+        """Categoría por centroide (si está activo y hay embedding) o por keywords"""
+        if self.centroid_classifier is not None and ctx.vector is not None:
+            category, similarity = self.centroid_classifier.classify(ctx.vector)
+            if category is not None:
+                logger.debug(f"Centroide {category} (similitud {similarity:.2f})")
+                return category
+        return ctx.keywords.category
+    
+    def classify_query(self, query: str, query_ctx: Optional[QueryContext] = None) -> str:
         """
-        Clasifica una consulta en una categoría usando SOLO keywords
+        Clasifica una consulta en una categoría (sin LLM)
         
         Args:
             query: Pregunta del usuario
+            query_ctx: Contexto de la consulta del request (reutiliza su embedding)
             
         Returns:
             str: Categoría (MULTA, REQUISITO, NORMATIVA, PROCEDIMIENTO, GENERAL)
         """
         try:
-            query_lower = query.lower()
-            
-            # Usar SOLO clasificación rápida (sin LLM)
-            category = self._quick_classify(query_lower)
+            category = self._category(query_ctx or QueryContext(query, self.embeddings))
             
             logger.info(f"✅ Clasificación rápida: {category}")
             return category
@@ -116,43 +161,32 @@ class ClassificationService:
             int: Intención (1=Información, 2=Explicación, 3=Asesoría)
         """
         try:
-            query_lower = query.lower()
-            
-            # Clasificación rápida de intención por keywords
-            # Asesoría (3)
-            if any(word in query_lower for word in [
-                'cómo', 'como', 'pasos', 'proceso', 'debo', 'debería',
-                'me conviene', 'qué hago', 'que hago', 'ayuda'
-            ]):
-                return 3
-            
-            # Explicación (2)
-            elif any(word in query_lower for word in [
-                'qué es', 'que es', 'por qué', 'por que', 'explica',
-                'funciona', 'significa', 'diferencia', 'cuál es', 'cual es'
-            ]):
-                return 2
-            
-            # Información específica (1) - default
-            else:
-                return 1
+            # Asesoría (3), Explicación (2) o Información específica (1) por keywords
+            return match_keywords(query).intent
             
         except Exception as e:
             logger.error(f"Error en análisis de intención: {str(e)}", exc_info=True)
             return 1
     
-    def analyze_query(self, query: str) -> Tuple[str, int]:
+    def analyze_query(self, query: str, query_ctx: Optional[QueryContext] = None) -> Tuple[str, int]:
         """
-        Analiza completamente una consulta (sin llamadas al LLM)
+        Analiza completamente una consulta (sin llamadas al LLM). La intención
+        y la categoría por keywords salen de una sola pasada del matcher; en
+        modo 'centroid' la categoría usa el embedding del contexto de la consulta
         
         Args:
             query: Pregunta del usuario
+            query_ctx: Contexto de la consulta del request (reutiliza su embedding)
             
         Returns:
             Tuple[str, int]: (categoría, intención)
         """
-        category = self.classify_query(query)
-        intent = self.get_intent(query)
+        try:
+            ctx = query_ctx or QueryContext(query, self.embeddings)
+            category, intent = self._category(ctx), ctx.keywords.intent
+        except Exception as e:
+            logger.error(f"Error en clasificación: {str(e)}", exc_info=True)
+            category, intent = 'GENERAL', 1
         
         logger.info(f"📊 Análisis: Categoría={category}, Intención={intent}")
         return category, intent
\ No newline at end of file
@@ -0,0 +1,211 @@
+"""
+Servicio de contraseñas.
+Ejecuta bcrypt en un pool de procesos dedicado y acotado para que los picos
+de login no consuman los hilos (ni los núcleos) que atienden /ask.
+"""
+
+import atexit
+import logging
+import multiprocessing
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+import bcrypt
+
+from app.config.settings import Config
+
+logger = logging.getLogger(__name__)
+
+# $2b$12$<salt+hash>: el costo va en el segundo campo
+_COST_RE = re.compile(r"^\$2[abxy]?\$(\d{2})\$")
+
+
+class PasswordServiceBusy(Exception):
+    """Hay demasiadas operaciones de hash pendientes"""
+
+
+def _hash(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _check(password: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed)
+
+
+def _warm_up() -> int:
+    return 0
+
+
+def hash_cost(hashed: str) -> Optional[int]:
+    """Factor de costo de un hash bcrypt, o None si no tiene el formato esperado"""
+    match = _COST_RE.match(hashed or '')
+    return int(match.group(1)) if match else None
+
+
+def measure_cost(rounds: int, samples: int = 3) -> float:
+    """Tiempo mediano (ms) de un hash con `rounds` en el proceso actual"""
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        _hash(b"medicion-de-costo", rounds)
+        timings.append((time.perf_counter() - start) * 1000)
+    return sorted(timings)[len(timings) // 2]
+
+
+def suggest_rounds(target_ms: float, min_rounds: int = 10, max_rounds: int = 16) -> int:
+    """
+    Mayor costo cuyo hash no supera `target_ms` en esta máquina.
+    Cada punto de costo duplica el tiempo, así que basta con medir el mínimo.
+    """
+    base = measure_cost(min_rounds)
+    rounds = min_rounds
+    while rounds < max_rounds and base * 2 ** (rounds + 1 - min_rounds) <= target_ms:
+        rounds += 1
+    return rounds
+
+
+class PasswordService:
+    """
+    Hash y verificación de contraseñas con bcrypt.
+
+    Las operaciones se envían a un ProcessPoolExecutor de `workers` procesos;
+    a lo sumo `max_pending` pueden estar en curso o en cola. Si no hay cupo en
+    `acquire_timeout` segundos se lanza PasswordServiceBusy (el endpoint
+    responde 503). Con workers=0 se ejecuta en el hilo del request.
+    """
+
+    def __init__(self, rounds: int = 12, workers: int = 1, max_pending: int = 32,
+                 acquire_timeout: float = 5.0):
+        self.rounds = rounds
+        self.workers = workers
+        self.acquire_timeout = acquire_timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"hashes": 0, "checks": 0, "rehashes": 0, "rejected": 0, "busy_ms": 0.0}
+
+    def start(self):
+        """
+        Crea el pool y precalienta los procesos (idempotente). Si los procesos
+        no arrancan, el servicio sigue funcionando en el hilo del request.
+        """
+        if self.workers <= 0 or self._executor is not None:
+            return
+        with self._lock:
+            if self._executor is not None:
+                return
+            executor = None
+            try:
+                # spawn: no hereda hilos ni conexiones del proceso de Flask
+                executor = ProcessPoolExecutor(max_workers=self.workers,
+                                               mp_context=multiprocessing.get_context('spawn'))
+                for future in [executor.submit(_warm_up) for _ in range(self.workers)]:
+                    future.result()
+                cost_ms = executor.submit(measure_cost, self.rounds, 1).result()
+            except Exception as e:
+                if executor is not None:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                logger.warning(f"⚠️ No se pudo iniciar el pool de contraseñas, bcrypt se ejecutará "
+                               f"en el hilo del request: {str(e)}")
+                self.workers = 0
+                return
+            self._executor = executor
+            atexit.register(self.stop)
+        logger.info(f"✅ Pool de contraseñas listo ({self.workers} procesos, costo bcrypt {self.rounds} "
+                    f"≈ {cost_ms:.0f} ms por hash)")
+
+    def stop(self):
+        with self._lock:
+            if self._executor is None:
+                return
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            with self._stats_lock:
+                self._stats["rejected"] += 1
+            raise PasswordServiceBusy("Demasiadas operaciones de contraseña en curso")
+        start = time.perf_counter()
+        try:
+            try:
+                return self._submit(fn, *args)
+            except BrokenProcessPool:
+                # Un proceso murió (p. ej. por memoria): se recrea el pool y se reintenta una vez
+                logger.warning("⚠️ Pool de contraseñas caído, recreándolo")
+                self.stop()
+                return self._submit(fn, *args)
+        finally:
+            self._slots.release()
+            with self._stats_lock:
+                self._stats["busy_ms"] += (time.perf_counter() - start) * 1000
+
+    def _submit(self, fn, *args):
+        if self._executor is None:
+            self.start()
+        if self._executor is None:
+            return fn(*args)
+        return self._executor.submit(fn, *args).result()
+
+    def hash_password(self, password: str) -> str:
+        """Hash bcrypt con el costo configurado"""
+        hashed = self._run(_hash, password.encode('utf-8'), self.rounds)
+        with self._stats_lock:
+            self._stats["hashes"] += 1
+        return hashed.decode('utf-8')
+
+    def verify_password(self, password: str, hashed: str) -> bool:
+        """Compara la contraseña con su hash (False si el hash está corrupto)"""
+        try:
+            ok = self._run(_check, password.encode('utf-8'), hashed.encode('utf-8'))
+        except ValueError:
+            ok = False
+        with self._stats_lock:
+            self._stats["checks"] += 1
+        return ok
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """El hash usa un costo distinto del configurado"""
+        return hash_cost(hashed) != self.rounds
+
+    def rehash_if_needed(self, password: str, hashed: str) -> Optional[str]:
+        """
+        Tras un login correcto, devuelve un hash nuevo si el actual quedó
+        desactualizado (o None si no hay que cambiarlo)
+        """
+        if not self.needs_rehash(hashed):
+            return None
+        new_hash = self.hash_password(password)
+        with self._stats_lock:
+            self._stats["rehashes"] += 1
+        return new_hash
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        operations = stats["hashes"] + stats["checks"]
+        return {
+            "rounds": self.rounds,
+            "workers": self.workers,
+            "hashes": stats["hashes"],
+            "checks": stats["checks"],
+            "rehashes": stats["rehashes"],
+            "rejected": stats["rejected"],
+            "avg_ms": round(stats.pop("busy_ms") / operations, 2) if operations and self.workers > 0 else None
+        }
+
+
+# Instancia global
+password_service = PasswordService(
+    rounds=Config.BCRYPT_ROUNDS,
+    workers=Config.PASSWORD_HASH_WORKERS,
+    max_pending=Config.PASSWORD_HASH_MAX_PENDING,
+    acquire_timeout=Config.PASSWORD_HASH_ACQUIRE_TIMEOUT
+)
@@ -7,6 +7,14 @@ import logging
 import os
 from typing import Dict, List, Tuple, Optional
 
+import requests
+
+from app.config.settings import Config
+from app.core.metrics import metrics
+from app.core.ollama_context import ollama_context_store
+from app.core.page_store import citation_fields
+from app.core.query_context import QueryContext, find_embeddings, find_vectorstore
+
 logger = logging.getLogger(__name__)
 
 class ResponseService:
@@ -22,14 +30,18 @@ class ResponseService:
         """
         self.qa_chain = qa_chain
         self.llm_model = llm_model
+        # Vectorstore y embeddings de la cadena: la búsqueda usa el embedding del QueryContext
+        self.vectorstore = find_vectorstore(qa_chain)
+        self.embeddings = find_embeddings(qa_chain)
         logger.info("ResponseService inicializado")
     
-    def get_rag_context(self, query: str) -> Tuple[List[Dict], str]:
+    def get_rag_context(self, query: str, query_ctx: Optional[QueryContext] = None) -> Tuple[List[Dict], str]:
         """
         Obtiene contexto usando el sistema RAG
         
         Args:
             query: Pregunta del usuario
+            query_ctx: Contexto de la consulta del request (reutiliza su embedding)
             
         Returns:
             Tuple[List[Dict], str]: (fuentes formateadas, contexto en texto)
@@ -39,7 +51,7 @@ class ResponseService:
             if hasattr(self.llm_model, 'rag_system'):
                 return self._get_improved_rag_context(query)
             # Usar el sistema RAG legacy (qa_chain)
-            return self._legacy_rag_search(query)
+            return self._legacy_rag_search(query, query_ctx or QueryContext(query, self.embeddings))
             
         except Exception as e:
             logger.error(f"Error en RAG: {str(e)}", exc_info=True)
@@ -83,12 +95,23 @@ class ResponseService:
             logger.error(f"Error en RAG mejorado: {str(e)}", exc_info=True)
             return [], "No se pudo obtener la información solicitada."
     
-    def _legacy_rag_search(self, query: str) -> Tuple[List[Dict], str]:
-        """Obtiene contexto usando qa_chain (método legacy)"""
+    def _search_documents(self, query: str, query_ctx: QueryContext) -> List:
+        """
+        Documentos más cercanos a la consulta. Con el embedding del contexto la
+        búsqueda va directo al vectorstore; sin él se usa qa_chain, que además
+        de buscar genera una respuesta con el LLM que aquí se descarta.
+        """
+        search_by_vector = getattr(self.vectorstore, 'similarity_search_by_vector', None)
+        if search_by_vector is not None and query_ctx.embedding is not None:
+            search_kwargs = getattr(getattr(self.qa_chain, 'retriever', None), 'search_kwargs', None) or {}
+            return search_by_vector(query_ctx.embedding, k=search_kwargs.get('k', Config.TOP_K_DOCUMENTS))
+        result = self.qa_chain.invoke({"query": query})
+        return result.get("source_documents", [])
+    
+    def _legacy_rag_search(self, query: str, query_ctx: QueryContext) -> Tuple[List[Dict], str]:
+        """Obtiene contexto usando el vectorstore de qa_chain (método legacy)"""
         try:
-            # Ejecutar búsqueda con qa_chain
-            result = self.qa_chain.invoke({"query": query})
-            source_docs = result.get("source_documents", [])
+            source_docs = self._search_documents(query, query_ctx)
             
             # Formatear fuentes
             formatted_sources = []
@@ -102,7 +125,9 @@ class ResponseService:
                 formatted_sources.append({
                     "extracto": content[:300] + "...",
                     "pagina": metadata.get("page_label") or metadata.get("page"),
-                    "archivo": os.path.basename(metadata.get("source", "documento"))
+                    "archivo": os.path.basename(metadata.get("source", "documento")),
+                    # Resaltado del chunk en /pdf/<archivo>/page/<n>
+                    **citation_fields(metadata, len(doc.page_content))
                 })
             
             # Crear contexto
@@ -141,59 +166,143 @@ class ResponseService:
             
         return cleaned
     
+    def _build_prompt(self, query: str, category: str, history: str, context: str,
+                      conversation_context: str = "") -> str:
+        """Construye el prompt especializado según la categoría"""
+        try:
+            from app.core.prompts_rapidos import PromptTemplates
+            # Versión mejorada: usa 'rag_context' en lugar de 'context'
+            return PromptTemplates.get_response_prompt(
+                category=category,
+                query=query,
+                rag_context=context,  # Parámetro correcto para prompts_mejorado
+                history=history,
+                conversation_context=conversation_context
+            )
+        except ImportError:
+            # Fallback a versión antigua
+            from app.core.prompts import PromptTemplates
+            return PromptTemplates.get_response_prompt(
+                category=category,
+                query=query,
+                context=context,  # Versión antigua usa 'context'
+                history=history
+            )
+    
+    def _supports_ollama_context(self) -> bool:
+        """Indica si el modelo es Ollama y permite llamar /api/generate directamente"""
+        return bool(getattr(self.llm_model, 'base_url', None) and getattr(self.llm_model, 'model', None))
+    
+    def _ollama_options(self) -> Dict:
+        """Replica las opciones de generación configuradas en el modelo de LangChain"""
+        options = {}
+        for name in ('temperature', 'num_ctx', 'num_predict', 'repeat_penalty', 'top_k', 'top_p'):
+            value = getattr(self.llm_model, name, None)
+            if value is not None:
+                options[name] = value
+        return options
+    
+    def _generate_with_ollama_context(self, prompt: str, session_id: str,
+                                      ollama_context: Optional[List[int]]) -> str:
+        """
+        Genera con la API nativa de Ollama, continuando desde el contexto guardado
+        
+        Args:
+            prompt: Prompt de este turno
+            session_id: ID de la sesión
+            ollama_context: Tokens devueltos en el turno anterior (o None)
+            
+        Returns:
+            str: Texto generado
+        """
+        model = self.llm_model.model
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": False,
+            "options": self._ollama_options()
+        }
+        if ollama_context:
+            payload["context"] = ollama_context
+        
+        with metrics.stage('generation'):
+            response = requests.post(
+                f"{self.llm_model.base_url.rstrip('/')}/api/generate",
+                json=payload,
+                timeout=Config.OLLAMA_TIMEOUT
+            )
+            response.raise_for_status()
+            data = response.json()
+        metrics.count_llm_call(model, 'continuation' if ollama_context else 'transcript',
+                               data.get('prompt_eval_count', 0), data.get('eval_count', 0))
+        
+        if data.get("context"):
+            ollama_context_store.put(session_id, model, data["context"])
+        else:
+            ollama_context_store.discard(session_id)
+        
+        return data.get("response", "")
+    
     def generate_response(
         self,
         query: str,
         category: str,
         history: str,
-        context: str
+        context: str,
+        session_id: Optional[str] = None,
+        conversation_context: str = ""
     ) -> str:
         """
         Genera una respuesta usando el prompt especializado
         
+        Si el modelo es Ollama y la sesión tiene un contexto guardado, la
+        pregunta de seguimiento continúa ese contexto en lugar de reenviar el
+        historial. Si el contexto fue desalojado o cambió el modelo, se usa el
+        historial en texto (modo transcripción).
+        
         Args:
             query: Pregunta del usuario
             category: Categoría de la consulta
             history: Historial de conversación
             context: Contexto del RAG
+            session_id: ID de la sesión (opcional, habilita la continuación)
+            conversation_context: Contexto acumulado de la conversación (opcional)
             
         Returns:
             str: Respuesta generada
         """
         try:
-            # Importar prompts (intentar versión mejorada primero)
-            try:
-                from app.core.prompts_rapidos import PromptTemplates
-                # Versión mejorada: usa 'rag_context' en lugar de 'context'
-                prompt = PromptTemplates.get_response_prompt(
-                    category=category,
-                    query=query,
-                    rag_context=context,  # Parámetro correcto para prompts_mejorado
-                    history=history,
-                    conversation_context=""  # Opcional
-                )
-            except ImportError:
-                # Fallback a versión antigua
-                from app.core.prompts import PromptTemplates
-                prompt = PromptTemplates.get_response_prompt(
-                    category=category,
-                    query=query,
-                    context=context,  # Versión antigua usa 'context'
-                    history=history
-                )
-            
             logger.info(f"Generando respuesta con prompt de categoría: {category}")
             
-            # Generar respuesta
-            response = self.llm_model.invoke(prompt)
+            response_text = None
+            if session_id and self._supports_ollama_context():
+                ollama_context = ollama_context_store.get(session_id, self.llm_model.model)
+                # Con contexto de Ollama el historial ya está en los tokens
+                with metrics.stage('prompt_build'):
+                    prompt = self._build_prompt(query, category, "" if ollama_context else history, context,
+                                                conversation_context)
+                try:
+                    response_text = self._generate_with_ollama_context(prompt, session_id, ollama_context)
+                    logger.info(f"Modo {'continuación' if ollama_context else 'transcripción'} para {session_id}")
+                except Exception as e:
+                    logger.warning(f"Fallo /api/generate, usando modo transcripción: {str(e)}")
+                    ollama_context_store.discard(session_id)
             
-            # Extraer texto de la respuesta
-            if hasattr(response, 'content'):
-                response_text = response.content
-            elif isinstance(response, str):
-                response_text = response
-            else:
-                response_text = str(response)
+            if response_text is None:
+                with metrics.stage('prompt_build'):
+                    prompt = self._build_prompt(query, category, history, context, conversation_context)
+                with metrics.stage('generation'):
+                    response = self.llm_model.invoke(prompt)
+                metrics.count_llm_call(str(getattr(self.llm_model, 'model', None) or type(self.llm_model).__name__),
+                                       'langchain')
+                
+                # Extraer texto de la respuesta
+                if hasattr(response, 'content'):
+                    response_text = response.content
+                elif isinstance(response, str):
+                    response_text = response
+                else:
+                    response_text = str(response)
             
             response_text = response_text.strip()
             
@@ -208,7 +317,10 @@ class ResponseService:
         self,
         query: str,
         category: str,
-        history: str
+        history: str,
+        session_id: Optional[str] = None,
+        conversation_context: str = "",
+        query_ctx: Optional[QueryContext] = None
     ) -> Dict:
         """
         Procesa una consulta completa (RAG + generación de respuesta)
@@ -217,20 +329,26 @@ class ResponseService:
             query: Pregunta del usuario
             category: Categoría de la consulta
             history: Historial de conversación
+            session_id: ID de la sesión (opcional)
+            conversation_context: Contexto acumulado de la conversación (opcional)
+            query_ctx: Contexto de la consulta del request (opcional)
             
         Returns:
             Dict: Respuesta con sources y metadata
         """
         try:
             # Obtener contexto con RAG
-            formatted_sources, context = self.get_rag_context(query)
+            with metrics.stage('retrieval'):
+                formatted_sources, context = self.get_rag_context(query, query_ctx)
             
             # Generar respuesta
             response_text = self.generate_response(
                 query=query,
                 category=category,
                 history=history,
-                context=context
+                context=context,
+                session_id=session_id,
+                conversation_context=conversation_context
             )
             
             return {
@@ -25,7 +25,18 @@ CREATE TABLE IF NOT EXISTS conversaciones (
     started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     ended_at TIMESTAMP NULL,
     status ENUM('activa', 'finalizada') DEFAULT 'activa',
-    FOREIGN KEY (usuario_id) REFERENCES usuarios(id) ON DELETE CASCADE
+    -- Resumen desnormalizado, mantenido al insertar mensajes
+    message_count INT NOT NULL DEFAULT 0,
+    last_message_at TIMESTAMP NULL,
+    last_message_preview VARCHAR(100) NULL,
+    -- Último archivado de sus mensajes (NULL = todos en mensajes)
+    archived_at TIMESTAMP NULL,
+    -- Categoría del primer turno
+    primary_topic VARCHAR(50) NULL,
+    FOREIGN KEY (usuario_id) REFERENCES usuarios(id) ON DELETE CASCADE,
+    INDEX ix_conversaciones_usuario_started (usuario_id, started_at),
+    INDEX ix_conversaciones_status_ended (status, ended_at),
+    INDEX ix_conversaciones_status_last_message (status, last_message_at)
 );
 
 -- Tabla de mensajes
@@ -35,5 +46,60 @@ CREATE TABLE IF NOT EXISTS mensajes (
     sender ENUM('usuario', 'chatbot') NOT NULL,
     message TEXT NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (conversacion_id) REFERENCES conversaciones(id) ON DELETE CASCADE
-);
\ No newline at end of file
+    FOREIGN KEY (conversacion_id) REFERENCES conversaciones(id) ON DELETE CASCADE,
+    INDEX ix_mensajes_conversacion_created (conversacion_id, created_at)
+);
+
+-- Archivo de mensajes: un bloque comprimido (zstd/zlib) por conversación y mes
+CREATE TABLE IF NOT EXISTS mensajes_archivados (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    conversacion_id INT NOT NULL,
+    periodo CHAR(7) NOT NULL,
+    message_count INT NOT NULL,
+    first_created_at TIMESTAMP NOT NULL,
+    last_created_at TIMESTAMP NOT NULL,
+    codec VARCHAR(10) NOT NULL,
+    payload MEDIUMBLOB NOT NULL,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (conversacion_id) REFERENCES conversaciones(id) ON DELETE CASCADE,
+    INDEX ix_mensajes_archivados_conversacion (conversacion_id, periodo),
+    INDEX ix_mensajes_archivados_periodo (periodo)
+);
+
+-- Contexto acumulado de cada conversación (listas JSON sin duplicados)
+CREATE TABLE IF NOT EXISTS contexto_conversaciones (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    conversation_id INT NOT NULL UNIQUE,
+    topics JSON NOT NULL,
+    infractions_mentioned JSON NOT NULL,
+    articles_cited JSON NOT NULL,
+    main_questions JSON NOT NULL,
+    key_answers JSON NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (conversation_id) REFERENCES conversaciones(id) ON DELETE CASCADE
+);
+
+-- Infracciones extraídas del Código (Art. 131 y Art. 152), ver el comando ingest-fines
+CREATE TABLE IF NOT EXISTS infracciones (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    codigo VARCHAR(20) NOT NULL UNIQUE,
+    articulo VARCHAR(10) NOT NULL,
+    literal CHAR(1) NOT NULL,
+    descripcion TEXT NOT NULL,
+    texto TEXT NOT NULL,
+    smldv INT NULL,
+    otras_sanciones JSON NOT NULL,
+    vigente BOOLEAN NOT NULL DEFAULT TRUE,
+    pagina INT NULL,
+    fuente VARCHAR(255) NULL,
+    extraido_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Índice de búsqueda de texto completo (términos analizados por la aplicación)
+CREATE TABLE IF NOT EXISTS mensajes_fts (
+    message_id BIGINT PRIMARY KEY,
+    usuario_id INT NOT NULL,
+    terms TEXT NOT NULL,
+    INDEX ix_mensajes_fts_usuario (usuario_id),
+    FULLTEXT INDEX ix_mensajes_fts_terms (terms)
+) ENGINE=InnoDB;
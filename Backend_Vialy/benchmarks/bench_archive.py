@@ -0,0 +1,190 @@
+"""
+Benchmark del archivo de mensajes: tamaño de la tabla caliente y latencia
+de las consultas de historial antes y después de archivar.
+
+Siembra conversaciones de las que una fracción sigue activa y el resto está
+finalizada hace meses, mide, ejecuta archive_messages + VACUUM y vuelve a medir.
+
+Uso:
+    python benchmarks/bench_archive.py [--conversations 4000] [--messages 30] [--active 0.1]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+_tmpdir = tempfile.mkdtemp(prefix="vialy_bench_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+
+import logging  # noqa: E402
+logging.disable(logging.CRITICAL)
+
+from sqlalchemy import func, insert, select, text  # noqa: E402
+from flask import Flask  # noqa: E402
+from flask_jwt_extended import JWTManager, create_access_token  # noqa: E402
+
+from app.config.database import SessionLocal, engine, init_db, init_request_db  # noqa: E402
+from app.core.message_archive import archive_messages, load_archived_messages  # noqa: E402
+from app.core.message_store import build_message_row, insert_messages  # noqa: E402
+from app.models.models import Conversation, Message, Usuario  # noqa: E402
+from app.routes.bd_routes import bd_routes  # noqa: E402
+
+SAMPLE_TEXTS = (
+    "¿Cuánto es la multa por no portar el SOAT vigente?",
+    "Según el artículo 131 del Código Nacional de Tránsito, la infracción D.2 se sanciona con "
+    "treinta salarios mínimos diarios legales vigentes e inmovilización del vehículo.",
+    "¿Qué pasa si me detienen con la licencia de conducción vencida?",
+    "Conducir con la licencia vencida es la infracción B.1: multa de ocho SMDLV. Renueva la licencia "
+    "en un organismo de tránsito antes de volver a conducir.",
+)
+
+
+def seed(db, conversations: int, messages: int, active_ratio: float):
+    """Crea un usuario con conversaciones activas recientes y finalizadas antiguas"""
+    user = Usuario(first_name="Bench", last_name="Archive", email="archive@vialy.co", password_hash="x")
+    db.add(user)
+    db.flush()
+    now = datetime.utcnow()
+    old = now - timedelta(days=200)
+    active = int(conversations * active_ratio)
+    conv_rows = []
+    for i in range(conversations):
+        is_active = i >= conversations - active
+        started = (now - timedelta(hours=1)) if is_active else old + timedelta(minutes=i)
+        conv_rows.append({
+            "usuario_id": user.id, "session_id": f"archive-{i}", "started_at": started,
+            "ended_at": None if is_active else started + timedelta(hours=1),
+            "status": "activa" if is_active else "finalizada", "message_count": messages
+        })
+    db.execute(insert(Conversation), conv_rows)
+    convs = db.query(Conversation.id, Conversation.started_at).order_by(Conversation.id).all()
+    batch = []
+    for conv_id, started in convs:
+        for j in range(messages):
+            batch.append({"conversacion_id": conv_id, "sender": "usuario" if j % 2 == 0 else "chatbot",
+                          "message": SAMPLE_TEXTS[j % len(SAMPLE_TEXTS)],
+                          "created_at": started + timedelta(seconds=j)})
+        if len(batch) >= 5000:
+            db.execute(insert(Message), batch)
+            batch = []
+    if batch:
+        db.execute(insert(Message), batch)
+    db.commit()
+    ids = [conv_id for conv_id, _ in convs]
+    return user.id, ids[conversations - active:], ids[:conversations - active]
+
+
+def hot_table_size() -> dict:
+    with engine.connect() as conn:
+        rows = conn.execute(select(func.count(Message.id))).scalar()
+        if engine.dialect.name == "sqlite":
+            pages = conn.execute(text(
+                "SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name = 'mensajes' OR name LIKE 'ix_mensajes_%'"
+            )).scalar()
+            return {"rows": rows, "bytes": pages}
+    return {"rows": rows, "bytes": None}
+
+
+def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def measure(db, client, headers, active_ids, repeat: int) -> dict:
+    rng = random.Random(7)
+
+    def history():
+        conv_id = rng.choice(active_ids)
+        db.query(Message.sender, Message.message, Message.created_at) \
+            .filter_by(conversacion_id=conv_id) \
+            .order_by(Message.created_at.desc(), Message.id.desc()).limit(10).all()
+
+    def endpoint():
+        response = client.get(f"/messages/{rng.choice(active_ids)}?limit=50", headers=headers)
+        assert response.status_code == 200
+
+    def write_turn():
+        conv_id = rng.choice(active_ids)
+        insert_messages(db, [build_message_row(conv_id, 'usuario', SAMPLE_TEXTS[0]),
+                             build_message_row(conv_id, 'chatbot', SAMPLE_TEXTS[1])])
+        db.commit()
+
+    return {
+        "history_ms": timed(history, repeat),
+        "endpoint_ms": timed(endpoint, repeat),
+        "write_turn_ms": timed(write_turn, repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=4000)
+    parser.add_argument("--messages", type=int, default=30, help="Mensajes por conversación")
+    parser.add_argument("--active", type=float, default=0.1, help="Fracción de conversaciones activas")
+    parser.add_argument("--repeat", type=int, default=300, help="Repeticiones por medición")
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    user_id, active_ids, archived_ids = seed(db, args.conversations, args.messages, args.active)
+
+    app = Flask(__name__)
+    app.config["JWT_SECRET_KEY"] = "benchmark-secret-key-de-al-menos-32-bytes"
+    JWTManager(app)
+    init_request_db(app)
+    app.register_blueprint(bd_routes)
+    client = app.test_client()
+    with app.app_context():
+        headers = {"Authorization": f"Bearer {create_access_token(identity=str(user_id))}"}
+
+    def vacuum():
+        SessionLocal.remove()
+        if engine.dialect.name == "sqlite":
+            with engine.connect() as conn:
+                conn.exec_driver_sql("VACUUM")
+                conn.exec_driver_sql("ANALYZE")
+        return SessionLocal()
+
+    db = vacuum()
+    before_size = hot_table_size()
+    before = measure(db, client, headers, active_ids, args.repeat)
+
+    start = time.perf_counter()
+    stats = archive_messages(db, older_than_days=90)
+    archive_s = time.perf_counter() - start
+    db = vacuum()
+    after_size = hot_table_size()
+    after = measure(db, client, headers, active_ids, args.repeat)
+    rng = random.Random(11)
+    cold_ms = timed(lambda: load_archived_messages(db, rng.choice(archived_ids)), args.repeat)
+
+    def fmt_bytes(n):
+        return f"{n / 1024 / 1024:.1f} MiB" if n is not None else "n/d"
+
+    print(f"Archivado: {stats['messages']} mensajes de {stats['conversations']} conversaciones "
+          f"en {archive_s:.1f} s; {stats['raw_bytes']} → {stats['compressed_bytes']} bytes "
+          f"({stats['raw_bytes'] / max(stats['compressed_bytes'], 1):.1f}x)")
+    print(f"{'':<28} {'antes':>12} {'después':>12}")
+    print(f"{'filas en mensajes':<28} {before_size['rows']:>12} {after_size['rows']:>12}")
+    print(f"{'tamaño mensajes + índices':<28} {fmt_bytes(before_size['bytes']):>12} {fmt_bytes(after_size['bytes']):>12}")
+    for key, label in (("history_ms", "historial (últimos 10) ms"), ("endpoint_ms", "GET /messages?limit=50 ms"),
+                       ("write_turn_ms", "insertar turno ms")):
+        print(f"{label:<28} {before[key]:>12.3f} {after[key]:>12.3f}")
+    print(f"{'leer conversación archivada ms':<28} {'':>12} {cold_ms:>12.3f}")
+    SessionLocal.remove()
+
+
+if __name__ == "__main__":
+    main()
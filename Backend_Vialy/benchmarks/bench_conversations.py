@@ -0,0 +1,134 @@
+"""
+Benchmark de GET /conversations con 10, 100 y 1000 conversaciones por usuario.
+
+Compara la consulta actual (una sola consulta sobre columnas desnormalizadas)
+con la implementación anterior N+1 (conteo + último mensaje por conversación).
+
+Uso:
+    python benchmarks/bench_conversations.py [--messages 10] [--repeat 20]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+_tmpdir = tempfile.mkdtemp(prefix="vialy_bench_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+
+import logging  # noqa: E402
+logging.disable(logging.CRITICAL)
+
+from sqlalchemy import event, insert  # noqa: E402
+from flask import Flask  # noqa: E402
+from flask_jwt_extended import JWTManager, create_access_token  # noqa: E402
+
+from app.config.database import SessionLocal, engine, init_db, init_request_db  # noqa: E402
+from app.models.models import Conversation, Message, Usuario  # noqa: E402
+from app.routes.bd_routes import bd_routes  # noqa: E402
+from app.cli import backfill_conversation_summaries  # noqa: E402
+
+SIZES = (10, 100, 1000)
+
+_queries = {"n": 0}
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count(conn, cursor, statement, parameters, context, executemany):
+    _queries["n"] += 1
+
+
+def seed(db, email: str, conversations: int, messages: int) -> int:
+    """Crea un usuario con `conversations` conversaciones de `messages` mensajes"""
+    user = Usuario(first_name="Bench", last_name="User", email=email, password_hash="x")
+    db.add(user)
+    db.flush()
+    start = datetime(2025, 1, 1)
+    conv_rows = [
+        {"usuario_id": user.id, "session_id": f"{email}-{i}", "started_at": start + timedelta(minutes=i),
+         "status": "activa", "message_count": 0}
+        for i in range(conversations)
+    ]
+    db.execute(insert(Conversation), conv_rows)
+    ids = [c.id for c in db.query(Conversation.id).filter_by(usuario_id=user.id)]
+    msg_rows = [
+        {"conversacion_id": cid, "sender": "usuario" if j % 2 == 0 else "chatbot",
+         "message": f"Mensaje {j} sobre multas y SOAT " * 4, "created_at": start + timedelta(minutes=j)}
+        for cid in ids for j in range(messages)
+    ]
+    db.execute(insert(Message), msg_rows)
+    db.commit()
+    return user.id
+
+
+def legacy_list(db, user_id: int) -> list:
+    """Implementación anterior: 1 + 2N consultas"""
+    convs = db.query(Conversation).filter_by(usuario_id=user_id).order_by(Conversation.started_at.desc()).all()
+    result = []
+    for c in convs:
+        message_count = db.query(Message).filter_by(conversacion_id=c.id).count()
+        last_message = db.query(Message).filter_by(conversacion_id=c.id).order_by(Message.created_at.desc()).first()
+        result.append({
+            "id": c.id,
+            "message_count": message_count,
+            "last_message_preview": last_message.message[:100] if last_message else "Sin mensajes",
+        })
+    return result
+
+
+def timed(fn, repeat: int):
+    samples = []
+    queries = 0
+    for _ in range(repeat):
+        _queries["n"] = 0
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+        queries = _queries["n"]
+    return statistics.median(samples), queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=10, help="Mensajes por conversación")
+    parser.add_argument("--repeat", type=int, default=20, help="Repeticiones por medición")
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    users = {n: seed(db, f"bench{n}@vialy.co", n, args.messages) for n in SIZES}
+    backfill_conversation_summaries(db)
+
+    app = Flask(__name__)
+    app.config["JWT_SECRET_KEY"] = "benchmark-secret-key-de-al-menos-32-bytes"
+    JWTManager(app)
+    init_request_db(app)
+    app.register_blueprint(bd_routes)
+    client = app.test_client()
+
+    print(f"{'convs':>6} | {'N+1 ms':>9} {'queries':>8} | {'endpoint ms':>11} {'queries':>8}")
+    for n, user_id in users.items():
+        with app.app_context():
+            token = create_access_token(identity=str(user_id))
+        headers = {"Authorization": f"Bearer {token}"}
+
+        legacy_ms, legacy_q = timed(lambda: legacy_list(db, user_id), args.repeat)
+
+        def endpoint():
+            response = client.get("/conversations", headers=headers)
+            assert response.status_code == 200 and len(response.get_json()) == n
+
+        new_ms, new_q = timed(endpoint, args.repeat)
+        print(f"{n:>6} | {legacy_ms:>9.2f} {legacy_q:>8} | {new_ms:>11.2f} {new_q:>8}")
+
+    SessionLocal.remove()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Microbenchmark de la detección de palabras clave sobre un corpus de consultas.
+
+Compara la implementación anterior (un bucle de `keyword in texto` por cada
+palabra clave, repetido para categoría, intención e infracciones) con el
+matcher compilado de app/core/keyword_matcher.py, sin cache y con la cache
+por texto. También muestra en cuántas consultas cambia el resultado
+(el matcher respeta límites de palabra y tildes, así que no es idéntico).
+
+Uso:
+    python benchmarks/bench_keywords.py [--corpus benchmarks/data/consultas.txt] [--repeat 200] [--diff]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+_tmpdir = tempfile.mkdtemp(prefix="vialy_bench_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+
+import logging  # noqa: E402
+logging.disable(logging.CRITICAL)
+
+from app.core.keyword_matcher import COMMON_INFRACTIONS, keyword_matcher, match_keywords  # noqa: E402
+
+# Listas de ClassificationService antes del matcher compilado
+LEGACY_KEYWORDS = {
+    'MULTA': [
+        'multa', 'sanción', 'penalización', 'cuánto', 'cuesta', 'valor',
+        'infracción', 'comparendo', 'pagar', 'cuanto cuesta', 'precio',
+        'costo', 'fotomulta', 'sancionado', 'penalizado', 'castigo',
+        'sanciones', 'infracciones', 'comparendos'
+    ],
+    'REQUISITO': [
+        'documento', 'requisito', 'necesito', 'tramite', 'permiso',
+        'llevar', 'presentar', 'documentos', 'requisitos', 'papeles',
+        'certificado', 'licencia', 'soat', 'seguro', 'tarjeta',
+        'necesarios', 'obligatorio', 'debo llevar', 'que necesito'
+    ],
+    'NORMATIVA': [
+        'ley', 'artículo', 'norma', 'código', 'dice', 'establece',
+        'legal', 'articulo', 'artículo', 'legislación', 'reglamento',
+        'normativa', 'permitido', 'prohibido', 'puede', 'debo',
+        'obligatorio', 'está prohibido', 'se permite'
+    ],
+    'PROCEDIMIENTO': [
+        'cómo', 'pasos', 'proceso', 'renovar', 'obtener', 'hacer',
+        'dónde', 'donde', 'trámite', 'procedimiento', 'solicitar',
+        'como hacer', 'como obtener', 'como renovar', 'gestionar',
+        'realizar', 'efectuar', 'adelantar', 'como se hace'
+    ]
+}
+LEGACY_ADVICE = ['cómo', 'como', 'pasos', 'proceso', 'debo', 'debería',
+                 'me conviene', 'qué hago', 'que hago', 'ayuda']
+LEGACY_EXPLANATION = ['qué es', 'que es', 'por qué', 'por que', 'explica',
+                      'funciona', 'significa', 'diferencia', 'cuál es', 'cual es']
+
+
+def legacy_analyze(query: str):
+    """_quick_classify + get_intent + _detect_infractions como estaban"""
+    query_lower = query.lower()
+    scores = {category: 0 for category in LEGACY_KEYWORDS}
+    for category, keywords in LEGACY_KEYWORDS.items():
+        for keyword in keywords:
+            if keyword in query_lower:
+                scores[category] += 1
+    max_score = max(scores.values())
+    category = 'GENERAL'
+    if max_score > 0:
+        category = next(c for c, score in scores.items() if score == max_score)
+
+    if any(word in query_lower for word in LEGACY_ADVICE):
+        intent = 3
+    elif any(word in query_lower for word in LEGACY_EXPLANATION):
+        intent = 2
+    else:
+        intent = 1
+
+    infractions = set()
+    for key, data in COMMON_INFRACTIONS.items():
+        for keyword in data['keywords']:
+            if keyword in query_lower:
+                infractions.add(key)
+    return category, intent, frozenset(infractions)
+
+
+def load_corpus(path: str):
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+def time_per_query(fn, corpus, repeat):
+    """Microsegundos por consulta (mediana de `repeat` pasadas sobre el corpus)"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for query in corpus:
+            fn(query)
+        timings.append((time.perf_counter() - start) / len(corpus) * 1e6)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=os.path.join(BASE_DIR, "benchmarks", "data", "consultas.txt"))
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--diff", action="store_true", help="Lista las consultas con resultado distinto")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    match_keywords.cache_clear()
+    for query in corpus:
+        match_keywords(query)
+
+    print(f"{len(corpus)} consultas, {args.repeat} repeticiones")
+    print(f"{'implementación':<28} {'µs/consulta':>12}")
+    results = [
+        ("anterior (3 bucles `in`)", time_per_query(legacy_analyze, corpus, args.repeat)),
+        ("matcher compilado", time_per_query(keyword_matcher.match, corpus, args.repeat)),
+        ("matcher + lru_cache", time_per_query(match_keywords, corpus, args.repeat)),
+    ]
+    for label, micros in results:
+        print(f"{label:<28} {micros:>12.1f}")
+
+    diffs = {"categoría": 0, "intención": 0, "infracciones": 0}
+    for query in corpus:
+        category, intent, infractions = legacy_analyze(query)
+        match = keyword_matcher.match(query)
+        changed = []
+        if match.category != category:
+            diffs["categoría"] += 1
+            changed.append(f"categoría {category} -> {match.category}")
+        if match.intent != intent:
+            diffs["intención"] += 1
+            changed.append(f"intención {intent} -> {match.intent}")
+        if match.infractions != infractions:
+            diffs["infracciones"] += 1
+            changed.append(f"infracciones {sorted(infractions)} -> {sorted(match.infractions)}")
+        if args.diff and changed:
+            print(f"  {query!r}: {'; '.join(changed)}")
+    print("Consultas con resultado distinto al anterior: " +
+          ", ".join(f"{name} {count}/{len(corpus)}" for name, count in diffs.items()))
+
+
+if __name__ == "__main__":
+    main()
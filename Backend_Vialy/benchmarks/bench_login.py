@@ -0,0 +1,155 @@
+"""
+Benchmark de login: throughput de /login durante una ráfaga y latencia de un
+endpoint con algo de CPU (como /ask) servido al mismo tiempo, con bcrypt en el hilo del request
+(PASSWORD_HASH_WORKERS=0) y en el pool de procesos.
+
+Cada modo corre en un subproceso con su propia configuración. Los usuarios
+se siembran con un costo menor al configurado para medir también el rehash.
+
+Uso:
+    python benchmarks/bench_login.py [--rounds 10] [--threads 8] [--seconds 5] [--workers 1]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run_mode(args):
+    """Ejecuta un modo (llamado en el subproceso, con el entorno ya configurado)"""
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    import bcrypt
+    from flask import Flask, jsonify
+    from flask_jwt_extended import JWTManager
+    from sqlalchemy import insert
+
+    from app.config.database import SessionLocal, init_db, init_request_db
+    from app.models.models import Usuario
+    from app.routes.bd_routes import bd_routes
+    from app.services.password_service import password_service
+
+    init_db()
+    db = SessionLocal()
+    # Hash con costo anterior: el primer login de cada usuario lo actualiza
+    old_hash = bcrypt.hashpw(b"clave-segura", bcrypt.gensalt(args.rounds - 1)).decode()
+    db.execute(insert(Usuario), [
+        {"first_name": "Bench", "last_name": str(i), "email": f"login{i}@vialy.co", "password_hash": old_hash}
+        for i in range(args.users)
+    ])
+    db.commit()
+    SessionLocal.remove()
+
+    app = Flask(__name__)
+    app.config["JWT_SECRET_KEY"] = "benchmark-secret-key-de-al-menos-32-bytes"
+    JWTManager(app)
+    init_request_db(app)
+    app.register_blueprint(bd_routes)
+
+    @app.route('/probe')
+    def probe():
+        # ~15 ms de trabajo en Python, como el armado de una respuesta de /ask
+        total = sum(i * i for i in range(200000))
+        return jsonify({"ok": total > 0})
+
+    password_service.start()
+    stop = threading.Event()
+    login_latencies, probe_latencies, errors = [], [], []
+    lock = threading.Lock()
+
+    def login_loop(n):
+        client = app.test_client()
+        i = n
+        while not stop.is_set():
+            start = time.perf_counter()
+            response = client.post('/login', json={"email": f"login{i % args.users}@vialy.co",
+                                                   "password": "clave-segura"})
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                (login_latencies if response.status_code == 200 else errors).append(elapsed)
+            i += args.threads
+
+    def probe_loop():
+        client = app.test_client()
+        while not stop.is_set():
+            start = time.perf_counter()
+            client.get('/probe')
+            probe_latencies.append((time.perf_counter() - start) * 1000)
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=login_loop, args=(n,)) for n in range(args.threads)]
+    threads.append(threading.Thread(target=probe_loop))
+    began = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - began
+    password_service.stop()
+
+    print(json.dumps({
+        "logins_per_s": len(login_latencies) / elapsed,
+        "login_p50": statistics.median(login_latencies) if login_latencies else 0.0,
+        "login_p95": percentile(login_latencies, 0.95),
+        "probe_p50": statistics.median(probe_latencies) if probe_latencies else 0.0,
+        "probe_p95": percentile(probe_latencies, 0.95),
+        "errors": len(errors),
+        "rehashes": password_service.stats()["rehashes"],
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=10, help="BCRYPT_ROUNDS")
+    parser.add_argument("--threads", type=int, default=8, help="Hilos haciendo login")
+    parser.add_argument("--seconds", type=float, default=5, help="Duración de cada modo")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Procesos del pool")
+    parser.add_argument("--mode", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode is not None:
+        run_mode(args)
+        return
+
+    print(f"bcrypt costo {args.rounds}, {args.threads} hilos de login, {args.seconds:.0f} s por modo, "
+          f"{os.cpu_count()} CPU")
+    print(f"{'modo':<18} {'login/s':>8} {'login p50':>10} {'login p95':>10} {'probe p50':>10} "
+          f"{'probe p95':>10} {'rehash':>7} {'errores':>8}")
+    for label, workers in (("en el request", 0), (f"pool ({args.workers} proc)", args.workers)):
+        tmpdir = tempfile.mkdtemp(prefix="vialy_bench_")
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmpdir, 'bench.db')}",
+                   BCRYPT_ROUNDS=str(args.rounds), PASSWORD_HASH_WORKERS=str(workers),
+                   MESSAGE_SEARCH_ENABLED="false")
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--mode", str(workers), "--rounds", str(args.rounds),
+             "--threads", str(args.threads), "--seconds", str(args.seconds), "--users", str(args.users)],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout.strip().splitlines()[-1]
+        r = json.loads(output)
+        print(f"{label:<18} {r['logins_per_s']:>8.1f} {r['login_p50']:>9.0f}ms {r['login_p95']:>9.0f}ms "
+              f"{r['probe_p50']:>9.1f}ms {r['probe_p95']:>9.1f}ms {r['rehashes']:>7} {r['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
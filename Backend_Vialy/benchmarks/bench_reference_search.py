@@ -0,0 +1,94 @@
+"""
+Microbenchmark de la búsqueda en los datos de referencia.
+
+Compara el recorrido lineal anterior de `buscar_infraccion_por_keyword`
+(`keyword in descripcion` por cada infracción) con el índice invertido de
+app/core/reference_search.py: en frío (sin cache de palabras ni de
+consultas), con las palabras ya resueltas y con la cache por consulta.
+Muestra también cuántas consultas encuentra cada uno (el recorrido anterior
+no tolera tildes distintas, plurales ni errores de escritura).
+
+Uso:
+    python benchmarks/bench_reference_search.py [--repeat 200]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+_tmpdir = tempfile.mkdtemp(prefix="vialy_bench_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+
+import logging  # noqa: E402
+logging.disable(logging.CRITICAL)
+
+from app.core.reference_data import INFRACCIONES_COMUNES  # noqa: E402
+from app.core.reference_search import reference_index, search_reference  # noqa: E402
+
+QUERIES = [
+    'velocidad', 'exceso de velocidad', 'exeso de velosidad', 'licencia', 'licencias',
+    'conducir sin licensia', 'semáforo', 'semaforo en rojo', 'cinturón', 'cinturon de seguridad',
+    'soat', 'celular', 'celulares', 'estacionar', 'estacionamiento prohibido', 'alcohol',
+    'embriagado', 'tecnomecanica', 'revision tecnico mecanica', 'sentido contrario',
+    'maniobras peligrosas', 'C.29', 'D.4', 'inmovilización', 'licen', 'parqueo',
+]
+
+
+def legacy_search(keyword: str):
+    """buscar_infraccion_por_keyword antes del índice"""
+    keyword = keyword.lower()
+    return [
+        {'key': key, 'info': info}
+        for key, info in INFRACCIONES_COMUNES.items()
+        if keyword in info['descripcion'].lower() or keyword in key
+    ]
+
+
+def time_per_query(fn, repeat, before_pass=None):
+    """Microsegundos por consulta (mediana de `repeat` pasadas)"""
+    timings = []
+    for _ in range(repeat):
+        if before_pass:
+            before_pass()
+        start = time.perf_counter()
+        for query in QUERIES:
+            fn(query)
+        timings.append((time.perf_counter() - start) / len(QUERIES) * 1e6)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    def search(query):
+        return reference_index.search(query, 'infraccion', len(INFRACCIONES_COMUNES))
+
+    def cached(query):
+        return search_reference(query, 'infraccion', len(INFRACCIONES_COMUNES))
+
+    print(f"{len(QUERIES)} consultas, {len(reference_index)} documentos, {args.repeat} repeticiones")
+    print(f"{'implementación':<32} {'µs/consulta':>12}")
+    results = [
+        ("anterior (recorrido lineal)", time_per_query(legacy_search, args.repeat)),
+        ("índice en frío", time_per_query(search, args.repeat, reference_index.expand.cache_clear)),
+        ("índice (palabras resueltas)", time_per_query(search, args.repeat)),
+        ("índice + lru_cache", time_per_query(cached, args.repeat)),
+    ]
+    for label, micros in results:
+        print(f"{label:<32} {micros:>12.1f}")
+
+    legacy_found = sum(1 for query in QUERIES if legacy_search(query))
+    index_found = sum(1 for query in QUERIES if search(query))
+    print(f"Consultas con resultados: anterior {legacy_found}/{len(QUERIES)}, índice {index_found}/{len(QUERIES)}")
+
+
+if __name__ == "__main__":
+    main()
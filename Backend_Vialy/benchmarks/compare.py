@@ -0,0 +1,60 @@
+"""
+Compara dos resultados de benchmarks/run_suite.py (p. ej. dos commits).
+
+Muestra la mediana por operación de cada caso en ambos archivos y el cambio
+porcentual; un caso es regresión si empeora más de --threshold por ciento.
+Con --fail termina con código 1 si hay regresiones (para CI).
+
+Uso:
+    python benchmarks/compare.py benchmarks/results/abc1234.json benchmarks/results/def5678.json [--threshold 10] [--fail]
+"""
+
+import argparse
+import json
+import sys
+
+
+def load(path: str) -> dict:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base", help="Resultados de referencia")
+    parser.add_argument("new", help="Resultados a comparar")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Porcentaje de empeoramiento tolerado")
+    parser.add_argument("--metric", default="median", choices=("median", "min", "mean"))
+    parser.add_argument("--fail", action="store_true", help="Código de salida 1 si hay regresiones")
+    args = parser.parse_args()
+
+    base, new = load(args.base), load(args.new)
+    print(f"base: {base['meta'].get('commit')}  nuevo: {new['meta'].get('commit')}  ({args.metric}, µs por operación)")
+    print(f"{'caso':<42} {'base':>10} {'nuevo':>10} {'cambio':>9}")
+
+    regressions = []
+    names = sorted(set(base['benchmarks']) | set(new['benchmarks']))
+    for name in names:
+        before, after = base['benchmarks'].get(name), new['benchmarks'].get(name)
+        if not before or not after or 'skipped' in before or 'skipped' in after:
+            state = 'nuevo' if before is None else 'eliminado' if after is None else 'omitido'
+            print(f"{name:<42} {state:>31}")
+            continue
+        old_value, new_value = before[args.metric], after[args.metric]
+        change = (new_value - old_value) / old_value * 100 if old_value else 0.0
+        mark = ''
+        if change > args.threshold:
+            mark = '  ⚠️ regresión'
+            regressions.append(name)
+        elif change < -args.threshold:
+            mark = '  ✅ mejora'
+        print(f"{name:<42} {old_value * 1e6:>10.2f} {new_value * 1e6:>10.2f} {change:>+8.1f}%{mark}")
+
+    if regressions:
+        print(f"{len(regressions)} regresiones por encima de {args.threshold:.0f}%")
+    if regressions and args.fail:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Servidor HTTP que imita a Ollama para pruebas de carga sin GPU ni modelo.
+
+Implementa POST /api/generate (con y sin streaming, como lo usan
+langchain-ollama y ResponseService._generate_with_ollama_context), GET
+/api/tags y GET /api/version. El tiempo de cada generación sigue el modelo de
+costo de un servidor real:
+
+- evaluación del prompt: tokens del prompt / --prompt-rate (tokens/s); con
+  `context` solo se evalúan los tokens nuevos, como en Ollama
+- generación: un token cada 1 / --gen-rate segundos (options.num_predict o
+  --tokens tokens); con streaming cada token se envía al generarse
+- --parallel generaciones simultáneas (OLLAMA_NUM_PARALLEL): el resto espera
+  en cola, y ese tiempo aparece en load_duration
+
+Las respuestas son deterministas (derivadas del hash del prompt) e incluyen
+context, prompt_eval_count, eval_count y las duraciones en nanosegundos.
+
+Uso:
+    python benchmarks/fake_ollama.py [--port 11434] [--prompt-rate 800] [--gen-rate 30] [--tokens 120] [--parallel 1]
+"""
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+# Caracteres por token aproximados para texto en español
+CHARS_PER_TOKEN = 4
+
+WORDS = (
+    "según", "el", "artículo", "del", "Código", "Nacional", "de", "Tránsito", "la", "multa", "por", "conducir",
+    "sin", "licencia", "es", "tipo", "D", "equivalente", "a", "30", "salarios", "mínimos", "diarios",
+    "vigentes", "y", "procede", "inmovilización", "vehículo", "además", "SOAT", "revisión", "técnico-mecánica",
+    "debe", "portar", "conductor", "agente", "puede", "imponer", "comparendo", "infracción",
+)
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    """Servidor con los parámetros de velocidad y los contadores de la simulación"""
+
+    daemon_threads = True
+
+    def __init__(self, address, prompt_rate: float = 800.0, gen_rate: float = 30.0, tokens: int = 120,
+                 parallel: int = 1, model: str = 'mistral', num_ctx: int = 8192):
+        super().__init__(address, FakeOllamaHandler)
+        self.prompt_rate = prompt_rate
+        self.gen_rate = gen_rate
+        self.tokens = tokens
+        self.model = model
+        self.num_ctx = num_ctx
+        self.slots = threading.Semaphore(max(1, parallel))
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, prompt_tokens: int, completion_tokens: int):
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"requests": self.requests, "prompt_tokens": self.prompt_tokens,
+                    "completion_tokens": self.completion_tokens}
+
+
+def _tokenize(text: str) -> List[int]:
+    """IDs de token aproximados (uno cada CHARS_PER_TOKEN caracteres)"""
+    return [int.from_bytes(hashlib.md5(text[i:i + CHARS_PER_TOKEN].encode('utf-8')).digest()[:2], 'little')
+            for i in range(0, len(text), CHARS_PER_TOKEN)]
+
+
+def _words(prompt: str, count: int) -> List[str]:
+    """Palabras generadas: siempre las mismas para el mismo prompt"""
+    seed = hashlib.sha1(prompt.encode('utf-8')).digest()
+    return [WORDS[seed[i % len(seed)] * (i + 1) % len(WORDS)] for i in range(count)]
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    server: FakeOllamaServer
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, payload: dict):
+        data = (json.dumps(payload) + '\n').encode('utf-8')
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == '/api/version':
+            self._send_json(200, {"version": "0.0.0-fake"})
+        elif self.path == '/api/tags':
+            self._send_json(200, {"models": [{"name": f"{self.server.model}:latest", "model": f"{self.server.model}:latest",
+                                              "modified_at": _now(), "size": 0, "details": {"family": "fake"}}]})
+        elif self.path == '/':
+            self._send_json(200, {"status": "Ollama is running"})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != '/api/generate':
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {"error": "invalid JSON"})
+            return
+        if not payload.get('model'):
+            self._send_json(400, {"error": "model is required"})
+            return
+        self._generate(payload)
+
+    def _generate(self, payload: dict):
+        server = self.server
+        options = payload.get('options') or {}
+        prompt = payload.get('prompt') or ''
+        context: Optional[List[int]] = payload.get('context') or []
+        num_predict = int(options.get('num_predict') or server.tokens)
+        count = max(1, min(num_predict, server.tokens)) if num_predict > 0 else server.tokens
+        num_ctx = int(options.get('num_ctx') or server.num_ctx)
+        prompt_ids = _tokenize(prompt)
+        words = _words(prompt, count)
+        stream = payload.get('stream', True)
+
+        queued = time.perf_counter()
+        with server.slots:
+            started = time.perf_counter()
+            # Solo los tokens nuevos: el contexto recibido ya está evaluado
+            time.sleep(len(prompt_ids) / server.prompt_rate)
+            prompt_done = time.perf_counter()
+
+            if stream:
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+            for i, word in enumerate(words):
+                time.sleep(1.0 / server.gen_rate)
+                if stream:
+                    self._write_chunk({"model": payload['model'], "created_at": _now(),
+                                       "response": word if i == 0 else f" {word}", "done": False})
+            finished = time.perf_counter()
+
+        server.count(len(prompt_ids), count)
+        text = ' '.join(words).capitalize() + '.'
+        final = {
+            "model": payload['model'],
+            "created_at": _now(),
+            "response": "" if stream else text,
+            "done": True,
+            "done_reason": "length" if options.get('num_predict') and count == num_predict else "stop",
+            "context": (context + prompt_ids + _tokenize(text))[-num_ctx:],
+            "total_duration": int((finished - queued) * 1e9),
+            "load_duration": int((started - queued) * 1e9),
+            "prompt_eval_count": len(prompt_ids),
+            "prompt_eval_duration": int((prompt_done - started) * 1e9),
+            "eval_count": count,
+            "eval_duration": int((finished - prompt_done) * 1e9),
+        }
+        if stream:
+            self._write_chunk(final)
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            self._send_json(200, final)
+
+
+def start_fake_ollama(host: str = '127.0.0.1', port: int = 0, **options) -> FakeOllamaServer:
+    """
+    Inicia el servidor en un hilo (port=0 elige un puerto libre)
+
+    Args:
+        host: Interfaz de escucha
+        port: Puerto
+        **options: prompt_rate, gen_rate, tokens, parallel, model, num_ctx
+
+    Returns:
+        FakeOllamaServer: Servidor en marcha (detener con shutdown())
+    """
+    server = FakeOllamaServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, name='fake-ollama', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--prompt-rate", type=float, default=800.0, help="Tokens de prompt evaluados por segundo")
+    parser.add_argument("--gen-rate", type=float, default=30.0, help="Tokens generados por segundo")
+    parser.add_argument("--tokens", type=int, default=120, help="Tokens por respuesta (tope de num_predict)")
+    parser.add_argument("--parallel", type=int, default=1, help="Generaciones simultáneas (OLLAMA_NUM_PARALLEL)")
+    parser.add_argument("--model", default="mistral")
+    args = parser.parse_args()
+
+    server = FakeOllamaServer((args.host, args.port), prompt_rate=args.prompt_rate, gen_rate=args.gen_rate,
+                              tokens=args.tokens, parallel=args.parallel, model=args.model)
+    print(f"Ollama simulado en {server.base_url}: prompt {args.prompt_rate:.0f} tok/s, "
+          f"generación {args.gen_rate:.0f} tok/s, {args.tokens} tokens, {args.parallel} en paralelo")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.stats()))
+
+
+if __name__ == "__main__":
+    main()
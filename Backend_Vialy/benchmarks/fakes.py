@@ -0,0 +1,129 @@
+"""
+Dobles deterministas del LLM, la cadena RAG y el modelo de embeddings para
+medir el backend sin Ollama ni modelos descargados.
+
+- FakeLLM: `invoke(prompt)` devuelve un texto derivado del hash del prompt
+  (misma entrada, misma salida), con una latencia fija opcional.
+- FakeQAChain: `invoke({"query"})` devuelve los chunks del corpus con más
+  palabras en común con la consulta, como `source_documents` de RetrievalQA.
+- HashEmbeddings: vectores por hashing de palabras (dimensión fija,
+  normalizados), suficientes para FAISS y el clasificador por centroides.
+- load_corpus: chunks de 1000 caracteres con solapamiento de 200 de las
+  páginas del PDF del Código, con los metadatos que deja PyPDFLoader +
+  split_documents ('source', 'page', 'start_index').
+"""
+
+import hashlib
+import os
+import time
+from functools import lru_cache
+from typing import Dict, List
+
+import numpy as np
+
+from app.core.reference_search import tokenize
+
+try:
+    from langchain_core.embeddings import Embeddings as _EmbeddingsBase
+except ImportError:
+    _EmbeddingsBase = object
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PDF_PATH = os.path.join(BASE_DIR, 'app', 'rag', 'data', 'codigo_transito.pdf')
+CORPUS_PATH = os.path.join(BASE_DIR, 'benchmarks', 'data', 'consultas.txt')
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+
+class FakeDocument:
+    """Documento con la forma de langchain_core.documents.Document"""
+
+    __slots__ = ('page_content', 'metadata')
+
+    def __init__(self, page_content: str, metadata: Dict):
+        self.page_content = page_content
+        self.metadata = metadata
+
+
+def load_queries(path: str = CORPUS_PATH) -> List[str]:
+    """Consultas del corpus de benchmarks (sin comentarios ni líneas vacías)"""
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+@lru_cache(maxsize=4)
+def load_corpus(pdf_path: str = PDF_PATH) -> List[FakeDocument]:
+    """Chunks del PDF con source, page (desde 0) y start_index"""
+    from app.rag.fine_extractor import read_pdf_pages
+
+    chunks = []
+    for page, text in enumerate(read_pdf_pages(pdf_path)):
+        for start in range(0, max(len(text) - CHUNK_OVERLAP, 1), CHUNK_SIZE - CHUNK_OVERLAP):
+            content = text[start:start + CHUNK_SIZE].strip()
+            if content:
+                chunks.append(FakeDocument(content, {'source': pdf_path, 'page': page, 'start_index': start}))
+    return chunks
+
+
+class FakeLLM:
+    """LLM determinista con la interfaz `invoke` de LangChain"""
+
+    model = 'fake-llm'
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency = latency_ms / 1000.0
+        self.calls = 0
+
+    def invoke(self, prompt: str, **kwargs) -> str:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        digest = hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:12]
+        return (f"Respuesta simulada {digest}. Según el Código Nacional de Tránsito (Ley 769 de 2002), "
+                f"la consulta se resuelve con el contexto recuperado ({len(prompt)} caracteres de prompt).")
+
+
+class FakeQAChain:
+    """RetrievalQA con recuperación por palabras en común sobre el corpus"""
+
+    def __init__(self, documents: List[FakeDocument], k: int = 3):
+        self.documents = documents
+        self.k = k
+        self._postings: Dict[str, List[int]] = {}
+        for doc_id, doc in enumerate(documents):
+            for term in set(tokenize(doc.page_content)):
+                self._postings.setdefault(term, []).append(doc_id)
+
+    def similarity_search(self, query: str, k: int = None) -> List[FakeDocument]:
+        scores: Dict[int, int] = {}
+        for term in set(tokenize(query)):
+            for doc_id in self._postings.get(term, ()):
+                scores[doc_id] = scores.get(doc_id, 0) + 1
+        ranked = sorted(scores, key=lambda doc_id: (-scores[doc_id], doc_id))[:k or self.k]
+        return [self.documents[doc_id] for doc_id in ranked]
+
+    def invoke(self, inputs: Dict) -> Dict:
+        return {"result": "", "source_documents": self.similarity_search(inputs["query"])}
+
+
+class HashEmbeddings(_EmbeddingsBase):
+    """Embeddings por hashing de palabras: deterministas y sin modelo"""
+
+    def __init__(self, dimensions: int = 256):
+        self.dimensions = dimensions
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for term in tokenize(text):
+            digest = hashlib.md5(term.encode('utf-8')).digest()
+            index = int.from_bytes(digest[:4], 'little') % self.dimensions
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
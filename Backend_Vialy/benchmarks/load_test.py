@@ -0,0 +1,361 @@
+"""
+Prueba de carga de extremo a extremo: la aplicación Flask servida por HTTP
+contra un Ollama simulado (benchmarks/fake_ollama.py), con tráfico mixto y
+concurrencia creciente.
+
+Tipos de operación (pesos con --mix):
+- faq: POST /ask con una de las preguntas frecuentes del corpus (se repiten,
+  así que la mayoría sale de la cache de respuestas)
+- unique: POST /ask con una pregunta que no se repite (recuperación, prompt
+  y generación en el LLM; los turnos de una misma sesión continúan el
+  contexto de Ollama)
+- history: GET /conversations o GET /messages/<id> de la última conversación
+- login: POST /login (bcrypt en el pool de PASSWORD_HASH_WORKERS)
+
+Cada nivel de --concurrency corre --duration segundos con un hilo por usuario
+virtual en lazo cerrado (la siguiente petición sale al recibir la respuesta).
+Por nivel se informa throughput, p50/p95/p99, tasa de errores y tokens del
+LLM, y se marca el codo de la curva: el primer nivel cuyo throughput queda
+a menos de --knee-threshold por ciento del máximo medido.
+
+Sin --target se levanta la aplicación en este proceso (werkzeug con hilos,
+BD SQLite temporal salvo que DATABASE_URL esté definida) apuntando al Ollama
+simulado. Si los servicios de LangChain no se inicializan (o con --rag fake)
+se usa la recuperación por palabras de benchmarks/fakes.py y un cliente HTTP
+de Ollama mínimo, de modo que la generación sigue pasando por /api/generate.
+Con --target se carga un servidor ya en marcha, que debe tener
+OLLAMA_BASE_URL apuntando al simulado (--ollama-port fija su puerto).
+
+Uso:
+    python benchmarks/load_test.py [--concurrency 1,2,4,8,16] [--duration 20] [--mix faq=40,unique=30,history=20,login=10]
+                                   [--gen-rate 30] [--prompt-rate 800] [--tokens 120] [--parallel 1] [--output carga.json]
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import requests
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+# BD y páginas temporales para la aplicación en este proceso (sin efecto con --target)
+_tmpdir = tempfile.mkdtemp(prefix="vialy_carga_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmpdir, 'carga.db')}")
+os.environ.setdefault("PAGE_STORE_PATH", os.path.join(_tmpdir, "pages"))
+
+from benchmarks.fake_ollama import start_fake_ollama  # noqa: E402
+from benchmarks.fakes import load_queries  # noqa: E402
+
+OPERATIONS = ('faq', 'unique', 'history', 'login')
+PASSWORD = "clave-de-carga"
+
+# Preguntas que se repiten (las primeras del corpus)
+FAQ_COUNT = 10
+# Variantes que vuelven única una pregunta sin cambiar su categoría
+VARIANTS = ("en Bogotá", "en Medellín", "en Cali", "para una moto", "para un taxi", "para un camión",
+            "si es la primera vez", "si soy reincidente", "en una vía nacional", "en zona escolar")
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"operación desconocida: {name} (válidas: {', '.join(OPERATIONS)})")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("todos los pesos son cero")
+    return mix
+
+
+class OllamaHTTPLLM:
+    """
+    Cliente mínimo de /api/generate con los atributos de OllamaLLM que lee
+    ResponseService (base_url, model y opciones de generación)
+    """
+
+    def __init__(self, base_url: str, model: str, num_predict: int = 512, num_ctx: int = 8192,
+                 temperature: float = 0.3):
+        self.base_url = base_url
+        self.model = model
+        self.num_predict = num_predict
+        self.num_ctx = num_ctx
+        self.temperature = temperature
+        self._http = threading.local()
+
+    def invoke(self, prompt: str, **kwargs) -> str:
+        # Con streaming, como langchain-ollama
+        session = getattr(self._http, 'session', None)
+        if session is None:
+            session = self._http.session = requests.Session()
+        options = {"num_predict": self.num_predict, "num_ctx": self.num_ctx, "temperature": self.temperature}
+        with session.post(f"{self.base_url}/api/generate", stream=True, timeout=120,
+                          json={"model": self.model, "prompt": prompt, "stream": True, "options": options}) as response:
+            response.raise_for_status()
+            return ''.join(json.loads(line).get('response', '') for line in response.iter_lines() if line)
+
+
+def start_app(ollama, rag_mode: str):
+    """
+    Levanta la aplicación en un hilo, con los servicios reales o los de prueba
+
+    Returns:
+        tuple: (servidor werkzeug, URL base, modo de servicios usado)
+    """
+    from werkzeug.serving import make_server
+
+    from app.routes import chat_routes
+    from main import create_app
+
+    mode = 'langchain'
+    if rag_mode == 'fake' or not chat_routes.services_initialized:
+        from app.services.classification_service import ClassificationService
+        from app.services.response_service import ResponseService
+        from benchmarks.fakes import FakeQAChain, load_corpus
+
+        qa_chain = FakeQAChain(load_corpus())
+        llm = OllamaHTTPLLM(ollama.base_url, ollama.model,
+                            num_predict=int(os.getenv('OLLAMA_NUM_PREDICT', '512')),
+                            num_ctx=int(os.getenv('OLLAMA_NUM_CTX', '8192')))
+        chat_routes.qa_chain = qa_chain
+        chat_routes.llm_model = llm
+        chat_routes.classification_service = ClassificationService(mode='keywords')
+        chat_routes.response_service = ResponseService(qa_chain, llm)
+        chat_routes.services_initialized = True
+        mode = 'fake'
+
+    server = make_server('127.0.0.1', 0, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, name='load-test-app', daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}", mode
+
+
+def register_users(base_url: str, count: int, prefix: str) -> List[Dict]:
+    """Registra los usuarios virtuales y obtiene su token"""
+    users = []
+    http = requests.Session()
+    for i in range(count):
+        email = f"{prefix}{i}@carga.vialy.co"
+        response = http.post(f"{base_url}/register", timeout=60, json={
+            "first_name": "Carga", "last_name": str(i), "email": email, "password": PASSWORD})
+        if response.status_code not in (201, 400):
+            raise RuntimeError(f"/register respondió {response.status_code}: {response.text[:200]}")
+        response = http.post(f"{base_url}/login", json={"email": email, "password": PASSWORD}, timeout=60)
+        response.raise_for_status()
+        users.append({"email": email, "token": response.json()['access_token']})
+    return users
+
+
+class VirtualUser:
+    """Un usuario en lazo cerrado: elige una operación por peso y la ejecuta"""
+
+    def __init__(self, base_url: str, user: Dict, mix: Dict[str, float], queries: List[str], seed: int):
+        self.base_url = base_url
+        self.user = user
+        self.queries = queries
+        self.random = random.Random(seed)
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.http = requests.Session()
+        self.session_id = str(uuid.uuid4())
+        self.conversation_id: Optional[int] = None
+        self.sequence = 0
+
+    def _headers(self) -> Dict:
+        return {"Authorization": f"Bearer {self.user['token']}", "X-Session-ID": self.session_id}
+
+    def _ask(self, query: str) -> requests.Response:
+        response = self.http.post(f"{self.base_url}/ask", json={"query": query}, headers=self._headers(), timeout=300)
+        if response.status_code == 200:
+            self.conversation_id = response.json().get('conversation_id') or self.conversation_id
+        return response
+
+    def faq(self) -> requests.Response:
+        return self._ask(self.queries[self.random.randrange(min(FAQ_COUNT, len(self.queries)))])
+
+    def unique(self) -> requests.Response:
+        self.sequence += 1
+        query = self.random.choice(self.queries)
+        return self._ask(f"{query.rstrip('?¿')} {self.random.choice(VARIANTS)} (caso {self.session_id[:8]}-{self.sequence})?")
+
+    def history(self) -> requests.Response:
+        if self.conversation_id and self.random.random() < 0.5:
+            return self.http.get(f"{self.base_url}/messages/{self.conversation_id}", params={"limit": 20},
+                                 headers=self._headers(), timeout=60)
+        return self.http.get(f"{self.base_url}/conversations", params={"limit": 20}, headers=self._headers(), timeout=60)
+
+    def login(self) -> requests.Response:
+        response = self.http.post(f"{self.base_url}/login", json={"email": self.user['email'], "password": PASSWORD},
+                                  timeout=60)
+        if response.status_code == 200:
+            self.user['token'] = response.json()['access_token']
+        return response
+
+    def run(self, stop: threading.Event, samples: List):
+        while not stop.is_set():
+            name = self.random.choices(self.names, self.weights)[0]
+            start = time.perf_counter()
+            try:
+                ok = getattr(self, name)().status_code < 400
+            except requests.RequestException:
+                ok = False
+            # list.append es atómico: no hace falta lock
+            samples.append((name, time.perf_counter() - start, ok))
+
+
+def summarize(samples: List, elapsed: float) -> Dict:
+    """Throughput, percentiles (ms) y errores de un conjunto de muestras"""
+    latencies = [s[1] * 1000 for s in samples]
+    errors = sum(1 for s in samples if not s[2])
+    return {
+        "requests": len(samples),
+        "rps": len(samples) / elapsed if elapsed else 0.0,
+        "p50_ms": statistics.median(latencies) if latencies else 0.0,
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "error_rate": errors / len(samples) if samples else 0.0,
+    }
+
+
+def run_level(base_url: str, users: List[Dict], concurrency: int, args, queries: List[str], ollama) -> Dict:
+    """Un nivel de concurrencia: --warmup segundos sin medir y --duration medidos"""
+    workers = [VirtualUser(base_url, users[i], args.mix, queries, seed=args.seed * 1000 + concurrency * 100 + i)
+               for i in range(concurrency)]
+    samples = []
+    stop = threading.Event()
+    threads = [threading.Thread(target=worker.run, args=(stop, samples), daemon=True) for worker in workers]
+    for t in threads:
+        t.start()
+    time.sleep(args.warmup)
+
+    # Solo cuentan las peticiones que terminan dentro de la ventana medida
+    before = ollama.stats()
+    measured_from = len(samples)
+    began = time.perf_counter()
+    time.sleep(args.duration)
+    measured = samples[measured_from:]
+    elapsed = time.perf_counter() - began
+    after = ollama.stats()
+    stop.set()
+    for t in threads:
+        t.join(timeout=330)
+
+    result = summarize(measured, elapsed)
+    result["concurrency"] = concurrency
+    result["operations"] = {
+        name: summarize([s for s in measured if s[0] == name], elapsed) for name in OPERATIONS if name in args.mix
+    }
+    result["llm"] = {key: after[key] - before[key] for key in after}
+    return result
+
+
+def find_knee(levels: List[Dict], threshold: float) -> Optional[int]:
+    """
+    Codo de la curva: la menor concurrencia cuyo throughput está a menos de
+    threshold % del máximo medido (más usuarios solo agregan cola y latencia)
+    """
+    if len(levels) < 2:
+        return None
+    best = max(level["rps"] for level in levels)
+    knee = next(level["concurrency"] for level in levels if level["rps"] >= best * (1 - threshold / 100))
+    return None if knee == levels[-1]["concurrency"] else knee
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,2,4,8,16", help="Niveles separados por comas")
+    parser.add_argument("--duration", type=float, default=20, help="Segundos medidos por nivel")
+    parser.add_argument("--warmup", type=float, default=3, help="Segundos sin medir al inicio de cada nivel")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("faq=40,unique=30,history=20,login=10"))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--target", help="URL de un servidor ya en marcha (por defecto se levanta en este proceso)")
+    parser.add_argument("--rag", choices=("auto", "fake"), default="auto",
+                        help="auto: servicios reales si se inicializan; fake: siempre los de prueba")
+    parser.add_argument("--ollama-port", type=int, default=0, help="Puerto del Ollama simulado (0: uno libre)")
+    parser.add_argument("--prompt-rate", type=float, default=800.0, help="Tokens de prompt por segundo")
+    parser.add_argument("--gen-rate", type=float, default=30.0, help="Tokens generados por segundo")
+    parser.add_argument("--tokens", type=int, default=120, help="Tokens por respuesta")
+    parser.add_argument("--parallel", type=int, default=1, help="Generaciones simultáneas del Ollama simulado")
+    parser.add_argument("--knee-threshold", type=float, default=10.0,
+                        help="Distancia (%%) al throughput máximo desde la que un nivel se considera el codo")
+    parser.add_argument("--output", help="Archivo JSON con los resultados")
+    args = parser.parse_args()
+    levels = sorted({int(level) for level in args.concurrency.split(',') if level.strip()})
+
+    ollama = start_fake_ollama(port=args.ollama_port, prompt_rate=args.prompt_rate, gen_rate=args.gen_rate,
+                               tokens=args.tokens, parallel=args.parallel)
+    mode = 'externo'
+    if args.target:
+        base_url = args.target.rstrip('/')
+        print(f"Ollama simulado en {ollama.base_url} (el servidor debe usar OLLAMA_BASE_URL={ollama.base_url})")
+    else:
+        # Antes de importar la aplicación: create_chain lee OLLAMA_BASE_URL al inicializar los servicios
+        os.environ["OLLAMA_BASE_URL"] = ollama.base_url
+        import logging
+        logging.disable(logging.CRITICAL)
+        _, base_url, mode = start_app(ollama, args.rag)
+
+    queries = load_queries()
+    users = register_users(base_url, max(levels), prefix=f"u{uuid.uuid4().hex[:6]}-")
+    mix = ', '.join(f"{name}={weight:g}" for name, weight in args.mix.items())
+    print(f"{base_url} (servicios: {mode}), mezcla {mix}; Ollama: prompt {args.prompt_rate:.0f} tok/s, "
+          f"generación {args.gen_rate:.0f} tok/s, {args.tokens} tokens, {args.parallel} en paralelo")
+    print(f"{'conc':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errores':>8} {'LLM/s':>7}   "
+          + '  '.join(f"{name + ' p95':>12}" for name in args.mix))
+
+    results = []
+    for concurrency in levels:
+        level = run_level(base_url, users, concurrency, args, queries, ollama)
+        results.append(level)
+        llm_rate = level["llm"]["requests"] / args.duration
+        per_op = '  '.join(f"{level['operations'][name]['p95_ms']:>12.0f}" for name in args.mix)
+        print(f"{concurrency:>5} {level['rps']:>8.1f} {level['p50_ms']:>9.0f} {level['p95_ms']:>9.0f} "
+              f"{level['p99_ms']:>9.0f} {level['error_rate']:>7.1%} {llm_rate:>7.1f}   {per_op}")
+
+    knee = find_knee(results, args.knee_threshold)
+    if knee is None:
+        print("Sin codo: el throughput sigue creciendo en el último nivel (probar más concurrencia)")
+    else:
+        print(f"Codo en concurrencia {knee}: por encima el throughput crece menos de "
+              f"{args.knee_threshold:.0f}% y solo aumenta la latencia")
+
+    if args.output:
+        from benchmarks.run_suite import git_commit
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                "meta": {
+                    **git_commit(),
+                    "fecha": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                    "servicios": mode,
+                    "mezcla": args.mix,
+                    "duracion": args.duration,
+                    "ollama": {"prompt_rate": args.prompt_rate, "gen_rate": args.gen_rate,
+                               "tokens": args.tokens, "parallel": args.parallel},
+                },
+                "niveles": results,
+                "codo": knee,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"Resultados en {args.output}")
+    ollama.shutdown()
+
+
+if __name__ == "__main__":
+    main()
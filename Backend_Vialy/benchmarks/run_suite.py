@@ -0,0 +1,316 @@
+"""
+Suite de microbenchmarks de los caminos calientes del backend.
+
+Casos (filtrables con --filter):
+- classification.analyze_query[keywords|centroid]: ClassificationService
+- prompts.<módulo>: get_response_prompt de prompts, prompts_mejorado y prompts_rapidos
+- response_service.clean_rag_content: ResponseService._clean_rag_content
+- rag_system.retrieve: RAGSystem.retrieve sobre FAISS con los chunks del PDF
+  (se omite si langchain_community/faiss no están instalados)
+- session.record_turn / session.get_history[cache|db]: SessionManager en SQLite
+- ask[miss|cache_hit]: POST /ask completo con el LLM falso de benchmarks/fakes.py
+
+Cada caso se calibra (iteraciones hasta superar --min-time) y se mide en
+--rounds rondas; el resultado por operación (segundos) se guarda en JSON junto
+con el commit, para comparar dos ejecuciones con benchmarks/compare.py.
+
+Uso:
+    python benchmarks/run_suite.py [--rounds 15] [--min-time 0.05] [--filter session] [--output results.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+_tmpdir = tempfile.mkdtemp(prefix="vialy_bench_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+# Sin Ollama real: la verificación de conexión de create_chain falla de inmediato
+os.environ.setdefault("OLLAMA_BASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+os.environ.setdefault("PAGE_STORE_PATH", os.path.join(_tmpdir, "pages"))
+
+import logging  # noqa: E402
+logging.disable(logging.CRITICAL)
+
+from benchmarks.fakes import FakeLLM, FakeQAChain, HashEmbeddings, load_corpus, load_queries  # noqa: E402
+
+CATEGORIES = ('MULTA', 'REQUISITO', 'NORMATIVA', 'PROCEDIMIENTO', 'GENERAL')
+
+CASES = []
+
+
+class SkipBenchmark(Exception):
+    """El caso no se puede medir en este entorno (dependencia opcional ausente)"""
+
+
+def case(name: str, ops: int = 1):
+    """Registra la preparación de un caso: devuelve la función a medir (sin argumentos)"""
+    def register(setup):
+        CASES.append((name, ops, setup))
+        return setup
+    return register
+
+
+QUERIES = load_queries()
+HISTORY = "Usuario: ¿Cuánto es la multa por no tener SOAT?\nAsistente: Es una multa tipo D (30 SMLDV)."
+
+
+def _rag_context() -> str:
+    return "\n\n".join(f"- {doc.page_content}" for doc in load_corpus()[40:43])
+
+
+@case('classification.analyze_query[keywords]', ops=len(QUERIES))
+def bench_classification_keywords():
+    from app.services.classification_service import ClassificationService
+    service = ClassificationService(mode='keywords')
+    return lambda: [service.analyze_query(query) for query in QUERIES]
+
+
+@case('classification.analyze_query[centroid]', ops=len(QUERIES))
+def bench_classification_centroid():
+    from app.services.classification_service import ClassificationService
+    service = ClassificationService(embeddings=HashEmbeddings(), mode='centroid')
+    if service.mode != 'centroid':
+        raise SkipBenchmark("clasificador por centroides no disponible")
+    return lambda: [service.analyze_query(query) for query in QUERIES]
+
+
+def _prompt_case(module_name: str):
+    import importlib
+    templates = importlib.import_module(f'app.core.{module_name}').PromptTemplates
+    context = _rag_context()
+    queries = QUERIES[:20]
+    if module_name == 'prompts':
+        def build(category, query):
+            return templates.get_response_prompt(category=category, query=query, context=context, history=HISTORY)
+    else:
+        def build(category, query):
+            return templates.get_response_prompt(category=category, query=query, rag_context=context,
+                                                 history=HISTORY, conversation_context="📌 Tema Principal: MULTA")
+    return lambda: [build(category, query) for category in CATEGORIES for query in queries]
+
+
+for _module in ('prompts', 'prompts_mejorado', 'prompts_rapidos'):
+    case(f'prompts.{_module}', ops=len(CATEGORIES) * 20)(lambda module=_module: _prompt_case(module))
+
+
+@case('response_service.clean_rag_content', ops=100)
+def bench_clean_rag_content():
+    from app.services.response_service import ResponseService
+    service = ResponseService(FakeQAChain(load_corpus()), FakeLLM())
+    chunks = [doc.page_content for doc in load_corpus()[:100]]
+    return lambda: [service._clean_rag_content(chunk) for chunk in chunks]
+
+
+@case('rag_system.retrieve', ops=20)
+def bench_rag_retrieve():
+    try:
+        from app.rag.rag_system import RAGSystem
+        from langchain_community.vectorstores import FAISS
+    except ImportError as e:
+        raise SkipBenchmark(str(e))
+    # Sin __init__: el índice se arma con el corpus de prueba y embeddings sin modelo
+    rag = RAGSystem.__new__(RAGSystem)
+    rag.embeddings = HashEmbeddings()
+    documents = load_corpus()
+    rag.vectorstore = FAISS.from_texts([doc.page_content for doc in documents], rag.embeddings,
+                                       metadatas=[doc.metadata for doc in documents])
+    queries = QUERIES[:20]
+    return lambda: [rag.retrieve(query, k=3) for query in queries]
+
+
+def _bench_user() -> int:
+    """Usuario de prueba en la BD temporal (creado una vez)"""
+    from app.config.database import SessionLocal, init_db
+    from app.models.models import Usuario
+    init_db()
+    db = SessionLocal()
+    try:
+        user = db.query(Usuario).filter_by(email='bench@vialy.co').first()
+        if user is None:
+            user = Usuario(first_name="Bench", last_name="User", email='bench@vialy.co', password_hash="x")
+            db.add(user)
+            db.commit()
+        return user.id
+    finally:
+        SessionLocal.remove()
+
+
+@case('session.record_turn')
+def bench_record_turn():
+    from app.config.database import SessionLocal
+    from app.core.session_manager import SessionManager
+    user_id = _bench_user()
+    manager = SessionManager(db=SessionLocal())
+    queries = iter(QUERIES * 100000)
+    return lambda: manager.record_turn(usuario_id=user_id, session_id='bench-write', user_message=next(queries),
+                                       assistant_message="Respuesta de prueba sobre multas.", category='MULTA')
+
+
+def _history_session():
+    from app.config.database import SessionLocal
+    from app.core.session_manager import SessionManager
+    user_id = _bench_user()
+    manager = SessionManager(db=SessionLocal())
+    for query in QUERIES[:10]:
+        manager.record_turn(usuario_id=user_id, session_id='bench-read', user_message=query,
+                            assistant_message="Respuesta de prueba.", category='GENERAL')
+    return manager
+
+
+@case('session.get_history[cache]')
+def bench_history_cached():
+    manager = _history_session()
+    return lambda: manager.get_history('bench-read', max_messages=3)
+
+
+@case('session.get_history[db]')
+def bench_history_db():
+    manager = _history_session()
+
+    def read():
+        # Sin el estado en memoria: la lectura va a la BD
+        manager.state_cache.discard('bench-read')
+        return manager.get_history('bench-read', max_messages=3)
+    return read
+
+
+def _ask_client():
+    from app.routes import chat_routes
+    from app.services.classification_service import ClassificationService
+    from app.services.response_service import ResponseService
+    from main import create_app
+
+    qa_chain = FakeQAChain(load_corpus())
+    llm = FakeLLM()
+    chat_routes.qa_chain = qa_chain
+    chat_routes.llm_model = llm
+    chat_routes.classification_service = ClassificationService(mode='keywords')
+    chat_routes.response_service = ResponseService(qa_chain, llm)
+    chat_routes.services_initialized = True
+    client = create_app().test_client()
+    headers = {"X-User-ID": str(_bench_user()), "X-Session-ID": "bench-ask"}
+    return client, headers, chat_routes.response_cache
+
+
+@case('ask[miss]')
+def bench_ask_miss():
+    client, headers, response_cache = _ask_client()
+    queries = iter(QUERIES * 100000)
+
+    def ask():
+        response_cache.clear()
+        response = client.post('/ask', json={"query": next(queries)}, headers=headers)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    return ask
+
+
+@case('ask[cache_hit]')
+def bench_ask_cache_hit():
+    client, headers, _ = _ask_client()
+    client.post('/ask', json={"query": QUERIES[0]}, headers=headers)
+
+    def ask():
+        response = client.post('/ask', json={"query": QUERIES[0]}, headers=headers)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    return ask
+
+
+def _run(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return time.perf_counter() - start
+
+
+def measure(fn, ops: int, rounds: int, min_time: float) -> dict:
+    """
+    Calibra las iteraciones por ronda y mide
+
+    Returns:
+        dict: Estadísticas en segundos por operación
+    """
+    fn()  # calentamiento (caches, imports perezosos, primera consulta)
+    iterations = 1
+    while _run(fn, iterations) < min_time and iterations < 1_000_000:
+        iterations *= 2
+    samples = [_run(fn, iterations) / (iterations * ops) for _ in range(rounds)]
+    median = statistics.median(samples)
+    return {
+        "min": min(samples),
+        "median": median,
+        "mean": statistics.fmean(samples),
+        "stddev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "max": max(samples),
+        "ops_per_sec": 1.0 / median if median else None,
+        "rounds": rounds,
+        "iterations": iterations,
+        "ops_per_iteration": ops,
+    }
+
+
+def git_commit() -> dict:
+    """Commit actual y si hay cambios sin confirmar"""
+    def git(*args):
+        return subprocess.run(['git', *args], cwd=BASE_DIR, capture_output=True, text=True, timeout=30).stdout.strip()
+    try:
+        return {"commit": git('rev-parse', '--short', 'HEAD') or None,
+                "dirty": bool(git('status', '--porcelain', '--untracked-files=no'))}
+    except (OSError, subprocess.SubprocessError):
+        return {"commit": None, "dirty": None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=15)
+    parser.add_argument("--min-time", type=float, default=0.05, help="Segundos mínimos por ronda")
+    parser.add_argument("--filter", default="", help="Solo los casos cuyo nombre contiene este texto")
+    parser.add_argument("--output", help="Archivo JSON (por defecto benchmarks/results/<commit>.json)")
+    args = parser.parse_args()
+
+    git = git_commit()
+    results = {}
+    print(f"{'caso':<42} {'mediana µs':>12} {'mín µs':>10} {'op/s':>12}")
+    for name, ops, setup in CASES:
+        if args.filter not in name:
+            continue
+        try:
+            fn = setup()
+            stats = measure(fn, ops, args.rounds, args.min_time)
+        except SkipBenchmark as e:
+            results[name] = {"skipped": str(e)}
+            print(f"{name:<42} {'omitido: ' + str(e)[:60]}")
+            continue
+        results[name] = stats
+        print(f"{name:<42} {stats['median'] * 1e6:>12.2f} {stats['min'] * 1e6:>10.2f} {stats['ops_per_sec']:>12.0f}")
+
+    output = args.output or os.path.join(BASE_DIR, 'benchmarks', 'results',
+                                         f"{git['commit'] or 'sin-commit'}{'-dirty' if git['dirty'] else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            "meta": {
+                **git,
+                "fecha": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                "python": platform.python_version(),
+                "plataforma": platform.platform(),
+                "rounds": args.rounds,
+                "min_time": args.min_time,
+            },
+            "benchmarks": results,
+        }, f, ensure_ascii=False, indent=2, sort_keys=True)
+    print(f"Resultados en {output}")
+
+
+if __name__ == "__main__":
+    main()
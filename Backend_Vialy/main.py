@@ -5,12 +5,17 @@ from flask_cors import CORS
 from dotenv import load_dotenv
 from flask_jwt_extended import JWTManager
 from app.config.settings import Config
-from app.config.database import init_db, close_db, get_db
+from app.config.database import init_db, init_request_db, pool_monitor
 from app.routes.chat_routes import chat_bp
 from app.routes.health_routes import health_bp
 from app.routes.pdf_routes import pdf_bp
 from app.routes.bd_routes import bd_routes
-from app.core.session_manager import SessionManager
+from app.routes.reference_routes import reference_bp
+from app.core.session_manager import session_expiry_job
+from app.core.message_store import message_writer
+from app.core.document_catalog import document_catalog
+from app.core.page_store import page_store
+from app.services.password_service import password_service
 
 # Cargar variables de entorno
 load_dotenv()
@@ -32,7 +37,9 @@ def create_app(config_class=Config):
         r"/*": {
             "origins": "*",
             "methods": ["GET", "POST", "OPTIONS"],
-            "allow_headers": ["Content-Type", "X-Session-ID"],
+            "allow_headers": ["Content-Type", "X-Session-ID", "Authorization", "X-User-ID"],
+            # Paginación de respuestas NDJSON
+            "expose_headers": ["X-Has-More", "X-Before-Cursor", "X-After-Cursor"],
             "supports_credentials": True
         }
     })
@@ -47,23 +54,27 @@ def create_app(config_class=Config):
         logger.info("[INIT] Inicializando base de datos...")
         init_db()
         logger.info("[INIT] ✅ Base de datos lista")
-        # Crear sesión de DB para SessionManager
-        db_session = get_db()
-        global session_manager
-        session_manager = SessionManager(db=db_session)
-        logger.info("✅ SessionManager inicializado con DB")
+        # Escritura diferida de mensajes (solo si MESSAGE_WRITE_BEHIND=true)
+        message_writer.start()
+        # Finaliza periódicamente las conversaciones inactivas
+        session_expiry_job.start()
+        # Registro de conexiones retenidas (solo si DB_LEAK_DETECTION_SECONDS > 0)
+        pool_monitor.start()
+        # Procesos de bcrypt para registro y login
+        password_service.start()
+        # Catálogo de PDFs en memoria; el almacén de páginas extrae el texto de los nuevos
+        document_catalog.subscribe(page_store.on_document_event)
+        document_catalog.start()
 
-    # Registrar cleanup al shutdown
-    @app.teardown_appcontext
-    def cleanup(error=None):
-        close_db()
-        logger.info("[SHUTDOWN] Base de datos cerrada")
+    # Sesión de BD por request: se abre en el primer uso y se cierra en el teardown
+    init_request_db(app)
 
     # Registrar blueprints
     app.register_blueprint(chat_bp)
     app.register_blueprint(health_bp)
     app.register_blueprint(pdf_bp)
     app.register_blueprint(bd_routes)
+    app.register_blueprint(reference_bp)
 
     logger.info("✅ Aplicación Flask inicializada correctamente")
     return app
@@ -0,0 +1,120 @@
+"""
+Verificación del enrutamiento a la réplica de lectura.
+
+Usa dos archivos SQLite (primaria y réplica) y una "replicación" manual
+(copia de la primaria en un instante dado) para comprobar que:
+
+1. Tras una escritura, las lecturas del mismo usuario van a la primaria
+   (read-your-writes durante READ_STICKINESS_SECONDS).
+2. Pasada esa ventana, los endpoints de solo lectura leen de la réplica.
+3. Si la réplica falla, el request se repite contra la primaria y la
+   réplica queda fuera de uso durante READ_REPLICA_COOLDOWN_SECONDS.
+
+    python scripts/check_read_replica.py
+
+Para probar con contenedores, define DATABASE_URL y DATABASE_READ_URL
+apuntando a una primaria y una réplica reales (bases de datos DESECHABLES);
+en ese caso se omite la copia manual y el paso 2 espera el retraso real.
+"""
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+USE_SQLITE = not os.getenv("DATABASE_URL")
+if USE_SQLITE:
+    _tmpdir = tempfile.mkdtemp(prefix="vialy_replica_")
+    PRIMARY_PATH = os.path.join(_tmpdir, "primary.db")
+    REPLICA_PATH = os.path.join(_tmpdir, "replica.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{PRIMARY_PATH}"
+    os.environ["DATABASE_READ_URL"] = f"sqlite:///{REPLICA_PATH}"
+os.environ.setdefault("READ_STICKINESS_SECONDS", "1")
+os.environ.setdefault("READ_REPLICA_COOLDOWN_SECONDS", "30")
+
+import logging  # noqa: E402
+logging.disable(logging.CRITICAL)
+
+from app.config.database import get_pool_stats, read_engine  # noqa: E402
+from main import create_app  # noqa: E402
+
+STICKINESS = float(os.environ["READ_STICKINESS_SECONDS"])
+
+
+def replicate():
+    """Copia la primaria sobre la réplica (solo SQLite)"""
+    if not USE_SQLITE:
+        return
+    read_engine.dispose()
+    src = sqlite3.connect(PRIMARY_PATH)
+    dst = sqlite3.connect(REPLICA_PATH)
+    src.backup(dst)
+    src.close()
+    dst.close()
+
+
+def break_replica():
+    """Deja la réplica sin tablas: sus consultas fallan con OperationalError"""
+    read_engine.dispose()
+    if USE_SQLITE:
+        os.remove(REPLICA_PATH)
+    else:
+        raise SystemExit("Detén el contenedor de la réplica y vuelve a ejecutar solo el paso 3")
+
+
+def main() -> int:
+    if read_engine is None:
+        print("❌ DATABASE_READ_URL no está configurada")
+        return 1
+
+    app = create_app()
+    client = app.test_client()
+    email = f"replica{int(time.time())}@vialy.co"
+    client.post('/register', json={"first_name": "Réplica", "last_name": "Prueba", "email": email,
+                                   "password": "clave-segura"})
+    token = client.post('/login', json={"email": email, "password": "clave-segura"}).json['access_token']
+    headers = {"Authorization": f"Bearer {token}"}
+    replicate()
+
+    def session_ids():
+        response = client.get('/conversations', headers=headers)
+        return response.status_code, {c['session_id'] for c in response.json}
+
+    failures = 0
+
+    def check(name: str, ok: bool):
+        nonlocal failures
+        failures += 0 if ok else 1
+        print(f"{'✅' if ok else '❌'} {name}")
+
+    client.post('/conversations', json={"session_id": "replica-check"}, headers=headers)
+    status, ids = session_ids()
+    check("read-your-writes: la conversación recién creada se lee desde la primaria",
+          status == 200 and "replica-check" in ids)
+
+    time.sleep(STICKINESS + 0.2)
+    status, ids = session_ids()
+    if USE_SQLITE:
+        # La réplica es la copia anterior a la escritura: no ve la conversación
+        check("fuera de la ventana, la lectura va a la réplica", status == 200 and "replica-check" not in ids)
+    else:
+        check("fuera de la ventana, la lectura va a la réplica", status == 200)
+
+    break_replica()
+    status, ids = session_ids()
+    check("con la réplica caída, el request se repite en la primaria", status == 200 and "replica-check" in ids)
+    check("la réplica queda fuera de uso durante el cooldown", get_pool_stats()["replica"]["available"] is False)
+
+    print(f"\n{failures} verificación(es) fallida(s)" if failures else "\nEnrutamiento a la réplica correcto")
+    if USE_SQLITE:
+        shutil.rmtree(_tmpdir, ignore_errors=True)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())